@@ -0,0 +1,83 @@
+from heapq import heappush, heapreplace
+
+BUDGET = 'Бюджетная основа'
+
+
+def _get_rank_key(app_item, position):
+    '''
+        Rank of an application within its program quota, higher is better: admitted without exams first,
+        then by SumScore (fractional scores included), ties going to the applicant earlier in Code order.
+    '''
+    return bool(app_item.NoExams), app_item.SumScore, -position
+
+
+def _allocate(preferences, capacities):
+    '''
+        Applicant-proposing deferred acceptance. preferences[a] lists (seat group, rank key) in priority order.
+        Returns a min-heap of the admitted rank keys per seat group.
+    '''
+    admitted = [[] for _ in capacities]
+    next_choice = [0] * len(preferences)
+    free = list(range(len(preferences) - 1, -1, -1))
+    while free:
+        applicant = free.pop()
+        choices = preferences[applicant]
+        while next_choice[applicant] < len(choices):
+            group, key = choices[next_choice[applicant]]
+            next_choice[applicant] += 1
+            heap = admitted[group]
+            if len(heap) < capacities[group]:
+                heappush(heap, key)
+                break
+            if heap and key > heap[0]:
+                rejected = heapreplace(heap, key)
+                free.append(-rejected[2])
+                break
+    return admitted
+
+
+def simulate_admission(data, quotas, campaign_types):
+    '''
+        Projects the budget admission from the Application records of a dump: every applicant goes down their SelectedPriority list
+        until a program quota with `<Quota>Count` seats holds them. Campaign types are allocated independently.
+        Returns the projected passing scores {program: {quota: score}} (the lowest admitted SumScore,
+        0 when nobody or only applicants without exams got in) and placements {campaign type: {Code: (program, quota)}}
+        of the applicants who got a seat.
+    '''
+    campaigns = dict()
+    for human in sorted(data):
+        by_campaign = dict()
+        for app_item in data[human].values():
+            if app_item.FinancingSource != BUDGET:
+                continue
+            by_campaign.setdefault(campaign_types[app_item.AdmissionCampaignType], []).append(app_item)
+        for campaign, app_items in by_campaign.items():
+            groups, capacities, humans, preferences = campaigns.setdefault(campaign, (dict(), [], [], []))
+            position = len(humans)
+            choices = []
+            for app_item in sorted(app_items, key=lambda item: item.SelectedPriority):
+                quota = quotas[app_item.Category]
+                key = (app_item.TrainingDirection, quota)
+                if key not in groups:
+                    groups[key] = len(capacities)
+                    capacities.append(getattr(app_item, quota + 'Count'))
+                choices.append((groups[key], _get_rank_key(app_item, position)))
+            humans.append(human)
+            preferences.append(choices)
+
+    passing_scores = dict()
+    placements = dict()
+    for campaign, (groups, capacities, humans, preferences) in campaigns.items():
+        admitted = _allocate(preferences, capacities)
+        placed = placements[campaign] = dict()
+        for (program, quota), group in groups.items():
+            scores = passing_scores.setdefault(program, {k: 0 for k in quotas.values()})
+            heap = admitted[group]
+            if heap and not heap[0][0]:
+                scores[quota] = heap[0][1]
+            for key in heap:
+                placed[humans[-key[2]]] = (program, quota)
+    return {
+        'passing_scores': passing_scores,
+        'placements': placements,
+    }
@@ -0,0 +1,139 @@
+from heapq import heapify, heappush, heapreplace, nlargest
+
+
+class Accumulator:
+    '''
+        Single metric fed record by record by AggregationEngine.
+        add_applicant is called once per applicant before its applications are passed to add.
+        remove_applicant and discard undo them, which lets the engine apply dump deltas.
+        refresh is called with the new data after a delta, for state that discard could not undo exactly.
+    '''
+
+    def add_applicant(self, human, human_item):
+        pass
+
+    def add(self, human, app_item):
+        pass
+
+    def remove_applicant(self, human, human_item):
+        pass
+
+    def discard(self, human, app_item):
+        pass
+
+    def refresh(self, data):
+        pass
+
+    def result(self):
+        raise NotImplementedError
+
+
+def increment(counter, key, value=1):
+    counter[key] = counter.get(key, 0) + value
+
+
+def decrement(counter, key, value=1):
+    counter[key] -= value
+    if counter[key] == 0:
+        del counter[key]
+
+
+class TopK:
+    '''
+        The `capacity` highest values of a group in a min-heap, with the lowest value and the size of the group.
+        Memory is bounded by capacity. Discarding a value that may have been pushed out of the heap
+        makes it stale, the owner then rebuilds it from the data.
+    '''
+    __slots__ = ('capacity', 'heap', 'count', 'lowest', 'stale')
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.heap = []
+        self.count = 0
+        self.lowest = None
+        self.stale = False
+
+    def add(self, value):
+        self.count += 1
+        if self.lowest is None or value < self.lowest:
+            self.lowest = value
+        if len(self.heap) < self.capacity:
+            heappush(self.heap, value)
+        elif self.heap and value > self.heap[0]:
+            heapreplace(self.heap, value)
+
+    def discard(self, value):
+        self.count -= 1
+        if self.stale:
+            return
+        if self.count + 1 == len(self.heap):
+            # The whole group fits into the heap, so removal is exact
+            self.heap.remove(value)
+            heapify(self.heap)
+            self.lowest = min(self.heap) if self.heap else None
+        elif (self.heap and value >= self.heap[0]) or value <= self.lowest:
+            self.stale = True
+
+    def resize(self, capacity):
+        if capacity < self.capacity:
+            self.heap = nlargest(capacity, self.heap)
+            heapify(self.heap)
+        elif capacity > self.capacity and self.count > len(self.heap):
+            self.stale = True
+        self.capacity = capacity
+
+    def get_kth_highest(self, k):
+        '''
+            k-th highest value, the lowest one when the group is smaller than k or k <= 0.
+        '''
+        if k <= 0 or not self.heap:
+            return self.lowest
+        return nlargest(min(k, len(self.heap)), self.heap)[-1]
+
+
+class AggregationEngine:
+
+    def __init__(self):
+        self.accumulators = dict()
+
+    def register(self, name, accumulator: Accumulator):
+        self.accumulators[name] = accumulator
+        return accumulator
+
+    def _get_hooks(self, name):
+        return [getattr(acc, name) for acc in self.accumulators.values()
+                if getattr(type(acc), name) is not getattr(Accumulator, name)]
+
+    def run(self, data):
+        applicant_hooks = self._get_hooks('add_applicant')
+        application_hooks = self._get_hooks('add')
+        for human, human_item in data.items():
+            for hook in applicant_hooks:
+                hook(human, human_item)
+            for app_item in human_item.values():
+                for hook in application_hooks:
+                    hook(human, app_item)
+        return self.results()
+
+    def apply(self, delta, prev_data, data):
+        '''
+            Moves the accumulators from prev_data to data by re-feeding only the applicants touched by delta.
+        '''
+        add_hooks = (self._get_hooks('add_applicant'), self._get_hooks('add'))
+        remove_hooks = (self._get_hooks('remove_applicant'), self._get_hooks('discard'))
+        for human in delta.applicants:
+            for human_data, (applicant_hooks, application_hooks) in ((prev_data, remove_hooks), (data, add_hooks)):
+                human_item = human_data.get(human)
+                if not human_item:
+                    continue
+                for hook in applicant_hooks:
+                    hook(human, human_item)
+                for app_item in human_item.values():
+                    for hook in application_hooks:
+                        hook(human, app_item)
+        for hook in self._get_hooks('refresh'):
+            hook(data)
+        return self.results()
+
+    def results(self):
+        return {name: acc.result() for name, acc in self.accumulators.items()}
@@ -1,24 +1,32 @@
-import re
 import os
 import json
-from typing import List
+import asyncio
+import tempfile
+from copy import deepcopy
 
 import aiofiles
 from pathlib import Path
-from datetime import datetime
-from Levenshtein import distance
+from datetime import date, datetime
+from app.admission import simulate_admission
+from app.aggregation import Accumulator, AggregationEngine, TopK, increment, decrement
+from app.delta import diff_dumps
+from app.history import read_json_dump_meta
+from app.metrics import STAGE_SECONDS
+from app.records import loads_dump, project_dump
+from app.regions import RegionMatcher
+from app import vectorized
 from app.utils import (
-    get_utc_date,
     convert_utc_to_local,
-    get_latest_dump_date,
-    strptime_to_utc,
-    get_local_datetime
+    get_download_timestamps,
+    get_local_datetime,
+    strptime_to_utc
 )
 
 
 class MainPageCalculations:
     LATEST_DUMP_PATH = (Path(os.path.abspath(__file__))).parent.parent / 'data/latest.json'
     REGIONS_PATH = (Path(os.path.abspath(__file__))).parent.parent / 'data/regions_map.json'
+    REGION_ALIASES_PATH = (Path(os.path.abspath(__file__))).parent.parent / 'data/regions_aliases.json'
     CAMPAIGN_TYPES = {
         'Прием на обучение на бакалавриат/специалитет': "Bachelor",
         'Прием на обучение в магистратуру': 'Magistracy',
@@ -38,36 +46,120 @@ class MainPageCalculations:
     SUPERSERVICE = 'Суперсервис \"Поступление в вуз онлайн\"'
     WEB = 'Веб'
     DOCUMENTDELIVERY = {SUPERSERVICE: 'SuperService', WEB: 'Web', 'Лично': 'Personal', 'Почта': 'Mail'}
+    INCREMENTAL = os.environ.get('INCREMENTAL_CALCULATIONS', 'true').lower() == 'true'
+    FULL_REBUILD_EVERY = int(os.environ.get('FULL_REBUILD_EVERY', '16'))
+    SIMULATE_ADMISSION = os.environ.get('SIMULATE_ADMISSION', 'true').lower() == 'true'
+    # Needs numpy (vectorized extra), full rebuilds are cheap enough that the incremental engine is not used with it
+    VECTORIZED_REQUESTED = os.environ.get('VECTORIZED_CALCULATIONS', 'false').lower() == 'true'
+    VECTORIZED = VECTORIZED_REQUESTED and vectorized.is_available()
+    # Page sections in page order with the accumulators each of them is rendered from
+    SECTIONS = {
+        'small_charts': ('applications_total', 'average_ege'),
+        'applications_approval': ('applications_total',),
+        'average_ege': ('average_ege',),
+        'highballs': (),
+        'applications_by_programs': ('applications_by_programs', 'ratings_by_programs', 'passing_score'),
+        'applications_by_region': ('applications_by_region',),
+        'applicants': ('applications_total',),
+        'last_update': (),
+        'applicants_by_day': ('applications_total',),
+    }
 
     def __init__(self):
-        pass
+        # Every calculation has its own matcher: with CALC_WORKERS=0 they learn aliases in different threads
+        self.region_matcher = None
+        self.dump = None
+        self.engine = None
+        self.engine_today = None
+        self.incremental_runs = 0
+        self.admission = None
+        self.section_results = dict()
+        self.lock = asyncio.Lock()
 
     async def _read_file(self, path):
         async with aiofiles.open(path, 'r', encoding='utf-8') as f:
             string = await f.read()
             return json.loads(string)
 
-    async def get_main_page_data(self):
-        self.dump = await self._read_file(self.LATEST_DUMP_PATH)
-        self.result = dict()
-        self.applications_total_data = await self._get_applications_agreements_total_data()
-        self.average_ege_data = await self._get_average_ege_data()
+    async def _read_dump(self, path):
+        async with aiofiles.open(path, 'r', encoding='utf-8') as f:
+            string = await f.read()
+        return loads_dump(string)
+
+    async def get_main_page_data(self, dump=None):
+        '''
+            Main page for dump, the one in latest.json if not given.
+        '''
+        async with self.lock:
+            prev_dump = self.dump
+            if dump is None:
+                with STAGE_SECONDS.time(stage='read_dump'):
+                    dump = await self._read_dump(self.LATEST_DUMP_PATH)
+            try:
+                with STAGE_SECONDS.time(stage='project'):
+                    self.dump = project_dump(dump)
+                with STAGE_SECONDS.time(stage='aggregate'):
+                    self._set_results(await self._aggregate(prev_dump))
+            except Exception:
+                # A half-applied engine must not be patched next cycle, it is rebuilt from scratch instead
+                self.engine = None
+                self.dump = prev_dump
+                raise
+            with STAGE_SECONDS.time(stage='admission_simulation'):
+                await self._simulate_admission()
+            self.last_update_date = await convert_utc_to_local(
+                await strptime_to_utc(self.dump['meta']['date'], '%Y-%m-%d %H:%M:%S'))
+            with STAGE_SECONDS.time(stage='page'):
+                return await self._get_page()
+
+    async def get_historical_page_data(self, dump):
+        '''
+            Main page as it looked right after dump was taken, "today" being the local day of the dump.
+        '''
+        async with self.lock:
+            self.dump = project_dump(dump)
+            dump_date = await convert_utc_to_local(await strptime_to_utc(dump['meta']['date'], '%Y-%m-%d %H:%M:%S'))
+            self._set_results(await self._rebuild(dump_date))
+            await self._simulate_admission()
+            await self._save_region_aliases()
+            self.last_update_date = dump_date
+            return await self._get_page()
+
+    async def get_main_page_section_data(self, section, dump=None):
+        '''
+            One section of the main page for the dump in latest.json, feeding only the accumulators it needs.
+            Results are kept for the dump version, so later sections reuse them. dump is used instead of
+            reading the file when it is that version.
+        '''
+        async with self.lock:
+            version = (await asyncio.to_thread(read_json_dump_meta, self.LATEST_DUMP_PATH))['date']
+            if self.dump is None or self.dump['meta']['date'] != version:
+                if dump is None or dump['meta']['date'] != version:
+                    dump = await self._read_dump(self.LATEST_DUMP_PATH)
+                self.dump = dump
+                self.section_results = dict()
+                self.admission = None
+            missing = [name for name in self.SECTIONS[section] if name not in self.section_results]
+            if missing:
+                self.section_results.update(await self._aggregate_only(missing))
+            self._set_results(self.section_results)
+            if section == 'applications_by_programs' and self.admission is None:
+                await self._simulate_admission()
+            self.last_update_date = await convert_utc_to_local(
+                await strptime_to_utc(self.dump['meta']['date'], '%Y-%m-%d %H:%M:%S'))
+            return await self._get_page([section])
+
+    async def _simulate_admission(self):
+        if self.SIMULATE_ADMISSION:
+            self.admission = simulate_admission(self.dump['data'], self.QUOTAS, self.CAMPAIGN_TYPES)
+
+    async def _get_page(self, sections=None):
         self.highballs_data = await self._get_highballs_data()
-        self.applications_by_programs_data = await self._get_applications_by_programs_data()
-        self.applications_by_region_data = await self._get_applications_by_region_data()
-        self.last_update_date = await convert_utc_to_local(await get_latest_dump_date())
+        # Every section is rendered by _get_<section>
+        return {section: await getattr(self, f'_get_{section}')() for section in sections or self.SECTIONS}
 
-        return {
-            'small_charts': await self._get_small_charts(),
-            'applications_approval': await self._get_applications_approval(),
-            'average_ege': await self._get_average_ege(),
-            'highballs': await self._get_highballs(),
-            'applications_by_programs': await self._get_applications_by_programs(),
-            'applications_by_region': await self._get_applications_by_region(),
-            'applicants': await self._get_applicants(),
-            'last_update': datetime.strftime(self.last_update_date, '%Y-%m-%d %H:%M:%S'),
-            'applicants_by_day': await self._get_applicants_by_day(),
-        }
+    async def _get_last_update(self):
+        return datetime.strftime(self.last_update_date, '%Y-%m-%d %H:%M:%S')
 
     async def _get_small_charts(self):
         return {
@@ -149,33 +241,33 @@ class MainPageCalculations:
     async def _get_applications_approval(self):
         result = []
 
-        for date, value in sorted(
+        for day, value in sorted(
                 self.applications_total_data['applications_by_day'].items(),
                 key=lambda x: x[0]
         ):
             result.append({
                 'type': 'Заявлений всего',
-                'date': date.strftime('%d.%m.%Y'),
+                'date': day.strftime('%d.%m.%Y'),
                 'count': value
             })
 
-        for date, value in sorted(
+        for day, value in sorted(
                 self.applications_total_data['applications_offline_by_day'].items(),
                 key=lambda x: x[0]
         ):
             result.append({
                 'type': 'Заявлений c priem.dvfu.ru',
-                'date': date.strftime('%d.%m.%Y'),
+                'date': day.strftime('%d.%m.%Y'),
                 'count': value
             })
 
-        for date, value in sorted(
+        for day, value in sorted(
                 self.applications_total_data['agreements_by_day'].items(),
                 key=lambda x: x[0]
         ):
             result.append({
                 'type': 'Оригиналов',
-                'date': date.strftime('%d.%m.%Y'),
+                'date': day.strftime('%d.%m.%Y'),
                 'count': value
             })
         return result
@@ -201,25 +293,30 @@ class MainPageCalculations:
     async def _get_applications_by_programs(self):
         result = {k: [] for k in self.CAMPAIGN_TYPES.values()}
         for program, value in self.applications_by_programs_data['applications_by_programs'].items():
-            result[value[1]].append({
+            item = {
                 'program': program,
                 'value': value[0],
                 'quotas': self.applications_by_programs_data["count_by_programs"][program],
                 'ratings': self.applications_by_programs_data["ratings_by_programs"][program],
                 'score': self.applications_by_programs_data["passing_score"][program]
-            })
+            }
+            if self.admission is not None:
+                item['projected_score'] = self.admission['passing_scores'].get(
+                    program, {k: 0 for k in self.QUOTAS.values()})
+            result[value[1]].append(item)
         for k in self.CAMPAIGN_TYPES.values():
-            result[k].sort(key=lambda x: -x['value'])
+            result[k].sort(key=lambda x: (-x['value'], x['program']))
         return result
 
     async def _get_applications_by_region(self):
         result = []
-        for region, value in self.applications_by_region_data['applications_by_region'].items():
-            if region:
-                result.append({
-                    'region': region,
-                    'value': value
-                })
+        regions = self.applications_by_region_data['applications_by_region']
+        # Sorted by region, as the order counts are found in depends on which applicants came and went
+        for region in sorted(region for region in regions if region):
+            result.append({
+                'region': region,
+                'value': regions[region]
+            })
         return result
 
     async def _get_applicants(self):
@@ -231,173 +328,169 @@ class MainPageCalculations:
 
     async def _get_applicants_by_day(self):
         result = []
-        for date, value in sorted(
+        for day, value in sorted(
                 self.applications_total_data['applicants_by_day'].items(),
                 key=lambda x: x[0]
         ):
             result.append({
                 'type': 'Абитуриентов всего',
-                'date': date.strftime('%d.%m.%Y'),
+                'date': day.strftime('%d.%m.%Y'),
                 'count': value
             })
-        for date, value in sorted(
+        for day, value in sorted(
                 self.applications_total_data['applicants_offline_by_day'].items(),
                 key=lambda x: x[0]
         ):
             result.append({
                 'type': 'Абитуриентов c priem.dvfu.ru',
-                'date': date.strftime('%d.%m.%Y'),
+                'date': day.strftime('%d.%m.%Y'),
                 'count': value
             })
-        for date, value in sorted(
+        for day, value in sorted(
                 self.applications_total_data['applicants_online_by_day'].items(),
                 key=lambda x: x[0]
         ):
             result.append({
                 'type': 'Абитуриентов c Суперсервиса',
-                'date': date.strftime('%d.%m.%Y'),
+                'date': day.strftime('%d.%m.%Y'),
                 'count': value
             })
         return result
 
-    async def _get_applications_agreements_total_data(self):
+    async def _aggregate(self, prev_dump=None):
         '''
-            For speed purposes, we calculate this in single cycle.
+            All metrics are fed from a single traversal of the dump.
+            When the previous dump is known, only the applicants changed since then are re-fed.
+        '''
+        results = None
+        if self.INCREMENTAL and prev_dump is not None and await self._can_apply_incrementally():
+            delta = diff_dumps(prev_dump['data'], self.dump['data'])
+            print(f'Applying {len(delta)} changed applications...')
+            results = self.engine.apply(delta, prev_dump['data'], self.dump['data'])
+            self.incremental_runs += 1
+            if self.incremental_runs >= self.FULL_REBUILD_EVERY:
+                await self.check_consistency(results)
+                results = self.engine.results()
+        if results is None:
+            results = await self._rebuild()
+        await self._save_region_aliases()
+        return results
+
+    def _set_results(self, results):
+        # Sections computed on their own have only some of the results
+        self.applications_total_data = results.get('applications_total')
+        self.average_ege_data = results.get('average_ege')
+        self.applications_by_programs_data = {
+            **results['applications_by_programs'],
+            'ratings_by_programs': results['ratings_by_programs'],
+            'passing_score': results['passing_score'],
+        } if 'applications_by_programs' in results else None
+        self.applications_by_region_data = results.get('applications_by_region')
+
+    async def _aggregate_only(self, names):
+        '''
+            Results of the named accumulators alone, from a full pass over the dump.
+            The region matcher is only loaded when applications_by_region is among them.
         '''
-        applications_info_today = {
-            fs: {dd: {k: 0 for k in self.QUOTAS.values()} for dd in self.DOCUMENTDELIVERY.values()} for fs in
-            self.FINANCING.values()}
-        applications_info_total = {
-            fs: {dd: {k: 0 for k in self.QUOTAS.values()} for dd in self.DOCUMENTDELIVERY.values()} for fs in
-            self.FINANCING.values()}
-        applicants_info_total = {dd: set() for dd in self.DOCUMENTDELIVERY.values()}
-        applications_by_day = dict()
-        applications_web_by_day = dict()
-        applicants_superservice_by_day = dict()
-        applicants_web_by_day = dict()
-        applicants_by_day = dict()
-        applicants_used = set()
-
-        agreements_by_day = dict()
-        agreements_total = set()
-        agreements_today = set()
-
         today_local = await get_local_datetime()
-        for _, human_item in self.dump['data'].items():
-            human = _
-            for __, app_item in human_item.items():
-                quota = self.QUOTAS[app_item['Category']]
-                document_delivery = self.DOCUMENTDELIVERY[app_item['DocumentDelivery']]
-                financing_source = self.FINANCING[app_item['FinancingSource']]
-                item_date_download = await convert_utc_to_local(
-                    await strptime_to_utc(app_item['firstDownloadDate'], '%Y-%m-%d %H:%M:%S')
-                )
-                item_date_local = item_date_download.replace(hour=0, minute=0, second=0, microsecond=0)
-
-                if item_date_download.strftime('%Y-%m-%d') == today_local.strftime('%Y-%m-%d'):
-                    applications_info_today[financing_source][document_delivery][quota] += 1
-                    # TODO Переписать под оригиналы
-                    if app_item['AtestOrig']:
-                        agreements_today.add(human)
-
-                applications_info_total[financing_source][document_delivery][quota] += 1
-                applicants_info_total[document_delivery].add(human)
-                if document_delivery == self.WEB:
-                    if item_date_local in applications_web_by_day:
-                        applications_web_by_day[item_date_local] += 1
-                    else:
-                        applications_web_by_day[item_date_local] = 1
-                if app_item['AtestOrig']:
-                    # TODO Согласие заменить на оригиналы
-                    agreements_total.add(human)
-                    if item_date_local in agreements_by_day:
-                        agreements_by_day[item_date_local].add(human)
-                    else:
-                        agreements_by_day[item_date_local] = set()
-
-                if item_date_local in applications_by_day:
-                    applications_by_day[item_date_local] += 1
-                else:
-                    applications_by_day[item_date_local] = 1
-
-                if human not in applicants_used:
-                    if document_delivery == "Веб":
-                        applicants_web_by_day[item_date_local] = applicants_web_by_day.get(item_date_local,
-                                                                                           0) + 1
-                    elif document_delivery == "Суперсервис \"Поступление в вуз онлайн\"":
-                        applicants_superservice_by_day[item_date_local] = applicants_superservice_by_day.get(
-                            item_date_local, 0) + 1
-                    applicants_used.add(human)
-
-        applicants_total = sum(map(len, applicants_info_total.values()))
-        applicants_by_day = applicants_web_by_day.copy()
-        for date, value in applicants_superservice_by_day.items():
-            applicants_by_day[date] = applicants_by_day.get(date, 0) + value
-        agreements_by_day = {k: len(v) for k, v in agreements_by_day.items()}
-
-        return {
-            'applications_today': applications_info_today,
-            'applications_total': applications_info_total,
-            'agreements_today': len(agreements_today),
-            'agreements_total': len(agreements_total),
-            'agreements_by_day': agreements_by_day,
-            'applications_by_day': applications_by_day,
-            'applications_offline_by_day': applications_web_by_day,
-            'applicants_total': applicants_total,
-            'applicants_total_superservice': len(applicants_info_total['SuperService']),
-            'applicants_total_web': len(applicants_info_total['Web']),
-            'applicants_online_by_day': applicants_superservice_by_day,
-            'applicants_offline_by_day': applicants_web_by_day,
-            'applicants_by_day': applicants_by_day,
+        region_matcher = await self._get_region_matcher() if 'applications_by_region' in names else None
+        if self.VECTORIZED:
+            results = vectorized.aggregate(self.dump['data'], today_local, region_matcher, self, names)
+        else:
+            engine = AggregationEngine()
+            for name, accumulator in (await self._get_accumulators(today_local, names)).items():
+                engine.register(name, accumulator)
+            results = engine.run(self.dump['data'])
+        await self._save_region_aliases()
+        return results
+
+    async def _rebuild(self, today_local=None):
+        today_local = today_local or await get_local_datetime()
+        if self.VECTORIZED:
+            self.engine = None
+            return vectorized.aggregate(self.dump['data'], today_local, await self._get_region_matcher(), self)
+        engine = AggregationEngine()
+        for name, accumulator in (await self._get_accumulators(today_local)).items():
+            engine.register(name, accumulator)
+        self.engine = None
+        results = engine.run(self.dump['data'])
+        # Only an engine that has seen the whole dump may be patched by later deltas
+        self.engine = engine
+        self.engine_today = today_local.strftime('%Y-%m-%d')
+        self.incremental_runs = 0
+        return results
+
+    async def _can_apply_incrementally(self):
+        if self.engine is None:
+            return False
+        today = (await get_local_datetime()).strftime('%Y-%m-%d')
+        region_matcher = self.engine.accumulators['applications_by_region'].region_matcher
+        return today == self.engine_today and region_matcher is await self._get_region_matcher()
+
+    async def check_consistency(self, results):
+        '''
+            Rebuilds every metric from scratch and reports the ones that differ from results.
+        '''
+        expected = await self._rebuild()
+        mismatched = [name for name in expected if expected[name] != results[name]]
+        if mismatched:
+            print(f'Incremental results differ from full rebuild: {", ".join(mismatched)}')
+        else:
+            print('Incremental results match full rebuild')
+        return not mismatched
+
+    async def _get_accumulators(self, today_local, names=None):
+        region_matcher = None
+        if names is None or 'applications_by_region' in names:
+            region_matcher = await self._get_region_matcher()
+        factories = {
+            'applications_total': lambda: ApplicationsTotalAccumulator(today_local),
+            'average_ege': AverageEgeAccumulator,
+            'applications_by_programs': ApplicationsByProgramsAccumulator,
+            'ratings_by_programs': RatingsByProgramsAccumulator,
+            'passing_score': PassingScoreAccumulator,
+            'applications_by_region': lambda: ApplicationsByRegionAccumulator(region_matcher),
         }
+        return {name: create() for name, create in factories.items() if names is None or name in names}
 
-    async def _get_average_ege_data(self):
-        average_ege_total = 0
-        average_ege_num = 0
-        average_ege_school = dict()
+    async def _get_region_matcher(self):
+        regions_map = await self._read_file(self.REGIONS_PATH)
+        matcher = self.region_matcher
+        if matcher is None or matcher.version != RegionMatcher.get_version(regions_map):
+            aliases = None
+            if os.path.exists(self.REGION_ALIASES_PATH):
+                aliases = await self._read_file(self.REGION_ALIASES_PATH)
+            matcher = RegionMatcher(regions_map, aliases)
+            self.region_matcher = matcher
+        return matcher
+
+    async def _save_region_aliases(self):
+        matcher = self.region_matcher
+        if matcher is None or matcher.learned == 0:
+            return
+        # Other workers read the aliases when they build their matcher, so they only ever see a complete file
+        path = Path(self.REGION_ALIASES_PATH)
+        fd, tmp_path = tempfile.mkstemp(suffix='.tmp', prefix=f'{path.name}.', dir=path.parent)
+        os.close(fd)
+        try:
+            async with aiofiles.open(tmp_path, 'w', encoding='utf-8') as f:
+                await f.write(json.dumps(matcher.dump_aliases(), ensure_ascii=False))
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+        matcher.learned = 0
+
+    async def _run_stage(self, accumulator):
+        engine = AggregationEngine()
+        engine.register('stage', accumulator)
+        return engine.run(self.dump['data'])['stage']
 
-        used_total = dict()
-        used_school = dict()
-        for _, human_item in self.dump['data'].items():
-            for __, app_item in human_item.items():
-                if app_item['FinancingSource'] != 'Бюджетная основа':
-                    continue
-
-                human = app_item['Code']
-                # TODO Сделать по школам
-                # school = item['IP_PROP1643']
-                # if human not in used_total:
-                #     used_total[human] = set()
-                # if school not in used_school:
-                #     used_school[school] = dict()
-                #     used_school[school][human] = set()
-                #     average_ege_school[school] = {
-                #         'total': 0,
-                #         'num': 0,
-                #     }
-                # if human not in used_school[school]:
-                #     used_school[school][human] = set()
-
-                # TODO Доделать когда будет знак Test1IsEGE
-                for code in range(4):
-                    score = app_item[f"Test{code + 1}Score"]
-                    if score > 0:
-                        average_ege_total += score
-                        average_ege_num += 1
-                        # TODO Сделать по школам
-                        # if subject_name not in used_school[school][human]:
-                        #     used_school[school][human].add(subject_name)
-                        #     average_ege_school[school]['total'] += score
-                        #     average_ege_school[school]['num'] += 1
-        for key in average_ege_school:
-            try:
-                average_ege_school[key] = average_ege_school[key]['total'] / average_ege_school[key]['num']
-            except Exception:
-                average_ege_school[key] = 0
-        return {
-            'average_ege_total': average_ege_total / average_ege_num if average_ege_num > 0 else 0,
-            'average_ege_schools': average_ege_school,
-        }
+    async def _get_applications_agreements_total_data(self):
+        return await self._run_stage(ApplicationsTotalAccumulator(await get_local_datetime()))
+
+    async def _get_average_ege_data(self):
+        return await self._run_stage(AverageEgeAccumulator())
 
     async def _get_highballs_data(self):
         school_highballs = dict()
@@ -430,125 +523,340 @@ class MainPageCalculations:
         return sum_balls
 
     async def _get_applications_by_programs_data(self):
-        count_by_programs = dict()
-        applications_by_programs = dict()
-        for _, human_item in self.dump['data'].items():
-            for __, app_item in human_item.items():
-                program = app_item['TrainingDirection']
-                if program not in count_by_programs:
-                    count_by_programs[program] = dict()
-                    count_by_programs[program]["BudgetQuotaCount"] = app_item["BudgetQuotaCount"]
-                    count_by_programs[program]["TargetQuotaCount"] = app_item["TargetQuotaCount"]
-                    count_by_programs[program]["SpecialQuotaCount"] = app_item["SpecialQuotaCount"]
-                    count_by_programs[program]["SeparateQuotaCount"] = app_item["SeparateQuotaCount"]
-                if program not in applications_by_programs:
-                    applications_by_programs[program] = [0, self.CAMPAIGN_TYPES[app_item['AdmissionCampaignType']]]
-                applications_by_programs[program][0] += 1
         return {
-            'applications_by_programs': applications_by_programs,
-            'count_by_programs': count_by_programs,
+            **await self._run_stage(ApplicationsByProgramsAccumulator()),
             'ratings_by_programs': await self._get_ratings_by_programs(),
             'passing_score': await self._get_passing_score_by_programs()
         }
 
     async def _get_ratings_by_programs(self):
-        applications_by_programs = dict()
-        info_by_programs = dict()
-        for _, human_item in self.dump['data'].items():
-            for __, app_item in human_item.items():
-                program = app_item['TrainingDirection']
-                quota = self.QUOTAS[app_item['Category']]
-                if program not in applications_by_programs:
-                    applications_by_programs[program] = dict()
-                    info_by_programs[program] = {k: [0, 0] for k in self.QUOTAS.values()}
-                if quota not in applications_by_programs[program]:
-                    applications_by_programs[program][quota] = []
-                applications_by_programs[program][quota].append(app_item)
-                if app_item['SelectedPriority'] == 1:
-                    if app_item['AtestOrig']:
-                        info_by_programs[program][quota][1] += 1
-                    else:
-                        info_by_programs[program][quota][0] += 1
-        return info_by_programs
+        return await self._run_stage(RatingsByProgramsAccumulator())
 
     async def _get_passing_score_by_programs(self):
-        applications_by_programs = dict()
-        info_by_programs = dict()
-        for _, human_item in self.dump['data'].items():
-            for __, app_item in human_item.items():
-                program = app_item['TrainingDirection']
-                quota = self.QUOTAS[app_item['Category']]
-                if program not in applications_by_programs:
-                    applications_by_programs[program] = {k: [[], 0] for k in self.QUOTAS.values()}
-                    info_by_programs[program] = {k: 0 for k in self.QUOTAS.values()}
-                if app_item['SelectedPriority'] == 1 and app_item['AtestOrig'] and not app_item['NoExams']:
-                    applications_by_programs[program][quota][0].append(app_item)
-                if app_item['AtestOrig'] and app_item['NoExams']:
-                    applications_by_programs[program][quota][1] += 1
-
-        for program, quotas in applications_by_programs.items():
-            for quota, applications in quotas.items():
-                apps: List = applications[0].copy()
-                apps.sort(key=lambda x: x['SumScore'], reverse=True)
-                if len(apps) > 0:
-                    kcp = apps[0][quota + "Count"] - applications[1]
-                    last = len(apps)
-                    info_by_programs[program][quota] = apps[min(kcp, last) - 1]['SumScore']
-
-        return info_by_programs
+        return await self._run_stage(PassingScoreAccumulator())
 
     async def _get_applications_by_region_data(self):
-        regions_map = await self._read_file(self.REGIONS_PATH)
+        result = await self._run_stage(ApplicationsByRegionAccumulator(await self._get_region_matcher()))
+        await self._save_region_aliases()
+        return result
 
-        regexp_list = [
-            r"\s*область\s*",
-            r"\s+обл\s*",
-            r"\s*край\s*",
-            r"\s*республика\s*",
-            r"\s+респ\s*",
-            r"\s+г\s*",
-            r"\s+аобл\s*",
-            r"\s+ао\s*",
-            r"\s*автономная область\s*",
-            r"\s*автономный округ\s*",
-        ]
 
-        def clear_region(str):
-            result = str.lower()
+class ApplicationsTotalAccumulator(Accumulator):
+    '''
+        For speed purposes, we calculate this in single cycle.
+        Applicant sets are kept as reference counts, so applications can be discarded again.
+    '''
+
+    def __init__(self, today_local):
+        quotas = MainPageCalculations.QUOTAS.values()
+        document_deliveries = MainPageCalculations.DOCUMENTDELIVERY.values()
+        self.today = today_local.toordinal()
+        self.applications_info_today = {
+            fs: {dd: {k: 0 for k in quotas} for dd in document_deliveries}
+            for fs in MainPageCalculations.FINANCING.values()}
+        self.applications_info_total = {
+            fs: {dd: {k: 0 for k in quotas} for dd in document_deliveries}
+            for fs in MainPageCalculations.FINANCING.values()}
+        self.applicants_info_total = {dd: dict() for dd in document_deliveries}
+        self.applications_by_day = dict()
+        self.applications_web_by_day = dict()
+        self.applicants_superservice_by_day = dict()
+        self.applicants_web_by_day = dict()
+
+        self.agreements_by_day = dict()
+        self.agreements_total = dict()
+        self.agreements_today = dict()
+
+    @staticmethod
+    def _get_download_day(app_item):
+        day = app_item.firstDownloadDay
+        if day is None:
+            # Dumps written before firstDownloadDay was stored
+            day = get_download_timestamps(app_item.firstDownloadDate)[1]
+        return day
+
+    @staticmethod
+    def _to_dates(by_day):
+        return {date.fromordinal(day): value for day, value in by_day.items()}
+
+    def add_applicant(self, human, human_item):
+        self._update_applicant(human_item, increment)
+
+    def remove_applicant(self, human, human_item):
+        self._update_applicant(human_item, decrement)
+
+    def _update_applicant(self, human_item, update):
+        first_application = next(iter(human_item.values()))
+        document_delivery = MainPageCalculations.DOCUMENTDELIVERY[first_application.DocumentDelivery]
+        item_date_local = self._get_download_day(first_application)
+        if document_delivery == "Веб":
+            update(self.applicants_web_by_day, item_date_local)
+        elif document_delivery == "Суперсервис \"Поступление в вуз онлайн\"":
+            update(self.applicants_superservice_by_day, item_date_local)
+
+    def add(self, human, app_item):
+        self._update(human, app_item, increment, 1)
+
+    def discard(self, human, app_item):
+        self._update(human, app_item, decrement, -1)
+
+    def _update(self, human, app_item, update, sign):
+        quota = MainPageCalculations.QUOTAS[app_item.Category]
+        document_delivery = MainPageCalculations.DOCUMENTDELIVERY[app_item.DocumentDelivery]
+        financing_source = MainPageCalculations.FINANCING[app_item.FinancingSource]
+        item_date_local = self._get_download_day(app_item)
+
+        if item_date_local == self.today:
+            self.applications_info_today[financing_source][document_delivery][quota] += sign
+            # TODO Переписать под оригиналы
+            if app_item.AtestOrig:
+                update(self.agreements_today, human)
+
+        self.applications_info_total[financing_source][document_delivery][quota] += sign
+        update(self.applicants_info_total[document_delivery], human)
+        if document_delivery == MainPageCalculations.WEB:
+            update(self.applications_web_by_day, item_date_local)
+        if app_item.AtestOrig:
+            # TODO Согласие заменить на оригиналы
+            update(self.agreements_total, human)
+            agreements = self.agreements_by_day.setdefault(item_date_local, dict())
+            update(agreements, human)
+            if not agreements:
+                del self.agreements_by_day[item_date_local]
+
+        update(self.applications_by_day, item_date_local)
+
+    def result(self):
+        applicants_total = sum(map(len, self.applicants_info_total.values()))
+        applicants_by_day = self.applicants_web_by_day.copy()
+        for day, value in self.applicants_superservice_by_day.items():
+            applicants_by_day[day] = applicants_by_day.get(day, 0) + value
+        agreements_by_day = {k: len(v) for k, v in self.agreements_by_day.items()}
 
-            for reg_exp in regexp_list:
-                result = re.sub(reg_exp, "", result)
+        return {
+            'applications_today': deepcopy(self.applications_info_today),
+            'applications_total': deepcopy(self.applications_info_total),
+            'agreements_today': len(self.agreements_today),
+            'agreements_total': len(self.agreements_total),
+            'agreements_by_day': self._to_dates(agreements_by_day),
+            'applications_by_day': self._to_dates(self.applications_by_day),
+            'applications_offline_by_day': self._to_dates(self.applications_web_by_day),
+            'applicants_total': applicants_total,
+            'applicants_total_superservice': len(self.applicants_info_total['SuperService']),
+            'applicants_total_web': len(self.applicants_info_total['Web']),
+            'applicants_online_by_day': self._to_dates(self.applicants_superservice_by_day),
+            'applicants_offline_by_day': self._to_dates(self.applicants_web_by_day),
+            'applicants_by_day': self._to_dates(applicants_by_day),
+        }
 
-            return result
 
-        def find_best_match(adress):
-            best_match = None
+class AverageEgeAccumulator(Accumulator):
 
-            if not adress:
-                return best_match
+    def __init__(self):
+        self.average_ege_total = 0
+        self.average_ege_num = 0
+        self.average_ege_school = dict()
 
-            min_dist = float("inf")
+    def add(self, human, app_item):
+        self._update(app_item, 1)
 
-            for reg, iso_code in regions_map.items():
-                dist = distance(reg, adress)
-                if dist < min_dist:
-                    min_dist = dist
-                    best_match = iso_code
+    def discard(self, human, app_item):
+        self._update(app_item, -1)
 
-            return best_match if min_dist < 10 else None
+    def _update(self, app_item, sign):
+        if app_item.FinancingSource != 'Бюджетная основа':
+            return
+
+        # TODO Сделать по школам
+        # school = item['IP_PROP1643']
+
+        # TODO Доделать когда будет знак Test1IsEGE
+        for code in range(4):
+            score = getattr(app_item, f"Test{code + 1}Score")
+            if score > 0:
+                self.average_ege_total += sign * score
+                self.average_ege_num += sign
+
+    def result(self):
+        average_ege_school = dict()
+        for key, value in self.average_ege_school.items():
+            try:
+                average_ege_school[key] = value['total'] / value['num']
+            except Exception:
+                average_ege_school[key] = 0
+        return {
+            'average_ege_total': self.average_ege_total / self.average_ege_num if self.average_ege_num > 0 else 0,
+            'average_ege_schools': average_ege_school,
+        }
 
-        applications_by_region = dict()
 
-        for _, human_item in self.dump['data'].items():
-            ad = list(human_item.values())[0]['AdmissionCampaignType']
-            if ad != "Прием на обучение на бакалавриат/специалитет":
-                continue
-            region = clear_region(list(human_item.values())[0]['Region'])
-            iso_code = find_best_match(region)
+class ApplicationsByProgramsAccumulator(Accumulator):
 
-            if iso_code not in applications_by_region:
-                applications_by_region[iso_code] = 0
-            applications_by_region[iso_code] += 1
+    def __init__(self):
+        self.count_by_programs = dict()
+        self.applications_by_programs = dict()
+
+    def add(self, human, app_item):
+        program = app_item.TrainingDirection
+        self.count_by_programs[program] = {
+            "BudgetQuotaCount": app_item.BudgetQuotaCount,
+            "TargetQuotaCount": app_item.TargetQuotaCount,
+            "SpecialQuotaCount": app_item.SpecialQuotaCount,
+            "SeparateQuotaCount": app_item.SeparateQuotaCount,
+        }
+        if program not in self.applications_by_programs:
+            self.applications_by_programs[program] = [
+                0, MainPageCalculations.CAMPAIGN_TYPES[app_item.AdmissionCampaignType]
+            ]
+        self.applications_by_programs[program][0] += 1
+
+    def discard(self, human, app_item):
+        program = app_item.TrainingDirection
+        self.applications_by_programs[program][0] -= 1
+        if self.applications_by_programs[program][0] == 0:
+            del self.applications_by_programs[program]
+            del self.count_by_programs[program]
+
+    def result(self):
+        return {
+            'applications_by_programs': {k: v.copy() for k, v in self.applications_by_programs.items()},
+            'count_by_programs': {k: v.copy() for k, v in self.count_by_programs.items()},
+        }
+
+
+class RatingsByProgramsAccumulator(Accumulator):
+
+    def __init__(self):
+        self.info_by_programs = dict()
+        self.applications_count = dict()
+
+    def add(self, human, app_item):
+        program = app_item.TrainingDirection
+        if program not in self.info_by_programs:
+            self.info_by_programs[program] = {k: [0, 0] for k in MainPageCalculations.QUOTAS.values()}
+        increment(self.applications_count, program)
+        self._update(app_item, 1)
+
+    def discard(self, human, app_item):
+        self._update(app_item, -1)
+        program = app_item.TrainingDirection
+        decrement(self.applications_count, program)
+        if program not in self.applications_count:
+            del self.info_by_programs[program]
+
+    def _update(self, app_item, sign):
+        program = app_item.TrainingDirection
+        quota = MainPageCalculations.QUOTAS[app_item.Category]
+        if app_item.SelectedPriority == 1:
+            if app_item.AtestOrig:
+                self.info_by_programs[program][quota][1] += sign
+            else:
+                self.info_by_programs[program][quota][0] += sign
+
+    def result(self):
+        return {program: {quota: value.copy() for quota, value in quotas.items()}
+                for program, quotas in self.info_by_programs.items()}
+
+
+class PassingScoreAccumulator(Accumulator):
+    '''
+        Keeps only the highest SumScores of first priority originals per program and quota, as many as the quota
+        has seats, together with the number of originals admitted without exams.
+        The passing score is the score at the last seat left after the no-exam originals,
+        the lowest score when no seats are left.
+    '''
+
+    def __init__(self):
+        self.scores_by_programs = dict()
+        self.no_exams_by_programs = dict()
+        self.quota_counts = dict()
+        self.applications_count = dict()
+
+    @staticmethod
+    def _is_ranked(app_item):
+        return app_item.SelectedPriority == 1 and app_item.AtestOrig and not app_item.NoExams
+
+    def add(self, human, app_item):
+        program = app_item.TrainingDirection
+        quota = MainPageCalculations.QUOTAS[app_item.Category]
+        if program not in self.scores_by_programs:
+            self.scores_by_programs[program] = {k: TopK(getattr(app_item, k + 'Count'))
+                                                for k in MainPageCalculations.QUOTAS.values()}
+            self.no_exams_by_programs[program] = {k: 0 for k in MainPageCalculations.QUOTAS.values()}
+        increment(self.applications_count, program)
+        quota_counts = [getattr(app_item, k + 'Count') for k in MainPageCalculations.QUOTAS.values()]
+        if quota_counts != self.quota_counts.get(program):
+            self.quota_counts[program] = quota_counts
+            for top, quota_count in zip(self.scores_by_programs[program].values(), quota_counts):
+                top.resize(quota_count)
+        if self._is_ranked(app_item):
+            self.scores_by_programs[program][quota].add(app_item.SumScore)
+        if app_item.AtestOrig and app_item.NoExams:
+            self.no_exams_by_programs[program][quota] += 1
+
+    def discard(self, human, app_item):
+        program = app_item.TrainingDirection
+        quota = MainPageCalculations.QUOTAS[app_item.Category]
+        if self._is_ranked(app_item):
+            self.scores_by_programs[program][quota].discard(app_item.SumScore)
+        if app_item.AtestOrig and app_item.NoExams:
+            self.no_exams_by_programs[program][quota] -= 1
+        decrement(self.applications_count, program)
+        if program not in self.applications_count:
+            del self.scores_by_programs[program]
+            del self.no_exams_by_programs[program]
+            del self.quota_counts[program]
+
+    def refresh(self, data):
+        stale = {(program, quota) for program, quotas in self.scores_by_programs.items()
+                 for quota, top in quotas.items() if top.stale}
+        if not stale:
+            return
+        for program, quota in stale:
+            top = self.scores_by_programs[program][quota]
+            self.scores_by_programs[program][quota] = TopK(top.capacity)
+        for human_item in data.values():
+            for app_item in human_item.values():
+                key = (app_item.TrainingDirection, MainPageCalculations.QUOTAS[app_item.Category])
+                if key in stale and self._is_ranked(app_item):
+                    self.scores_by_programs[key[0]][key[1]].add(app_item.SumScore)
+
+    def result(self):
+        info_by_programs = dict()
+        for program, quotas in self.scores_by_programs.items():
+            info_by_programs[program] = {k: 0 for k in MainPageCalculations.QUOTAS.values()}
+            for quota, top in quotas.items():
+                if top.count > 0:
+                    kcp = top.capacity - self.no_exams_by_programs[program][quota]
+                    info_by_programs[program][quota] = top.get_kth_highest(kcp)
+
+        return info_by_programs
+
+
+class ApplicationsByRegionAccumulator(Accumulator):
+
+    def __init__(self, region_matcher: RegionMatcher):
+        self.region_matcher = region_matcher
+        self.applicants_by_raw_region = dict()
+
+    def add_applicant(self, human, human_item):
+        self._update(human_item, increment)
+
+    def remove_applicant(self, human, human_item):
+        self._update(human_item, decrement)
+
+    def _update(self, human_item, update):
+        first_application = next(iter(human_item.values()))
+        if first_application.AdmissionCampaignType != "Прием на обучение на бакалавриат/специалитет":
+            return
+        update(self.applicants_by_raw_region, first_application.Region)
+
+    def result(self):
+        applications_by_region = dict()
+        iso_codes = self.region_matcher.resolve_many(self.applicants_by_raw_region.keys())
+        for region, value in self.applicants_by_raw_region.items():
+            iso_code = iso_codes[region]
+            applications_by_region[iso_code] = applications_by_region.get(iso_code, 0) + value
 
         return {
             'applications_by_region': applications_by_region
@@ -0,0 +1,179 @@
+import json
+import mmap
+import struct
+from array import array
+
+MAGIC = b'ADMCOL1\0'
+# magic, blob size, header size
+PREFIX = struct.Struct('<8sQI')
+ALIGNMENT = 8
+INT_TYPECODES = [('b', 8), ('h', 16), ('i', 32), ('q', 64)]
+MISSING = object()
+
+
+def _align(size):
+    return (size + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def _encode_column(name, values):
+    '''
+        Booleans, integers and floats present in every row are stored as typed arrays,
+        everything else is dictionary-encoded with code -1 marking rows without the field.
+    '''
+    present = [value for value in values if value is not MISSING]
+    if len(present) == len(values) and present:
+        if all(type(value) is bool for value in present):
+            return {'name': name, 'kind': 'bool', 'typecode': 'b'}, array('b', values)
+        if all(type(value) is int for value in present):
+            low, high = min(values), max(values)
+            for typecode, bits in INT_TYPECODES:
+                if -(1 << (bits - 1)) <= low and high < (1 << (bits - 1)):
+                    return {'name': name, 'kind': 'int', 'typecode': typecode}, array(typecode, values)
+        if all(type(value) is float for value in present):
+            return {'name': name, 'kind': 'float', 'typecode': 'd'}, array('d', values)
+
+    dictionary = dict()
+    categories = []
+    codes = array('i')
+    for value in values:
+        if value is MISSING:
+            codes.append(-1)
+            continue
+        key = value if isinstance(value, str) else json.dumps(value, sort_keys=True)
+        code = dictionary.get((type(value) is str, key))
+        if code is None:
+            code = dictionary[(type(value) is str, key)] = len(categories)
+            categories.append(value)
+        codes.append(code)
+    return {'name': name, 'kind': 'category', 'typecode': 'i', 'categories': categories}, codes
+
+
+def write_columnar(f, meta, records, **extra):
+    '''
+        Writes records (a list of flat dicts) to the binary file f as one columnar blob
+        and returns the number of bytes written. Extra keyword arguments are stored in the header.
+    '''
+    names = dict()
+    for record in records:
+        for name in record:
+            names.setdefault(name, None)
+
+    columns = []
+    buffers = []
+    offset = 0
+    for name in names:
+        column, values = _encode_column(name, [record.get(name, MISSING) for record in records])
+        data = values.tobytes()
+        column['offset'] = offset
+        column['size'] = len(data)
+        columns.append(column)
+        buffers.append(data)
+        offset += _align(len(data))
+
+    header = json.dumps({
+        'meta': meta,
+        'rows': len(records),
+        'columns': columns,
+        **extra,
+    }, ensure_ascii=False).encode('utf-8')
+    data_start = _align(PREFIX.size + len(header))
+    size = data_start + offset
+
+    f.write(PREFIX.pack(MAGIC, size, len(header)))
+    f.write(header)
+    f.write(b'\0' * (data_start - PREFIX.size - len(header)))
+    for data in buffers:
+        f.write(data)
+        f.write(b'\0' * (_align(len(data)) - len(data)))
+    return size
+
+
+def write_columnar_dump(path, dump):
+    records = [app_item for human_item in dump['data'].values() for app_item in human_item.values()]
+    with open(path, 'wb') as f:
+        return write_columnar(f, dump['meta'], records)
+
+
+class ColumnarDump:
+    '''
+        Read access to a columnar blob inside any buffer, normally a memory-mapped file.
+        Typed columns are returned as zero-copy memoryviews over the buffer.
+    '''
+
+    def __init__(self, buffer, offset=0):
+        self.buffer = memoryview(buffer)
+        magic, self.size, header_size = PREFIX.unpack_from(self.buffer, offset)
+        if magic != MAGIC:
+            raise ValueError(f'Not a columnar dump at offset {offset}')
+        header_start = offset + PREFIX.size
+        self.header = json.loads(bytes(self.buffer[header_start:header_start + header_size]))
+        self.offset = offset
+        self.data_start = offset + _align(PREFIX.size + header_size)
+        self.columns = {column['name']: column for column in self.header['columns']}
+        self._mmap = None
+
+    @classmethod
+    def open(cls, path):
+        with open(path, 'rb') as f:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        dump = cls(buffer)
+        dump._mmap = buffer
+        return dump
+
+    def close(self):
+        self.buffer.release()
+        if self._mmap is not None:
+            self._mmap.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    @property
+    def meta(self):
+        return self.header['meta']
+
+    @property
+    def rows(self):
+        return self.header['rows']
+
+    def column(self, name):
+        '''
+            Raw column: the typed array for numeric columns, the codes for categorical ones.
+        '''
+        column = self.columns[name]
+        start = self.data_start + column['offset']
+        return self.buffer[start:start + column['size']].cast(column['typecode'])
+
+    def categories(self, name):
+        return self.columns[name].get('categories')
+
+    def values(self, name):
+        '''
+            Decoded column values, MISSING for rows without the field.
+        '''
+        column = self.columns[name]
+        data = self.column(name)
+        if column['kind'] == 'bool':
+            return [bool(value) for value in data]
+        if column['kind'] != 'category':
+            return data.tolist()
+        categories = column['categories'] + [MISSING]
+        return [categories[code] for code in data]
+
+    def records(self):
+        names = list(self.columns)
+        columns = [self.values(name) for name in names]
+        for row in zip(*columns):
+            yield {name: value for name, value in zip(names, row) if value is not MISSING}
+
+    def to_dump(self):
+        data = dict()
+        for record in self.records():
+            data.setdefault(record['Code'], {})[record['TrainingDirection']] = record
+        return {
+            'meta': self.meta,
+            'data': data,
+        }
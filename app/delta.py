@@ -0,0 +1,37 @@
+class DumpDelta:
+    '''
+        Applications added, removed and changed between two formatted dumps,
+        keyed by (Code, TrainingDirection).
+    '''
+
+    def __init__(self):
+        self.added = []
+        self.removed = []
+        self.changed = []
+
+    @property
+    def applicants(self):
+        return {code for code, _ in self.added + self.removed + self.changed}
+
+    def __len__(self):
+        return len(self.added) + len(self.removed) + len(self.changed)
+
+
+def diff_dumps(prev_data, data):
+    delta = DumpDelta()
+    for code, human_item in data.items():
+        prev_human_item = prev_data.get(code)
+        if prev_human_item is None:
+            delta.added += [(code, direction) for direction in human_item]
+            continue
+        for direction, app_item in human_item.items():
+            prev_app_item = prev_human_item.get(direction)
+            if prev_app_item is None:
+                delta.added.append((code, direction))
+            elif prev_app_item != app_item:
+                delta.changed.append((code, direction))
+        delta.removed += [(code, direction) for direction in prev_human_item if direction not in human_item]
+    for code, prev_human_item in prev_data.items():
+        if code not in data:
+            delta.removed += [(code, direction) for direction in prev_human_item]
+    return delta
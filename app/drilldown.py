@@ -0,0 +1,121 @@
+import os
+import json
+import asyncio
+
+from app.calculations import MainPageCalculations
+from app.utils import StudentsDataFetcher
+
+PROGRAM_FIELDS = ('Code', 'SumScore', 'NoExams', 'SelectedPriority', 'AtestOrig', 'DocumentDelivery')
+APPLICANT_FIELDS = ('TrainingDirection', 'AdmissionCampaignType', 'Category', 'FinancingSource',
+                    'SelectedPriority', 'SumScore', 'NoExams', 'AtestOrig', 'firstDownloadDate')
+FULL_COST = 'FullCost'
+
+
+def _get_list_name(app_item):
+    # Paid applications compete in one list per program, budget ones per quota
+    if MainPageCalculations.FINANCING[app_item['FinancingSource']] == FULL_COST:
+        return FULL_COST
+    return MainPageCalculations.QUOTAS[app_item['Category']]
+
+
+def _get_rank_key(app_item):
+    return not app_item['NoExams'], -app_item['SumScore'], app_item['Code']
+
+
+class DumpIndex:
+    '''
+        Competition lists per program and list (quota, or FullCost for paid applications) sorted by rank,
+        and applications per applicant sorted by priority. Only the fields the endpoints return are kept.
+    '''
+
+    def __init__(self, dump):
+        self.date = dump['meta']['date']
+        self.programs = dict()
+        self.applicants = dict()
+        ranked = dict()
+        for human, human_item in dump['data'].items():
+            for app_item in human_item.values():
+                lists = ranked.setdefault(app_item['TrainingDirection'], dict())
+                lists.setdefault(_get_list_name(app_item), []).append(app_item)
+
+        ranks = dict()
+        for program, lists in ranked.items():
+            self.programs[program] = dict()
+            for name, app_items in lists.items():
+                app_items.sort(key=_get_rank_key)
+                self.programs[program][name] = [
+                    {'rank': rank, **{field: app_item[field] for field in PROGRAM_FIELDS}}
+                    for rank, app_item in enumerate(app_items, start=1)]
+                for rank, app_item in enumerate(app_items, start=1):
+                    ranks[(app_item['Code'], program)] = (name, rank)
+
+        for human, human_item in dump['data'].items():
+            applications = []
+            for app_item in sorted(human_item.values(), key=lambda item: item['SelectedPriority']):
+                name, rank = ranks[(human, app_item['TrainingDirection'])]
+                applications.append({**{field: app_item.get(field) for field in APPLICANT_FIELDS},
+                                     'list': name, 'rank': rank})
+            self.applicants[human] = applications
+
+    @staticmethod
+    def _get_page(items, offset, limit):
+        return {
+            'total': len(items),
+            'offset': offset,
+            'limit': limit,
+            'items': items[offset:offset + limit],
+        }
+
+    def get_program(self, program, name, offset, limit):
+        if program not in self.programs:
+            raise KeyError(f'Program {program!r} not found')
+        lists = self.programs[program]
+        return {
+            'program': program,
+            'list': name,
+            'lists': {list_name: len(items) for list_name, items in lists.items()},
+            'date': self.date,
+            **self._get_page(lists.get(name, []), offset, limit),
+        }
+
+    def get_applicant(self, code, offset, limit):
+        if code not in self.applicants:
+            raise KeyError(f'Applicant {code!r} not found')
+        return {
+            'code': code,
+            'date': self.date,
+            **self._get_page(self.applicants[code], offset, limit),
+        }
+
+
+class DrilldownIndexes:
+    '''
+        DumpIndex of the latest dump, built once per process when latest.json changes.
+    '''
+    LIST_NAMES = tuple(MainPageCalculations.QUOTAS.values()) + (FULL_COST,)
+
+    def __init__(self, path=StudentsDataFetcher.LATEST_DUMP_PATH):
+        self.path = path
+        self.index = None
+        self.key = None
+        self.lock = asyncio.Lock()
+
+    def _get_key(self):
+        stat = os.stat(self.path)
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+    def _build(self):
+        with open(self.path, 'r', encoding='utf-8') as f:
+            return DumpIndex(json.load(f))
+
+    async def get(self):
+        try:
+            key = self._get_key()
+        except FileNotFoundError:
+            raise KeyError('No dump has been fetched yet')
+        if key != self.key:
+            async with self.lock:
+                if key != self.key:
+                    self.index = await asyncio.to_thread(self._build)
+                    self.key = key
+        return self.index
@@ -0,0 +1,72 @@
+import os
+import sqlite3
+from pathlib import Path
+
+
+class FirstSeenIndex:
+    '''
+        First download date of every current application, keyed by (Code, TrainingDirection),
+        in an SQLite table next to latest.json. Each cycle replaces the key set in bulk:
+        keys seen before keep their date, new keys get the fetching date, vanished keys are dropped,
+        so a reappearing application starts over exactly as it did when the date was taken from the previous dump.
+    '''
+    PATH = (Path(os.path.abspath(__file__))).parent.parent / 'data/first_seen.sqlite3'
+
+    def __init__(self, path=PATH):
+        self.path = path
+
+    def _connect(self):
+        connection = sqlite3.connect(self.path)
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute('''
+            CREATE TABLE IF NOT EXISTS first_seen (
+                code TEXT NOT NULL,
+                direction TEXT NOT NULL,
+                date TEXT NOT NULL,
+                PRIMARY KEY (code, direction)
+            ) WITHOUT ROWID
+        ''')
+        return connection
+
+    def is_empty(self):
+        connection = self._connect()
+        try:
+            return connection.execute('SELECT 1 FROM first_seen LIMIT 1').fetchone() is None
+        finally:
+            connection.close()
+
+    def seed(self, data):
+        '''
+            Fills an empty index from an existing dump, so switching to the index keeps the dates already published.
+        '''
+        connection = self._connect()
+        try:
+            with connection:
+                connection.executemany(
+                    'INSERT OR IGNORE INTO first_seen VALUES (?, ?, ?)',
+                    ((code, direction, application['firstDownloadDate'])
+                     for code, directions in data.items() for direction, application in directions.items()))
+        finally:
+            connection.close()
+
+    def update(self, keys, date_str):
+        '''
+            Replaces the indexed keys with keys (an iterable of (code, direction)) and returns {(code, direction): date}.
+        '''
+        connection = self._connect()
+        try:
+            with connection:
+                connection.execute('CREATE TEMP TABLE current (code TEXT, direction TEXT, PRIMARY KEY (code, direction))')
+                connection.executemany('INSERT OR IGNORE INTO current VALUES (?, ?)', keys)
+                connection.execute('''
+                    DELETE FROM first_seen WHERE NOT EXISTS (
+                        SELECT 1 FROM current WHERE current.code = first_seen.code AND current.direction = first_seen.direction
+                    )
+                ''')
+                connection.execute('INSERT OR IGNORE INTO first_seen SELECT code, direction, ? FROM current', (date_str,))
+                rows = connection.execute('SELECT code, direction, date FROM first_seen')
+                # Few distinct dates, shared instead of one string per application
+                dates = dict()
+                return {(code, direction): dates.setdefault(date, date) for code, direction, date in rows}
+        finally:
+            connection.close()
@@ -0,0 +1,75 @@
+import os
+import asyncio
+from collections import OrderedDict
+from datetime import datetime, time
+
+from pytz import utc
+
+from app.history import DumpHistory
+from app.offload import CalculationPool
+from app.utils import LOCAL_TIMEZONE, StudentsDataFetcher
+
+
+class HistoricalPages:
+    '''
+        Main page snapshots computed for dumps from the history, the most recently requested ones kept in an LRU cache.
+    '''
+    CACHE_SIZE = int(os.environ.get('HISTORY_CACHE_SIZE', '16'))
+
+    def __init__(self, dumps_dir=StudentsDataFetcher.DUMPS_DIR, pool=None):
+        self.history = DumpHistory(dumps_dir)
+        self.pool = pool or CalculationPool()
+        self.cache = OrderedDict()
+        # Dump number -> task calculating its snapshot
+        self.calculations = dict()
+
+    def resolve(self, at):
+        '''
+            `at` is a dump number or an ISO date/timestamp. Timestamps without a timezone are local
+            (Asia/Vladivostok), a bare date means the end of that day.
+        '''
+        if at.isdigit():
+            if int(at) not in self.history.get_numbers():
+                raise KeyError(f'Dump {at} not found')
+            return int(at)
+        try:
+            moment = datetime.fromisoformat(at)
+        except ValueError:
+            raise ValueError(f'Expected a dump number or an ISO date, got {at!r}')
+        if len(at) == len('YYYY-MM-DD'):
+            moment = datetime.combine(moment.date(), time.max)
+        if moment.tzinfo is None:
+            moment = LOCAL_TIMEZONE.localize(moment)
+        number = self.history.find_number(moment.astimezone(utc).strftime('%Y-%m-%d %H:%M:%S'))
+        if number is None:
+            raise KeyError(f'No dump taken before {at}')
+        return number
+
+    def _forget_calculation(self, number, task):
+        self.calculations.pop(number, None)
+        if not task.cancelled() and task.exception() is not None:
+            print(f'Calculating main page data for historical dump {number} failed: {task.exception()!r}')
+
+    async def _calculate(self, number):
+        snapshot = self.cache[number] = await self.pool.get_historical_page(self.history.dumps_dir, number)
+        while len(self.cache) > self.CACHE_SIZE:
+            self.cache.popitem(last=False)
+        return snapshot
+
+    def calculate(self, number):
+        '''
+            Single flight: at most one calculation per dump number, every caller awaits the same task.
+        '''
+        task = self.calculations.get(number)
+        if task is None:
+            task = self.calculations[number] = asyncio.create_task(self._calculate(number))
+            task.add_done_callback(lambda done: self._forget_calculation(number, done))
+        return task
+
+    async def get(self, at):
+        number = await asyncio.to_thread(self.resolve, at)
+        if number in self.cache:
+            self.cache.move_to_end(number)
+            return self.cache[number]
+        # A caller that goes away does not cancel the calculation the others are waiting for
+        return await asyncio.shield(self.calculate(number))
@@ -0,0 +1,247 @@
+import os
+import re
+import json
+import mmap
+import tempfile
+from bisect import bisect_right
+from pathlib import Path
+
+from app.columnar import PREFIX, ColumnarDump, write_columnar
+from app.delta import diff_dumps
+
+META_RE = re.compile(r'"meta":\s*(\{[^{}]*\})')
+
+
+def read_json_dump_meta(path, prefix_size=4096):
+    '''
+        Reads `meta` of a JSON dump from the beginning of the file, without parsing the applications.
+    '''
+    with open(path, 'r', encoding='utf-8') as f:
+        match = META_RE.search(f.read(prefix_size))
+    if match is None:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)['meta']
+    return json.loads(match.group(1))
+
+
+def _get_digest(app_item):
+    # Independent of the field order, so a dump loaded back from a segment gets the same digests
+    try:
+        return hash(frozenset(app_item.items()))
+    except TypeError:
+        # Nested fields are not hashable
+        return hash(json.dumps(app_item, sort_keys=True, ensure_ascii=False))
+
+
+class DumpDigests:
+    '''
+        A dump with every application replaced by a hash of its fields: enough for diff_dumps to tell
+        what changed since, at a small part of the memory. Hashes only compare within one process.
+    '''
+
+    def __init__(self, dump):
+        self.meta = dump['meta']
+        self.data = {code: {direction: _get_digest(app_item) for direction, app_item in human_item.items()}
+                     for code, human_item in dump['data'].items()}
+
+
+class DumpHistory:
+    '''
+        Campaign history stored as segment files <n>.hist in the dumps directory.
+        A segment starts with a full checkpoint of dump n followed by one delta blob
+        (changed and added applications plus removed keys) per later dump, until the next checkpoint.
+        Older single <n>.dump and <n>.json files are still readable.
+        index.json maps every dump number to its date, file and byte offset.
+    '''
+    CHECKPOINT_EVERY = int(os.environ.get('HISTORY_CHECKPOINT_EVERY', '24'))
+    SEGMENT_SUFFIX = '.hist'
+    SINGLE_SUFFIXES = ('.dump', '.json')
+    INDEX_NAME = 'index.json'
+
+    def __init__(self, dumps_dir):
+        self.dumps_dir = Path(dumps_dir)
+        self.index_path = self.dumps_dir / self.INDEX_NAME
+
+    def _get_segment_path(self, start):
+        return self.dumps_dir / f'{start}{self.SEGMENT_SUFFIX}'
+
+    def _get_files(self):
+        return {path.name: path.stat().st_size for path in self.dumps_dir.iterdir()
+                if path.stem.isdigit() and path.suffix in self.SINGLE_SUFFIXES + (self.SEGMENT_SUFFIX,)}
+
+    def read_segment_index(self, path):
+        '''
+            Describes every complete blob in a segment by its number, date, kind, byte offset and size.
+        '''
+        blobs = []
+        with open(path, 'rb') as f:
+            total = os.fstat(f.fileno()).st_size
+            offset = 0
+            while offset + PREFIX.size <= total:
+                f.seek(offset)
+                _, size, header_size = PREFIX.unpack(f.read(PREFIX.size))
+                if offset + size > total:
+                    break
+                header = json.loads(f.read(header_size))
+                blobs.append({
+                    'number': header['number'],
+                    'date': header['meta']['date'],
+                    'kind': header['kind'],
+                    'file': path.name,
+                    'offset': offset,
+                    'size': size,
+                })
+                offset += size
+        return blobs
+
+    def rebuild_index(self):
+        entries = dict()
+        for path in sorted(self.dumps_dir.iterdir()):
+            if not path.stem.isdigit() or path.suffix not in self.SINGLE_SUFFIXES:
+                continue
+            if path.suffix == '.dump':
+                with ColumnarDump.open(path) as blob:
+                    meta = blob.meta
+            else:
+                meta = read_json_dump_meta(path)
+            entries.setdefault(int(path.stem), {
+                'number': int(path.stem),
+                'date': meta['date'],
+                'kind': 'single',
+                'file': path.name,
+                'offset': 0,
+                'size': path.stat().st_size,
+            })
+        for path in sorted(self.dumps_dir.glob(f'*{self.SEGMENT_SUFFIX}'), key=lambda p: int(p.stem)):
+            for blob in self.read_segment_index(path):
+                entries[blob['number']] = blob
+        index = {
+            'files': self._get_files(),
+            'dumps': sorted(entries.values(), key=lambda entry: entry['number']),
+        }
+        self._write_index(index)
+        return index
+
+    def _write_index(self, index):
+        # The fetcher and historical page calculations in other processes may write the index at the same time
+        fd, tmp_path = tempfile.mkstemp(suffix='.tmp', prefix=f'{self.INDEX_NAME}.', dir=self.dumps_dir)
+        try:
+            with open(fd, 'w', encoding='utf-8') as f:
+                json.dump(index, f, ensure_ascii=False)
+            os.replace(tmp_path, self.index_path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+    def get_index(self):
+        '''
+            Index entries sorted by number. The index is rebuilt when dump files changed behind its back.
+        '''
+        if self.index_path.is_file():
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                index = json.load(f)
+            if index['files'] == self._get_files():
+                return index['dumps']
+        return self.rebuild_index()['dumps']
+
+    def get_numbers(self):
+        return [entry['number'] for entry in self.get_index()]
+
+    def get_next_number(self):
+        numbers = self.get_numbers()
+        return numbers[-1] + 1 if numbers else 1
+
+    def find_number(self, date):
+        '''
+            Number of the last dump taken at or before the UTC date string '%Y-%m-%d %H:%M:%S', None if there is none.
+        '''
+        entries = sorted(self.get_index(), key=lambda entry: entry['date'])
+        position = bisect_right([entry['date'] for entry in entries], date)
+        return entries[position - 1]['number'] if position > 0 else None
+
+    def append(self, number, dump, prev_digests=None, digests=None):
+        '''
+            Stores dump as the next blob. prev_digests, the DumpDigests of dump number - 1, spare loading it back
+            from its segment; digests, those of dump, spare computing them again.
+        '''
+        entries = {entry['number']: entry for entry in self.get_index()}
+        prev = entries.get(number - 1)
+        segment = [entry for entry in entries.values() if prev is not None and entry['file'] == prev['file']]
+        if prev is None or prev['kind'] == 'single' or segment[-1] is not prev \
+                or len(segment) >= self.CHECKPOINT_EVERY:
+            path = self._get_segment_path(number)
+            offset = 0
+            with open(path, 'wb') as f:
+                records = [app_item for human_item in dump['data'].values() for app_item in human_item.values()]
+                size = write_columnar(f, dump['meta'], records, kind='checkpoint', number=number)
+            kind = 'checkpoint'
+        else:
+            if prev_digests is None or prev_digests.meta['date'] != prev['date']:
+                prev_digests = DumpDigests(self.load(number - 1))
+            delta = diff_dumps(prev_digests.data, (digests or DumpDigests(dump)).data)
+            records = [dump['data'][code][direction] for code, direction in delta.added + delta.changed]
+            path = self.dumps_dir / prev['file']
+            offset = prev['offset'] + prev['size']
+            with open(path, 'ab') as f:
+                size = write_columnar(f, dump['meta'], records, kind='delta', number=number, removed=delta.removed)
+            kind = 'delta'
+
+        entries[number] = {
+            'number': number,
+            'date': dump['meta']['date'],
+            'kind': kind,
+            'file': path.name,
+            'offset': offset,
+            'size': size,
+        }
+        self._write_index({
+            'files': self._get_files(),
+            'dumps': sorted(entries.values(), key=lambda entry: entry['number']),
+        })
+        return size
+
+    def load(self, number):
+        entries = self.get_index()
+        entry = next((entry for entry in entries if entry['number'] == number), None)
+        if entry is None:
+            raise KeyError(f'Dump {number} not found in {self.dumps_dir}')
+        if entry['kind'] == 'single':
+            return self._load_single(self.dumps_dir / entry['file'])
+        blobs = [e for e in entries if e['file'] == entry['file'] and e['number'] <= number]
+        return self._load_from_segment(self.dumps_dir / entry['file'], blobs)
+
+    @staticmethod
+    def _load_from_segment(path, blobs):
+        with open(path, 'rb') as f:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            dump = None
+            for entry in blobs:
+                blob = ColumnarDump(buffer, entry['offset'])
+                if entry['kind'] == 'checkpoint':
+                    dump = blob.to_dump()
+                else:
+                    DumpHistory._apply_delta(dump, blob)
+                blob.buffer.release()
+        finally:
+            buffer.close()
+        return dump
+
+    @staticmethod
+    def _apply_delta(dump, blob):
+        data = dump['data']
+        for code, direction in blob.header['removed']:
+            del data[code][direction]
+            if not data[code]:
+                del data[code]
+        for record in blob.records():
+            data.setdefault(record['Code'], {})[record['TrainingDirection']] = record
+        dump['meta'] = blob.meta
+
+    @staticmethod
+    def _load_single(path):
+        if path.suffix == '.dump':
+            with ColumnarDump.open(path) as blob:
+                return blob.to_dump()
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
@@ -0,0 +1,31 @@
+import os
+import fcntl
+
+
+class LeaderLock:
+    '''
+        Non-blocking exclusive file lock electing the one worker that fetches and computes.
+        The lock is held until the process exits, then another worker can take it over.
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        self.fd = None
+
+    @property
+    def is_leader(self):
+        return self.fd is not None
+
+    def acquire(self):
+        if self.fd is not None:
+            return True
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return False
+        os.ftruncate(fd, 0)
+        os.write(fd, str(os.getpid()).encode())
+        self.fd = fd
+        return True
@@ -1,11 +1,25 @@
+import os
+import time
 import asyncio
-from fastapi import FastAPI
+from pathlib import Path
+from fastapi import FastAPI, HTTPException, Query, Request
 from fastapi_utils.tasks import repeat_every
 from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import PlainTextResponse
 from datetime import timedelta
 
-from app.utils import StudentsDataFetcher, get_latest_dump_date, get_utc_date
 from app.calculations import MainPageCalculations
+from app.utils import StudentsDataFetcher, get_utc_date, strptime_to_utc
+from app.history import read_json_dump_meta
+from app.drilldown import DrilldownIndexes
+from app.historical import HistoricalPages
+from app.offload import CalculationPool
+from app.push import MainPageUpdates
+from app.sections import MainPageSections
+from app.snapshot import SharedSnapshot, Snapshot
+from app.leader import LeaderLock
+from app.metrics import (CYCLES, PEAK_RSS_BYTES, REQUEST_SECONDS, STAGE_SECONDS, get_peak_rss, registry,
+                         reset_peak_rss)
 
 origins = ["https://pk23.dvfu.ru", "*"]
 
@@ -18,33 +32,246 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-main_page_data: dict | None = None
+DATA_DIR = (Path(os.path.abspath(__file__))).parent.parent / 'data'
+SNAPSHOT_WAIT = int(os.environ.get('SNAPSHOT_WAIT', '60'))
+SERVE_STALE = os.environ.get('SERVE_STALE', 'true').lower() == 'true'
+UPDATE_INTERVAL = int(os.environ.get('UPDATE_INTERVAL', str(60 * 90)))
+# latest.json younger than this is calculated as is on startup instead of fetched again
+DUMP_MAX_AGE = int(os.environ.get('DUMP_MAX_AGE', str(60 * 120)))
+
+# With several gunicorn workers only the leader fetches and computes, the rest serve its shared snapshot
+leader = LeaderLock(DATA_DIR / 'leader.lock')
+shared_snapshot = SharedSnapshot(DATA_DIR / 'snapshot.bin')
+calculation_pool = CalculationPool()
+historical_pages = HistoricalPages(pool=calculation_pool)
+main_page_sections = MainPageSections(shared_snapshot, pool=calculation_pool)
+main_page_updates = MainPageUpdates(shared_snapshot)
+drilldown_indexes = DrilldownIndexes()
+# Kept between cycles along with the digests of the dump it fetched last
+fetcher = StudentsDataFetcher()
+# Dump version (meta date of latest.json) -> task calculating and publishing its snapshot
+refreshes = dict()
+dump_version = (None, None)
+
+
+def get_dump_version():
+    global dump_version
+    try:
+        stat = os.stat(StudentsDataFetcher.LATEST_DUMP_PATH)
+    except FileNotFoundError:
+        return None
+    key = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+    if dump_version[0] != key:
+        dump_version = (key, read_json_dump_meta(StudentsDataFetcher.LATEST_DUMP_PATH)['date'])
+    return dump_version[1]
+
+
+class MeasureMainPage:
+    '''
+        Latency of /main_page requests. Plain ASGI middleware: wrapped in a BaseHTTPMiddleware
+        every open event stream would take twice the memory.
+    '''
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        path = scope.get('path', '')
+        # Event streams stay open for as long as the dashboard does, their duration is not a latency
+        if scope['type'] != 'http' or path == '/main_page/events' \
+                or path != '/main_page' and not path.startswith('/main_page/'):
+            return await self.app(scope, receive, send)
+        started = time.perf_counter()
+        status = None
+
+        async def send_with_status(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            await send(message)
+
+        await self.app(scope, receive, send_with_status)
+        path = '/main_page' if path == '/main_page' else '/main_page/{section}'
+        REQUEST_SECONDS.observe(time.perf_counter() - started, path=path, status=status)
+        registry.maybe_flush()
+
+
+app.add_middleware(MeasureMainPage)
 
 
 @app.on_event("startup")
-@repeat_every(seconds=60*90, wait_first=False)
+async def check_vectorized_calculations():
+    if MainPageCalculations.VECTORIZED_REQUESTED and not MainPageCalculations.VECTORIZED:
+        print('VECTORIZED_CALCULATIONS is true, but numpy is not installed (poetry install -E vectorized). '
+              'Calculating without it...')
+
+
+@app.on_event("startup")
+@repeat_every(seconds=UPDATE_INTERVAL, wait_first=False)
 async def update_main_page():
+    if not leader.acquire():
+        print('Another worker is the leader. Serving its snapshot...')
+        return
     cur_time = await get_utc_date()
-    last_dump_date = await get_latest_dump_date()
-    if last_dump_date is not None and last_dump_date + timedelta(hours=2) > cur_time:
+    # Read from the beginning of latest.json, so a restart with a persisted snapshot parses nothing
+    version = await asyncio.to_thread(get_dump_version)
+    last_dump_date = None if version is None else await strptime_to_utc(version, '%Y-%m-%d %H:%M:%S')
+    if last_dump_date is not None and last_dump_date + timedelta(seconds=DUMP_MAX_AGE) > cur_time:
         print("Dump is fresh. Continue...")
+        await update_main_page_snapshot()
         return
-    fetcher = StudentsDataFetcher()
-    await fetcher.fetch_and_dump_students_data()
-    await asyncio.sleep(30)
-    global main_page_data
-    print('Initializing main page calculations...')
-    calc = MainPageCalculations()
+    try:
+        reset_peak_rss()
+        dump = await fetcher.fetch_and_dump_students_data()
+        PEAK_RSS_BYTES.set(get_peak_rss(), process='fetcher')
+        await update_main_page_snapshot(dump)
+    except Exception:
+        CYCLES.inc(result='failed')
+        raise
+    else:
+        # Without a new dump the page of the previous one is kept
+        CYCLES.inc(result='ok' if dump is not None else 'fetch_failed')
+    finally:
+        registry.flush()
+
+
+async def publish_main_page(dump=None):
     print('Calculating main page data...')
-    main_page_data = await calc.get_main_page_data()
+    # Calculated in the pool, the event loop only swaps the finished snapshot in
+    with STAGE_SECONDS.time(stage='calculate'):
+        snapshot = await calculation_pool.get_main_page(dump=dump)
+    with STAGE_SECONDS.time(stage='publish'):
+        await asyncio.to_thread(shared_snapshot.publish, snapshot)
+    return snapshot
+
+
+def _forget_refresh(version, task):
+    refreshes.pop(version, None)
+    if not task.cancelled() and task.exception() is not None:
+        print(f'Calculating main page data for dump {version} failed: {task.exception()!r}')
+
+
+def refresh_main_page(version, dump=None):
+    '''
+        Single flight: at most one calculation per dump version, every caller awaits the same task.
+    '''
+    task = refreshes.get(version)
+    if task is None:
+        task = refreshes[version] = asyncio.create_task(publish_main_page(dump))
+        task.add_done_callback(lambda done: _forget_refresh(version, done))
+    return task
+
+
+async def update_main_page_snapshot(dump=None):
+    '''
+        Publishes the snapshot of dump (just fetched and still in memory) or of latest.json, unless it is already there.
+    '''
+    version = dump['meta']['date'] if dump is not None else get_dump_version()
+    snapshot = shared_snapshot.get()
+    if version is None or (snapshot is not None and snapshot.version == version):
+        return snapshot
+    return await asyncio.shield(refresh_main_page(version, dump))
+
+
+@app.on_event("startup")
+async def start_main_page_updates():
+    main_page_updates.start()
+
+
+@app.on_event("shutdown")
+async def shutdown_calculation_pool():
+    await main_page_updates.stop()
+    calculation_pool.shutdown()
+
+
+async def get_main_page_snapshot():
+    snapshot = shared_snapshot.get()
+    version = get_dump_version()
+    if snapshot is not None and (version is None or snapshot.version == version):
+        return snapshot
+    if version is not None and leader.acquire():
+        refresh = refresh_main_page(version)
+        # With SERVE_STALE the previous snapshot is served while the new one is calculated
+        if snapshot is None or not SERVE_STALE:
+            return await asyncio.shield(refresh)
+        return snapshot
+    if snapshot is not None:
+        return snapshot
+    for _ in range(SNAPSHOT_WAIT):
+        await asyncio.sleep(1)
+        snapshot = shared_snapshot.get()
+        if snapshot is not None:
+            return snapshot
+    raise HTTPException(status_code=503, detail='Main page data is not calculated yet', headers={'Retry-After': '30'})
+
+
+def get_current_version():
+    version = get_dump_version()
+    if version is None:
+        raise HTTPException(status_code=503, detail='Main page data is not calculated yet', headers={'Retry-After': '30'})
+    return version
 
 
 @app.get("/main_page")
-async def main_page():
-    global main_page_data
-    if main_page_data is None:
-        print('Initializing main page calculations...')
-        calc = MainPageCalculations()
-        print('Calculating main page data...')
-        main_page_data = await calc.get_main_page_data()
-    return main_page_data
+async def main_page(request: Request, at: str | None = None, fields: str | None = None):
+    try:
+        sections = None if fields is None else main_page_sections.parse_fields(fields)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    if at is not None:
+        try:
+            snapshot = await historical_pages.get(at)
+        except KeyError as e:
+            raise HTTPException(status_code=404, detail=e.args[0])
+        except ValueError as e:
+            raise HTTPException(status_code=422, detail=str(e))
+        if sections is not None:
+            snapshot = Snapshot({section: snapshot.data[section] for section in sections}, snapshot.version)
+        return snapshot.to_response(request)
+    if sections is not None:
+        return (await main_page_sections.select(sections, get_current_version())).to_response(request)
+    return (await get_main_page_snapshot()).to_response(request)
+
+
+# Server-sent events: the main page as a `snapshot` event, then a JSON Patch `patch` event per recompute.
+# Registered before /main_page/{section}, which would take `events` for a section name
+app.add_route('/main_page/events', main_page_updates, methods=['GET'])
+
+
+@app.get("/main_page/{section}")
+async def main_page_section(request: Request, section: str):
+    if section not in MainPageSections.NAMES:
+        raise HTTPException(status_code=404, detail=f'Unknown section {section}, expected one of '
+                                                    f'{", ".join(MainPageSections.NAMES)}')
+    return (await main_page_sections.get(section, get_current_version())).to_response(request)
+
+
+@app.get("/metrics")
+async def metrics():
+    try:
+        snapshot_age = time.time() - os.stat(shared_snapshot.path).st_mtime
+    except FileNotFoundError:
+        snapshot_age = None
+    text = await asyncio.to_thread(registry.render, {
+        'snapshot_age_seconds': ('Seconds since the served main page snapshot was published', snapshot_age),
+    })
+    return PlainTextResponse(text, media_type='text/plain; version=0.0.4')
+
+
+@app.get("/programs/{training_direction:path}")
+async def program_applications(training_direction: str, list_name: str = Query('BudgetQuota', alias='list'),
+                               offset: int = Query(0, ge=0), limit: int = Query(50, ge=1, le=500)):
+    if list_name not in DrilldownIndexes.LIST_NAMES:
+        raise HTTPException(status_code=422, detail=f'list must be one of {", ".join(DrilldownIndexes.LIST_NAMES)}')
+    try:
+        return (await drilldown_indexes.get()).get_program(training_direction, list_name, offset, limit)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=e.args[0])
+
+
+@app.get("/applicants/{code}")
+async def applicant_applications(code: str, offset: int = Query(0, ge=0), limit: int = Query(50, ge=1, le=500)):
+    try:
+        return (await drilldown_indexes.get()).get_applicant(code, offset, limit)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=e.args[0])
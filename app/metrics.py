@@ -0,0 +1,246 @@
+import os
+import json
+import time
+import resource
+from contextlib import contextmanager
+from pathlib import Path
+
+METRICS_DIR = Path(os.environ.get('METRICS_DIR') or (Path(os.path.abspath(__file__))).parent.parent / 'data/metrics')
+PREFIX = 'admission_'
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    pairs = ','.join('{}="{}"'.format(k, str(v).replace('\\', '\\\\').replace('"', '\\"')) for k, v in labels)
+    return '{' + pairs + '}'
+
+
+class Metric:
+    TYPE = None
+
+    def __init__(self, name, help_):
+        self.name = PREFIX + name
+        self.help = help_
+        self.samples = dict()
+
+    @staticmethod
+    def _key(labels):
+        return tuple(sorted(labels.items()))
+
+    def state(self):
+        return {'type': self.TYPE, 'help': self.help,
+                'samples': [[list(map(list, key)), value] for key, value in self.samples.items()]}
+
+
+class Gauge(Metric):
+    TYPE = 'gauge'
+
+    def set(self, value, **labels):
+        self.samples[self._key(labels)] = value
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.set(time.perf_counter() - started, **labels)
+
+
+class Counter(Metric):
+    TYPE = 'counter'
+
+    def inc(self, value=1, **labels):
+        key = self._key(labels)
+        self.samples[key] = self.samples.get(key, 0) + value
+
+
+class Histogram(Metric):
+    TYPE = 'histogram'
+    BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+    def __init__(self, name, help_, buckets=BUCKETS):
+        super().__init__(name, help_)
+        self.buckets = list(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        if key not in self.samples:
+            self.samples[key] = {'buckets': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+        sample = self.samples[key]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                sample['buckets'][i] += 1
+        sample['sum'] += value
+        sample['count'] += 1
+
+    def state(self):
+        return {**super().state(), 'bounds': self.buckets}
+
+
+def _get_start_time(pid):
+    '''
+        Start time of a process in clock ticks since boot, None when it is not running or there is no /proc.
+    '''
+    try:
+        with open(f'/proc/{pid}/stat', 'rb') as f:
+            stat = f.read()
+    except OSError:
+        return None
+    # The command name in parentheses may contain spaces, starttime is the 20th field after it
+    return int(stat.rsplit(b')', 1)[1].split()[19])
+
+
+def get_process_id(pid):
+    '''
+        pid and start time: unlike a pid alone, it is not reused by a later process, e.g. in a restarted container.
+    '''
+    start_time = _get_start_time(pid)
+    return str(pid) if start_time is None else f'{pid}-{start_time}'
+
+
+class Registry:
+    '''
+        Metrics of one process. Every process (gunicorn workers, calculation workers) flushes its state
+        to <METRICS_DIR>/<pid>-<start time>.json, render merges the files of the live processes:
+        counters and histograms are summed, gauges are taken from the most recent file.
+    '''
+    FLUSH_INTERVAL = 5
+
+    def __init__(self, metrics_dir=METRICS_DIR):
+        self.metrics_dir = Path(metrics_dir)
+        self.metrics = dict()
+        self.flushed_at = 0
+        # (pid, process id), found again in a forked child
+        self.process = (None, None)
+
+    def _register(self, metric):
+        self.metrics[metric.name] = metric
+        return metric
+
+    def gauge(self, name, help_):
+        return self._register(Gauge(name, help_))
+
+    def counter(self, name, help_):
+        return self._register(Counter(name, help_))
+
+    def histogram(self, name, help_, buckets=Histogram.BUCKETS):
+        return self._register(Histogram(name, help_, buckets))
+
+    def _get_path(self):
+        pid = os.getpid()
+        if self.process[0] != pid:
+            self.process = (pid, get_process_id(pid))
+        return self.metrics_dir / f'{self.process[1]}.json'
+
+    def flush(self):
+        path = self._get_path()
+        self.metrics_dir.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix('.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({name: metric.state() for name, metric in self.metrics.items()}, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+        self.flushed_at = time.monotonic()
+
+    def maybe_flush(self):
+        if time.monotonic() - self.flushed_at >= self.FLUSH_INTERVAL:
+            self.flush()
+
+    def _read_states(self):
+        states = []
+        for path in self.metrics_dir.glob('*.json'):
+            try:
+                pid = int(path.stem.split('-')[0])
+                os.kill(pid, 0)
+            except (ValueError, ProcessLookupError):
+                path.unlink(missing_ok=True)
+                continue
+            except PermissionError:
+                pass
+            if get_process_id(pid) != path.stem:
+                # Left by an earlier process with the same pid
+                path.unlink(missing_ok=True)
+                continue
+            try:
+                with open(path, encoding='utf-8') as f:
+                    states.append((path.stat().st_mtime, json.load(f)))
+            except (OSError, ValueError):
+                continue
+        states.sort(key=lambda state: state[0])
+        return [state for _, state in states]
+
+    def _merge(self, states):
+        merged = dict()
+        for state in states:
+            for name, metric in state.items():
+                target = merged.setdefault(name, {**metric, 'samples': dict()})
+                for labels, value in metric['samples']:
+                    key = tuple(map(tuple, labels))
+                    if metric['type'] == 'gauge' or key not in target['samples']:
+                        target['samples'][key] = value
+                    elif metric['type'] == 'counter':
+                        target['samples'][key] += value
+                    else:
+                        current = target['samples'][key]
+                        target['samples'][key] = {
+                            'buckets': [a + b for a, b in zip(current['buckets'], value['buckets'])],
+                            'sum': current['sum'] + value['sum'],
+                            'count': current['count'] + value['count'],
+                        }
+        return merged
+
+    def render(self, extra_gauges=None):
+        '''
+            Prometheus text exposition of all live processes, extra_gauges {name: (help, value)} computed at scrape time.
+        '''
+        self.flush()
+        merged = self._merge(self._read_states())
+        for name, (help_, value) in (extra_gauges or dict()).items():
+            if value is not None:
+                merged[PREFIX + name] = {'type': 'gauge', 'help': help_, 'samples': {(): value}}
+
+        lines = []
+        for name, metric in merged.items():
+            lines.append(f'# HELP {name} {metric["help"]}')
+            lines.append(f'# TYPE {name} {metric["type"]}')
+            for labels, value in metric['samples'].items():
+                if metric['type'] != 'histogram':
+                    lines.append(f'{name}{_format_labels(labels)} {value}')
+                    continue
+                for bound, count in zip(metric['bounds'], value['buckets']):
+                    lines.append(f'{name}_bucket{_format_labels(labels + (("le", bound),))} {count}')
+                lines.append(f'{name}_bucket{_format_labels(labels + (("le", "+Inf"),))} {value["count"]}')
+                lines.append(f'{name}_sum{_format_labels(labels)} {value["sum"]}')
+                lines.append(f'{name}_count{_format_labels(labels)} {value["count"]}')
+        return '\n'.join(lines) + '\n'
+
+
+def reset_peak_rss():
+    # Linux only: writing 5 to clear_refs resets VmHWM, so the next reading is the peak of this cycle
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        pass
+
+
+def get_peak_rss():
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+registry = Registry()
+STAGE_SECONDS = registry.gauge('stage_duration_seconds', 'Duration of the last run of a pipeline stage')
+PAYLOAD_BYTES = registry.gauge('payload_bytes', 'Size of the last fetched or written payload')
+RECORDS = registry.gauge('records', 'Number of records in the last dump')
+PEAK_RSS_BYTES = registry.gauge('cycle_peak_rss_bytes', 'Peak resident memory of a process during its last cycle')
+CYCLES = registry.counter('cycles_total', 'Finished update cycles by outcome')
+REQUEST_SECONDS = registry.histogram('request_duration_seconds', 'Latency of served requests')
+PUSHED_BYTES = registry.counter('pushed_bytes_total', 'Bytes of server-sent main page events by event type')
@@ -0,0 +1,112 @@
+import os
+import asyncio
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from app.calculations import MainPageCalculations
+from app.history import DumpHistory
+from app.metrics import PAYLOAD_BYTES, PEAK_RSS_BYTES, STAGE_SECONDS, get_peak_rss, registry, reset_peak_rss
+from app.records import project_dump
+from app.snapshot import Snapshot
+
+# Calculations kept by the worker process between cycles, one per kind of page
+_calculations = dict()
+_locks = {'main': threading.Lock(), 'historical': threading.Lock(), 'sections': threading.Lock()}
+
+
+def _get_calculations(kind):
+    if kind not in _calculations:
+        _calculations[kind] = MainPageCalculations()
+    return _calculations[kind]
+
+
+def _to_snapshot_parts(page, version):
+    snapshot = Snapshot(page, version)
+    return snapshot.digest, snapshot.encodings, snapshot.version
+
+
+def compute_main_page(latest_dump_path=None, dump=None):
+    with _locks['main']:
+        reset_peak_rss()
+        calc = _get_calculations('main')
+        if latest_dump_path is not None:
+            calc.LATEST_DUMP_PATH = latest_dump_path
+        page = asyncio.run(calc.get_main_page_data(dump))
+        with STAGE_SECONDS.time(stage='serialize'):
+            digest, encodings, version = _to_snapshot_parts(page, calc.dump['meta']['date'])
+        for encoding, body in encodings.items():
+            PAYLOAD_BYTES.set(len(body), kind=f'snapshot_{encoding}')
+        PEAK_RSS_BYTES.set(get_peak_rss(), process='calculation')
+        registry.flush()
+    return digest, encodings, version
+
+
+def compute_main_page_section(section, latest_dump_path=None):
+    with _locks['sections']:
+        calc = _get_calculations('sections')
+        if latest_dump_path is not None:
+            calc.LATEST_DUMP_PATH = latest_dump_path
+        # The dump of the last main page calculation is reused when it is still the latest one
+        main = _calculations.get('main')
+        page = asyncio.run(calc.get_main_page_section_data(section, main.dump if main is not None else None))
+        return _to_snapshot_parts(page[section], calc.dump['meta']['date'])
+
+
+def compute_historical_page(dumps_dir, number):
+    dump = DumpHistory(dumps_dir).load(number)
+    with _locks['historical']:
+        page = asyncio.run(_get_calculations('historical').get_historical_page_data(dump))
+    page['dump_number'] = number
+    return _to_snapshot_parts(page, dump['meta']['date'])
+
+
+class CalculationPool:
+    '''
+        Runs page calculations and their serialization outside the event loop and returns ready snapshots.
+        With CALC_WORKERS > 0 they run in a pool of spawned processes, each keeping its own MainPageCalculations,
+        so with a single worker the incremental state survives between cycles. CALC_WORKERS=0 uses a thread instead.
+    '''
+    WORKERS = int(os.environ.get('CALC_WORKERS', '1'))
+
+    def __init__(self, workers=None):
+        self.workers = self.WORKERS if workers is None else workers
+        self.executor = None
+
+    def _get_executor(self):
+        if self.executor is None:
+            self.executor = ProcessPoolExecutor(max_workers=self.workers,
+                                                mp_context=multiprocessing.get_context('spawn'))
+        return self.executor
+
+    async def run(self, function, *args):
+        if self.workers == 0:
+            return Snapshot.from_encodings(*await asyncio.to_thread(function, *args))
+        try:
+            parts = await asyncio.get_running_loop().run_in_executor(self._get_executor(), function, *args)
+        except BrokenProcessPool:
+            # A worker died (e.g. killed for memory), the next call starts a fresh pool
+            self.shutdown()
+            raise
+        return Snapshot.from_encodings(*parts)
+
+    async def get_main_page(self, latest_dump_path=None, dump=None):
+        '''
+            dump, when given, is handed over in memory (pickled to a worker process) instead of read from latest.json.
+            It is projected to Application records first, so only the fields the calculations read are pickled.
+        '''
+        if dump is not None:
+            dump = await asyncio.to_thread(project_dump, dump)
+        return await self.run(compute_main_page, latest_dump_path, dump)
+
+    async def get_main_page_section(self, section, latest_dump_path=None):
+        return await self.run(compute_main_page_section, section, latest_dump_path)
+
+    async def get_historical_page(self, dumps_dir, number):
+        return await self.run(compute_historical_page, dumps_dir, number)
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
@@ -0,0 +1,265 @@
+import os
+import copy
+import json
+import asyncio
+
+from app.metrics import PUSHED_BYTES
+
+
+def _escape(key):
+    return str(key).replace('~', '~0').replace('/', '~1')
+
+
+def _get_size(value):
+    return len(json.dumps(value, ensure_ascii=False, separators=(',', ':')))
+
+
+def _get_id_key(old, new):
+    '''
+        Key identifying the items of two arrays of objects: one with unique string values in both arrays.
+    '''
+    if not old or not new or not all(isinstance(item, dict) for items in (old, new) for item in items):
+        return None
+    for key in old[0]:
+        for items in (old, new):
+            values = [item.get(key) for item in items]
+            if not all(isinstance(value, str) for value in values) or len(set(values)) != len(values):
+                break
+        else:
+            return key
+    return None
+
+
+def _diff_by_key(old, new, key, path):
+    '''
+        Operations turning the array old into new with items matched by key: removals, then every position
+        in order gets its item added or moved in and patched, so each operation sees the indexes it names.
+    '''
+    patch = []
+    old_items = {item[key]: item for item in old}
+    new_ids = {item[key] for item in new}
+    current = [item[key] for item in old]
+    for i in reversed(range(len(current))):
+        if current[i] not in new_ids:
+            patch.append({'op': 'remove', 'path': f'{path}/{i}'})
+            del current[i]
+    for i, item in enumerate(new):
+        if item[key] not in old_items:
+            patch.append({'op': 'add', 'path': f'{path}/{i}', 'value': item})
+            current.insert(i, item[key])
+            continue
+        j = current.index(item[key], i)
+        if j != i:
+            patch.append({'op': 'move', 'from': f'{path}/{j}', 'path': f'{path}/{i}'})
+            current.insert(i, current.pop(j))
+        patch.extend(diff(old_items[item[key]], item, f'{path}/{i}'))
+    return patch
+
+
+def diff(old, new, path=''):
+    '''
+        RFC 6902 JSON Patch turning old into new. Objects are compared key by key; arrays of objects
+        with an identifying key (programs sorted by their counts) item by item with moves for reordering,
+        other arrays of the same length item by item. A value is replaced whole when it differs in type,
+        or when the operations for its changes would be larger than the value itself.
+    '''
+    replace = [{'op': 'replace', 'path': path, 'value': new}]
+    if type(old) is not type(new):
+        return replace
+    if isinstance(old, dict):
+        patch = [{'op': 'remove', 'path': f'{path}/{_escape(key)}'} for key in old if key not in new]
+        for key, value in new.items():
+            if key not in old:
+                patch.append({'op': 'add', 'path': f'{path}/{_escape(key)}', 'value': value})
+            else:
+                patch.extend(diff(old[key], value, f'{path}/{_escape(key)}'))
+    elif isinstance(old, list) and (key := _get_id_key(old, new)) is not None:
+        patch = _diff_by_key(old, new, key, path)
+    elif isinstance(old, list) and len(old) == len(new):
+        patch = [op for i, (a, b) in enumerate(zip(old, new)) for op in diff(a, b, f'{path}/{i}')]
+    else:
+        return [] if old == new else replace
+    if len(patch) > 1 and _get_size(patch) > _get_size(replace):
+        return replace
+    return patch
+
+
+def _resolve(document, path):
+    '''
+        Container and key or index a JSON Pointer names, None for the whole document.
+    '''
+    *parents, last = [token.replace('~1', '/').replace('~0', '~') for token in path.split('/')[1:]] or [None]
+    target = document
+    for token in parents:
+        target = target[int(token)] if isinstance(target, list) else target[token]
+    if isinstance(target, list):
+        last = int(last)
+    return target, last
+
+
+def apply_patch(document, patch):
+    '''
+        Applies an RFC 6902 patch of add, remove, replace and move operations, as a dashboard would.
+    '''
+    document = copy.deepcopy(document)
+    for op in patch:
+        if op['op'] == 'move':
+            source, key = _resolve(document, op['from'])
+            value = source.pop(key)
+        elif op['op'] != 'remove':
+            value = op['value']
+        target, key = _resolve(document, op['path'])
+        if key is None:
+            document = value
+        elif op['op'] == 'remove':
+            del target[key]
+        elif op['op'] in ('add', 'move') and isinstance(target, list):
+            target.insert(key, value)
+        else:
+            target[key] = value
+    return document
+
+
+def _format_event(event, event_id, data):
+    return b''.join((b'id: ', event_id.encode(), b'\nevent: ', event.encode(), b'\ndata: ', data, b'\n\n'))
+
+
+class MainPageUpdates:
+    '''
+        Main page pushed to dashboards as server-sent events: the whole snapshot on connect,
+        then a JSON Patch from the previous snapshot after every recompute. Event ids are snapshot digests,
+        so a client reconnecting with the current Last-Event-ID is not sent the snapshot again.
+        Every worker watches the shared snapshot itself and encodes each event once for all its subscribers.
+    '''
+    POLL_SECONDS = float(os.environ.get('PUSH_POLL_SECONDS', '1'))
+    KEEPALIVE_SECONDS = 25
+    # A subscriber this many events behind gets the whole snapshot instead
+    QUEUE_SIZE = 4
+
+    def __init__(self, shared_snapshot):
+        self.shared_snapshot = shared_snapshot
+        self.snapshot = None
+        self.snapshot_event = None
+        self.subscribers = set()
+        self.task = None
+
+    def start(self):
+        if self.task is None:
+            self.task = asyncio.create_task(self._watch())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+
+    async def _watch(self):
+        while True:
+            try:
+                await self.update(self.shared_snapshot.get())
+            except Exception as e:
+                print(f'Pushing main page update failed: {e!r}')
+            await asyncio.sleep(self.POLL_SECONDS)
+
+    @staticmethod
+    def _get_patch_event(previous, snapshot):
+        patch = diff(previous.data, snapshot.data)
+        return _format_event('patch', snapshot.digest,
+                             json.dumps(patch, ensure_ascii=False, separators=(',', ':')).encode('utf-8'))
+
+    async def update(self, snapshot):
+        previous = self.snapshot
+        if snapshot is None or snapshot is previous:
+            return
+        if self.subscribers and (previous is None or previous.digest != snapshot.digest):
+            item = None
+            if previous is not None:
+                event = await asyncio.to_thread(self._get_patch_event, previous, snapshot)
+                item = (previous.digest, snapshot.digest, event)
+            for queue in self.subscribers:
+                self._put(queue, item)
+        self.snapshot = snapshot
+        self.snapshot_event = None
+
+    @staticmethod
+    def _put(queue, item):
+        try:
+            queue.put_nowait(item)
+        except asyncio.QueueFull:
+            # Patches can not be skipped, the subscriber starts over from the current snapshot
+            while not queue.empty():
+                queue.get_nowait()
+            queue.put_nowait(None)
+
+    def _get_snapshot_event(self):
+        if self.snapshot_event is None:
+            self.snapshot_event = _format_event('snapshot', self.snapshot.digest,
+                                                bytes(self.snapshot.encodings['identity']))
+        return self.snapshot_event
+
+    async def subscribe(self, last_event_id=None):
+        '''
+            Server-sent events of one subscriber, each as bytes ready to be written.
+        '''
+        queue = asyncio.Queue(self.QUEUE_SIZE)
+        self.subscribers.add(queue)
+        try:
+            digest = last_event_id
+            # None in the queue: the subscriber can not be patched and needs the whole snapshot
+            item = None
+            while True:
+                if item is None and self.snapshot is not None and self.snapshot.digest != digest:
+                    event = self._get_snapshot_event()
+                    digest = self.snapshot.digest
+                    PUSHED_BYTES.inc(len(event), event='snapshot')
+                    yield event
+                item = await queue.get()
+                if item is None:
+                    continue
+                base, target, event = item
+                # Patches queued before the subscriber got its snapshot do not apply to it
+                if base == digest:
+                    digest = target
+                    PUSHED_BYTES.inc(len(event), event='patch')
+                    yield event
+        finally:
+            self.subscribers.discard(queue)
+
+    async def __call__(self, scope, receive, send):
+        '''
+            ASGI endpoint streaming subscribe() to one client. Plain ASGI rather than a StreamingResponse,
+            so an idle subscriber is only a pending queue read and a pending receive: about a third of the memory.
+        '''
+        last_event_id = dict(scope['headers']).get(b'last-event-id')
+        events = self.subscribe(None if last_event_id is None else last_event_id.decode('latin-1'))
+        await send({'type': 'http.response.start', 'status': 200, 'headers': [
+            (b'content-type', b'text/event-stream; charset=utf-8'),
+            (b'cache-control', b'no-cache'),
+            # Proxies must not buffer the stream
+            (b'x-accel-buffering', b'no'),
+        ]})
+        disconnect = asyncio.create_task(_wait_for_disconnect(receive))
+        event = None
+        try:
+            while True:
+                if event is None:
+                    event = asyncio.ensure_future(anext(events))
+                done, _ = await asyncio.wait((event, disconnect), timeout=self.KEEPALIVE_SECONDS,
+                                             return_when=asyncio.FIRST_COMPLETED)
+                if disconnect in done:
+                    break
+                body = b': keepalive\n\n' if event not in done else event.result()
+                if event in done:
+                    event = None
+                await send({'type': 'http.response.body', 'body': body, 'more_body': True})
+        finally:
+            disconnect.cancel()
+            if event is not None:
+                event.cancel()
+                await asyncio.gather(event, return_exceptions=True)
+            await events.aclose()
+
+
+async def _wait_for_disconnect(receive):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
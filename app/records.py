@@ -0,0 +1,96 @@
+import json
+from operator import attrgetter
+from sys import intern
+
+QUOTA_COUNT_FIELDS = ('BudgetQuotaCount', 'TargetQuotaCount', 'SpecialQuotaCount', 'SeparateQuotaCount')
+CATEGORICAL_FIELDS = ('Category', 'DocumentDelivery', 'FinancingSource', 'AdmissionCampaignType',
+                      'TrainingDirection', 'Region', 'firstDownloadDate')
+FIELDS = CATEGORICAL_FIELDS + (
+    'Code', 'AtestOrig', 'NoExams', 'SelectedPriority', 'SumScore',
+    'Test1Score', 'Test2Score', 'Test3Score', 'Test4Score', 'firstDownloadDay',
+) + QUOTA_COUNT_FIELDS
+
+
+class Application:
+    '''
+        The fields of an upstream application the calculations read, everything else is dropped at ingest.
+        Categorical strings are interned, so all records of a program, quota or region share one string.
+        Fields are read as attributes; firstDownloadDay is None in dumps written before it was stored.
+    '''
+    __slots__ = FIELDS
+
+    def __init__(self, app_item):
+        self.Category = intern(app_item['Category'])
+        self.DocumentDelivery = intern(app_item['DocumentDelivery'])
+        self.FinancingSource = intern(app_item['FinancingSource'])
+        self.AdmissionCampaignType = intern(app_item['AdmissionCampaignType'])
+        self.TrainingDirection = intern(app_item['TrainingDirection'])
+        region = app_item['Region']
+        self.Region = intern(region) if type(region) is str else region
+        self.firstDownloadDate = intern(app_item['firstDownloadDate'])
+        self.Code = app_item['Code']
+        self.AtestOrig = app_item['AtestOrig']
+        self.NoExams = app_item['NoExams']
+        self.SelectedPriority = app_item['SelectedPriority']
+        self.SumScore = app_item['SumScore']
+        self.Test1Score = app_item['Test1Score']
+        self.Test2Score = app_item['Test2Score']
+        self.Test3Score = app_item['Test3Score']
+        self.Test4Score = app_item['Test4Score']
+        self.firstDownloadDay = app_item.get('firstDownloadDay')
+        self.BudgetQuotaCount = app_item['BudgetQuotaCount']
+        self.TargetQuotaCount = app_item['TargetQuotaCount']
+        self.SpecialQuotaCount = app_item['SpecialQuotaCount']
+        self.SeparateQuotaCount = app_item['SeparateQuotaCount']
+
+    def __getstate__(self):
+        return _get_values(self)
+
+    def __setstate__(self, state):
+        # Pickled as a plain tuple, which is how dumps reach the calculation workers
+        (self.Category, self.DocumentDelivery, self.FinancingSource, self.AdmissionCampaignType,
+         self.TrainingDirection, self.Region, self.firstDownloadDate, self.Code, self.AtestOrig, self.NoExams,
+         self.SelectedPriority, self.SumScore, self.Test1Score, self.Test2Score, self.Test3Score, self.Test4Score,
+         self.firstDownloadDay, self.BudgetQuotaCount, self.TargetQuotaCount, self.SpecialQuotaCount,
+         self.SeparateQuotaCount) = state
+
+    def __eq__(self, other):
+        if not isinstance(other, Application):
+            return NotImplemented
+        return _get_values(self) == _get_values(other)
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f'Application({self.Code!r}, {self.TrainingDirection!r})'
+
+
+_get_values = attrgetter(*FIELDS)
+
+
+def project_data(data):
+    '''
+        {Code: {TrainingDirection: Application}} from the dicts of a formatted dump, records already projected are kept.
+    '''
+    return {code: {intern(direction): app_item if isinstance(app_item, Application) else Application(app_item)
+                   for direction, app_item in human_item.items()}
+            for code, human_item in data.items()}
+
+
+def project_dump(dump):
+    return {
+        'meta': dump['meta'],
+        'data': project_data(dump['data']),
+    }
+
+
+def _project_object(obj):
+    return Application(obj) if 'Code' in obj and 'TrainingDirection' in obj else obj
+
+
+def loads_dump(string):
+    '''
+        Parses a formatted dump straight into Application records: every application dict is projected
+        as soon as it is decoded, so the full upstream records are never all in memory at once.
+    '''
+    return project_dump(json.loads(string, object_hook=_project_object))
@@ -0,0 +1,73 @@
+import re
+import json
+import hashlib
+
+from rapidfuzz import process
+from rapidfuzz.distance import Levenshtein
+
+
+class RegionMatcher:
+    '''
+        Resolves raw `Region` strings to ISO codes from regions_map.json.
+        Every distinct raw string is matched once and remembered in the alias table,
+        which can be persisted and reused as long as regions_map.json does not change.
+    '''
+    NORMALIZATION = [re.compile(reg_exp) for reg_exp in (
+        r"\s*область\s*",
+        r"\s+обл\s*",
+        r"\s*край\s*",
+        r"\s*республика\s*",
+        r"\s+респ\s*",
+        r"\s+г\s*",
+        r"\s+аобл\s*",
+        r"\s+ао\s*",
+        r"\s*автономная область\s*",
+        r"\s*автономный округ\s*",
+    )]
+    MAX_DISTANCE = 9
+
+    def __init__(self, regions_map, aliases=None):
+        self.regions_map = regions_map
+        self.choices = list(regions_map.keys())
+        self.iso_codes = list(regions_map.values())
+        self.version = self.get_version(regions_map)
+        self.aliases = dict()
+        if aliases is not None and aliases.get('version') == self.version:
+            self.aliases = aliases['aliases']
+        self.learned = 0
+
+    @staticmethod
+    def get_version(regions_map):
+        return hashlib.sha1(json.dumps(regions_map, ensure_ascii=False, sort_keys=True).encode('utf-8')).hexdigest()
+
+    def normalize(self, region):
+        result = region.lower()
+        for reg_exp in self.NORMALIZATION:
+            result = reg_exp.sub("", result)
+        return result
+
+    def resolve(self, region):
+        if region in self.aliases:
+            return self.aliases[region]
+        iso_code = self._find_best_match(self.normalize(region)) if region else None
+        self.aliases[region] = iso_code
+        self.learned += 1
+        return iso_code
+
+    def resolve_many(self, regions):
+        return {region: self.resolve(region) for region in regions}
+
+    def _find_best_match(self, address):
+        if not address:
+            return None
+        match = process.extractOne(address, self.choices, scorer=Levenshtein.distance,
+                                   score_cutoff=self.MAX_DISTANCE)
+        if match is None:
+            return None
+        return self.iso_codes[match[2]]
+
+    def dump_aliases(self):
+        return {
+            'version': self.version,
+            'aliases': self.aliases,
+        }
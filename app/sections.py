@@ -0,0 +1,70 @@
+import asyncio
+
+from app.calculations import MainPageCalculations
+from app.offload import CalculationPool
+from app.snapshot import Snapshot
+
+
+class MainPageSections:
+    '''
+        Sections of the main page for the current dump version, each computed on first request and cached on its own.
+        A section is sliced from the full snapshot when that is already published for the version,
+        otherwise it is calculated in the pool from only the accumulators it needs.
+        Selections of several sections (`fields=`) are cached as well, all of it dropped when the version changes.
+    '''
+    NAMES = tuple(MainPageCalculations.SECTIONS)
+
+    def __init__(self, shared_snapshot, pool=None):
+        self.shared_snapshot = shared_snapshot
+        self.pool = pool or CalculationPool()
+        self.version = None
+        # Section -> task resolving to its snapshot, shared by concurrent requests
+        self.sections = dict()
+        self.selections = dict()
+
+    def _use_version(self, version):
+        if version != self.version:
+            self.version = version
+            self.sections = dict()
+            self.selections = dict()
+
+    def parse_fields(self, fields):
+        '''
+            Section names from a comma separated list, deduplicated and in page order.
+        '''
+        names = {name.strip() for name in fields.split(',') if name.strip()}
+        unknown = names.difference(self.NAMES)
+        if unknown or not names:
+            raise ValueError(f'fields must be a comma separated list of {", ".join(self.NAMES)}')
+        return tuple(name for name in self.NAMES if name in names)
+
+    async def get(self, section, version):
+        self._use_version(version)
+        task = self.sections.get(section)
+        if task is None:
+            task = self.sections[section] = asyncio.create_task(self._compute(section, version))
+            task.add_done_callback(lambda done: self._forget_failed(section, done))
+        return await asyncio.shield(task)
+
+    def _forget_failed(self, section, task):
+        if task.cancelled() or task.exception() is not None:
+            if self.sections.get(section) is task:
+                del self.sections[section]
+
+    async def _compute(self, section, version):
+        snapshot = self.shared_snapshot.get()
+        if snapshot is not None and snapshot.version == version:
+            return await asyncio.to_thread(lambda: Snapshot(snapshot.data[section], version))
+        print(f'Calculating main page section {section}...')
+        return await self.pool.get_main_page_section(section)
+
+    async def select(self, fields, version):
+        self._use_version(version)
+        snapshot = self.selections.get(fields)
+        if snapshot is None:
+            sections = await asyncio.gather(*(self.get(section, version) for section in fields))
+            page = {section: snapshot.data for section, snapshot in zip(fields, sections)}
+            snapshot = await asyncio.to_thread(Snapshot, page, version)
+            if self.version == version:
+                self.selections[fields] = snapshot
+        return snapshot
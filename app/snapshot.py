@@ -0,0 +1,159 @@
+import os
+import gzip
+import json
+import mmap
+import struct
+import hashlib
+
+from starlette.requests import Request
+from starlette.responses import Response
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+class Snapshot:
+    '''
+        Response payload serialized once when published, together with its compressed variants and ETag.
+    '''
+    MEDIA_TYPE = 'application/json'
+    GZIP_LEVEL = 6
+    BROTLI_QUALITY = 9
+
+    def __init__(self, data: dict, version=None):
+        self._data = data
+        self.version = version
+        body = json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        self.digest = hashlib.sha256(body).hexdigest()[:32]
+        self.encodings = {'identity': body, 'gzip': gzip.compress(body, self.GZIP_LEVEL)}
+        if brotli is not None:
+            self.encodings['br'] = brotli.compress(body, quality=self.BROTLI_QUALITY)
+
+    @classmethod
+    def from_encodings(cls, digest, encodings, version=None):
+        snapshot = cls.__new__(cls)
+        snapshot._data = None
+        snapshot.version = version
+        snapshot.digest = digest
+        snapshot.encodings = encodings
+        return snapshot
+
+    @property
+    def data(self):
+        if self._data is None:
+            self._data = json.loads(bytes(self.encodings['identity']))
+        return self._data
+
+    def get_etag(self, encoding='identity'):
+        # Every encoding is a separate representation, so it gets its own strong validator
+        return f'"{self.digest}"' if encoding == 'identity' else f'"{self.digest}-{encoding}"'
+
+    @staticmethod
+    def _parse_accept_encoding(header):
+        accepted = dict()
+        for item in header.split(','):
+            name, _, params = item.strip().partition(';')
+            quality = 1.0
+            params = params.strip()
+            if params.startswith('q='):
+                try:
+                    quality = float(params[2:])
+                except ValueError:
+                    quality = 0.0
+            if name:
+                accepted[name.strip().lower()] = quality
+        return accepted
+
+    def choose_encoding(self, accept_encoding):
+        accepted = self._parse_accept_encoding(accept_encoding or '')
+        for encoding in ('br', 'gzip'):
+            if encoding in self.encodings and accepted.get(encoding, accepted.get('*', 0)) > 0:
+                return encoding
+        return 'identity'
+
+    def matches(self, if_none_match):
+        if not if_none_match:
+            return False
+        if if_none_match.strip() == '*':
+            return True
+        tags = {tag.strip().removeprefix('W/') for tag in if_none_match.split(',')}
+        return any(self.get_etag(encoding) in tags for encoding in self.encodings)
+
+    def to_response(self, request: Request):
+        encoding = self.choose_encoding(request.headers.get('accept-encoding'))
+        headers = {
+            'ETag': self.get_etag(encoding),
+            'Vary': 'Accept-Encoding',
+            'Cache-Control': 'no-cache',
+        }
+        if self.matches(request.headers.get('if-none-match')):
+            return Response(status_code=304, headers=headers)
+        if encoding != 'identity':
+            headers['Content-Encoding'] = encoding
+        return Response(content=bytes(self.encodings[encoding]), media_type=self.MEDIA_TYPE, headers=headers)
+
+
+class SharedSnapshot:
+    '''
+        Snapshot published atomically to a file that every worker memory-maps.
+        Readers notice a new version by the file's stat and remap it, nothing is recomputed.
+    '''
+    MAGIC = b'ADMSNAP1'
+    PREFIX = struct.Struct('<8sI')
+
+    def __init__(self, path):
+        self.path = path
+        self.snapshot = None
+        self.key = None
+
+    @staticmethod
+    def _get_key(stat):
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+    def publish(self, snapshot: Snapshot):
+        offset = 0
+        layout = dict()
+        for encoding, body in snapshot.encodings.items():
+            layout[encoding] = [offset, len(body)]
+            offset += len(body)
+        header = json.dumps({
+            'digest': snapshot.digest,
+            'version': snapshot.version,
+            'encodings': layout,
+        }).encode('utf-8')
+
+        tmp_path = f'{self.path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(self.PREFIX.pack(self.MAGIC, len(header)))
+            f.write(header)
+            for body in snapshot.encodings.values():
+                f.write(body)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        self.snapshot = snapshot
+        self.key = self._get_key(os.stat(self.path))
+
+    def get(self):
+        try:
+            key = self._get_key(os.stat(self.path))
+        except FileNotFoundError:
+            return self.snapshot
+        if key != self.key:
+            self.snapshot = self._load()
+            self.key = key
+        return self.snapshot
+
+    def _load(self):
+        with open(self.path, 'rb') as f:
+            buffer = memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+        magic, header_size = self.PREFIX.unpack_from(buffer)
+        if magic != self.MAGIC:
+            raise ValueError(f'{self.path} is not a snapshot file')
+        header = json.loads(bytes(buffer[self.PREFIX.size:self.PREFIX.size + header_size]))
+        start = self.PREFIX.size + header_size
+        encodings = {encoding: buffer[start + offset:start + offset + size]
+                     for encoding, (offset, size) in header['encodings'].items()}
+        return Snapshot.from_encodings(header['digest'], encodings, header.get('version'))
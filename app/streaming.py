@@ -0,0 +1,107 @@
+import json
+from xml.parsers import expat
+
+CHUNK_SIZE = 1 << 20
+
+
+def extract_soap_payload(source_path, target_path, depth=3, chunk_size=CHUNK_SIZE):
+    '''
+        Incremental equivalent of `ET.parse(source_path).getroot()[0]...[0].text` with `depth` indexes:
+        the text of the element reached by following the first child `depth` times is copied to
+        target_path chunk by chunk, so neither the document nor the payload is held in memory.
+    '''
+    parser = expat.ParserCreate()
+    parser.buffer_text = True
+    parser.buffer_size = chunk_size
+    # For every open element: whether it lies on the first-child path, and whether it already has children
+    stack = []
+    state = {'capturing': False, 'found': False}
+
+    with open(target_path, 'w', encoding='utf-8') as target:
+
+        def start_element(name, attrs):
+            on_path = not stack or (stack[-1][0] and not stack[-1][1])
+            if stack:
+                stack[-1][1] = True
+            state['capturing'] = False
+            stack.append([on_path and not state['found'], False])
+            if stack[-1][0] and len(stack) == depth + 1:
+                state['capturing'] = True
+                state['found'] = True
+
+        def end_element(name):
+            stack.pop()
+            state['capturing'] = False
+
+        def character_data(data):
+            if state['capturing']:
+                target.write(data)
+
+        parser.StartElementHandler = start_element
+        parser.EndElementHandler = end_element
+        parser.CharacterDataHandler = character_data
+
+        with open(source_path, 'rb') as source:
+            while True:
+                chunk = source.read(chunk_size)
+                parser.Parse(chunk, not chunk)
+                if not chunk:
+                    break
+
+    return state['found']
+
+
+def iter_json_array(path, chunk_size=CHUNK_SIZE):
+    '''
+        Yields the items of the top-level JSON array stored in path one by one,
+        keeping at most one chunk plus one partially read item in memory.
+    '''
+    decoder = json.JSONDecoder()
+    with open(path, 'r', encoding='utf-8') as f:
+        buffer = ''
+        pos = 0
+        started = False
+        eof = False
+
+        def fill():
+            nonlocal buffer, pos, eof
+            chunk = f.read(chunk_size)
+            buffer = buffer[pos:] + chunk
+            pos = 0
+            eof = not chunk
+            return not eof
+
+        while True:
+            while pos < len(buffer) and buffer[pos] in ' \t\r\n,':
+                pos += 1
+            if pos == len(buffer):
+                if not fill():
+                    raise ValueError('Unexpected end of JSON array')
+                continue
+            if not started:
+                if buffer[pos] != '[':
+                    raise ValueError('JSON array expected')
+                started = True
+                pos += 1
+                continue
+            if buffer[pos] == ']':
+                return
+            try:
+                item, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                if not fill():
+                    raise
+                continue
+            # A number cut by the end of the buffer decodes as a shorter one ("12" of "12345", "-1.5" of "-1.5e10"),
+            # so an item only counts as read once the delimiter after it has been read too
+            after = end
+            while after < len(buffer) and buffer[after] in ' \t\r\n':
+                after += 1
+            if not eof and (after == len(buffer) or buffer[after] not in ',]'):
+                fill()
+                continue
+            yield item
+            pos = end
+            if pos > chunk_size:
+                buffer = buffer[pos:]
+                pos = 0
@@ -4,15 +4,32 @@ import aiofiles
 import json
 import asyncio
 import xml.etree.ElementTree as ET
+from functools import lru_cache
 from pathlib import Path
 from aiohttp import BasicAuth
 from pytz import timezone, utc
 from datetime import datetime
 from dotenv import load_dotenv, find_dotenv
+from app.firstseen import FirstSeenIndex
+from app.history import DumpDigests, DumpHistory, read_json_dump_meta
+from app.metrics import PAYLOAD_BYTES, RECORDS, STAGE_SECONDS
+from app.streaming import CHUNK_SIZE, extract_soap_payload, iter_json_array
 
 env = find_dotenv()
 load_dotenv(env)
 
+LOCAL_TIMEZONE = timezone('Asia/Vladivostok')
+
+
+@lru_cache(maxsize=4096)
+def get_download_timestamps(date_str):
+    '''
+        Epoch seconds and local (Asia/Vladivostok) day ordinal of a UTC '%Y-%m-%d %H:%M:%S' string.
+    '''
+    date_utc = datetime.strptime(date_str, '%Y-%m-%d %H:%M:%S').replace(tzinfo=utc)
+    return int(date_utc.timestamp()), date_utc.astimezone(LOCAL_TIMEZONE).toordinal()
+
+
 class StudentsDataFetcher:
     URL = os.environ.get('URL')
     HEADERS = {
@@ -23,63 +40,136 @@ class StudentsDataFetcher:
            + '<s12:Body><ns1:GetStudentsList xmlns:ns1=\'http://www.DVFU_Univer.org\' /></s12:Body></s12:Envelope>'
     LATEST_DUMP_PATH = (Path(os.path.abspath(__file__))).parent.parent / 'data/latest.json'
     DUMPS_DIR = (Path(os.path.abspath(__file__))).parent.parent / 'data/dumps'
+    RESPONSE_PATH = (Path(os.path.abspath(__file__))).parent.parent / 'data/response.xml'
+    RAW_JSON_PATH = Path('SAVEFORSCINCE.json')
+    STREAMING = os.environ.get('STREAMING_FETCH', 'true').lower() == 'true'
 
     def __init__(self):
         self.fetching_date = None
-        pass
+        self.first_seen = FirstSeenIndex()
+        # Digests of the dump of the previous cycle, the history delta of the next one is taken against them
+        self.prev_digests = None
 
     async def fetch_and_dump_students_data(self):
-
+        '''
+            Returns the new dump, so it can be calculated without reading latest.json back. None if fetching failed.
+            Digests of the dump are kept until the next cycle, so its history delta does not need the dump
+            loaded back from the segment.
+        '''
         print('Fetching students data...')
         self.fetching_date = await get_utc_date()
-        data_raw = await self._fetch_students_data_raw()
-        if data_raw is not None:
+        if self.STREAMING:
+            formatted_data = await self._fetch_and_format_streaming()
+        else:
+            formatted_data = await self._fetch_and_format()
+        if formatted_data is None:
+            return None
+        RECORDS.set(len(formatted_data['data']), kind='applicants')
+        RECORDS.set(sum(map(len, formatted_data['data'].values())), kind='applications')
+        next_dump_number = await self._get_next_dump_number()
+
+        print('Dumping data...')
+        with STAGE_SECONDS.time(stage='write_latest'):
+            await asyncio.to_thread(self._write_json, self.LATEST_DUMP_PATH, formatted_data)
+        PAYLOAD_BYTES.set(os.path.getsize(self.LATEST_DUMP_PATH), kind='latest_json')
+
+        with STAGE_SECONDS.time(stage='write_history'):
+            digests = await asyncio.to_thread(DumpDigests, formatted_data)
+            size = await asyncio.to_thread(DumpHistory(self.DUMPS_DIR).append, next_dump_number, formatted_data,
+                                           self.prev_digests, digests)
+        PAYLOAD_BYTES.set(size, kind='history_blob')
+        self.prev_digests = digests
+        print('Done!')
+        return formatted_data
+
+    async def _fetch_and_format(self):
+        with STAGE_SECONDS.time(stage='fetch'):
+            data_raw = await self._fetch_students_data_raw()
+        if data_raw is None:
+            return None
+        PAYLOAD_BYTES.set(len(data_raw), kind='response')
+        with STAGE_SECONDS.time(stage='extract'):
             raw_json = ET.fromstring(data_raw)[0][0][0].text
-
-            with open("SAVEFORSCINCE.json", "w") as out:
-                out.write(raw_json)
-            print('Formatting fetched data...')
-            formatted_data = await self._format_raw_json_with_prev(raw_json)
-            await asyncio.sleep(2)
-            next_dump_number = await self._get_next_dump_number()
-
-            print('Dumping data...')
-            async with aiofiles.open(self.LATEST_DUMP_PATH, 'w', encoding='utf-8') as f:
-                json_str = json.dumps(formatted_data, ensure_ascii=False)
-                await f.write(json_str)
-            await asyncio.sleep(10)
-
-            async with aiofiles.open(self.DUMPS_DIR / f'{next_dump_number}.json', 'w', encoding='utf-8') as f:
-                json_str = json.dumps(formatted_data, ensure_ascii=False)
-                await f.write(json_str)
-            print('Done!')
+        PAYLOAD_BYTES.set(len(raw_json), kind='raw_json')
+
+        with open(self.RAW_JSON_PATH, "w") as out:
+            out.write(raw_json)
+        print('Formatting fetched data...')
+        with STAGE_SECONDS.time(stage='format'):
+            return await self._format_raw_json_with_prev(raw_json)
+
+    async def _fetch_and_format_streaming(self):
+        try:
+            with STAGE_SECONDS.time(stage='fetch'):
+                if not await self._fetch_students_data_to_file(self.RESPONSE_PATH):
+                    return None
+            PAYLOAD_BYTES.set(os.path.getsize(self.RESPONSE_PATH), kind='response')
+            print('Extracting students list...')
+            with STAGE_SECONDS.time(stage='extract'):
+                found = await asyncio.to_thread(extract_soap_payload, self.RESPONSE_PATH, self.RAW_JSON_PATH)
+        finally:
+            # Also a partly downloaded response, or one expat gave up on, e.g. cut off midway
+            self.RESPONSE_PATH.unlink(missing_ok=True)
+        if not found:
+            print('GetStudentsList payload not found in response')
+            return None
+        PAYLOAD_BYTES.set(os.path.getsize(self.RAW_JSON_PATH), kind='raw_json')
+        print('Formatting fetched data...')
+        with STAGE_SECONDS.time(stage='format'):
+            return await self._format_applications_with_prev(iter_json_array(self.RAW_JSON_PATH))
 
     async def _fetch_students_data_raw(self):
         async with aiohttp.ClientSession() as session:
             try:
                 async with session.post(self.URL, headers=self.HEADERS, data=self.BODY, auth=self.AUTH) as resp:
+                    # A SOAP fault comes with an error status, its envelope holds no students list
+                    resp.raise_for_status()
                     response = await resp.text()
                 return response
             except Exception as e:
                 print(e)
 
+    async def _fetch_students_data_to_file(self, path):
+        async with aiohttp.ClientSession() as session:
+            try:
+                async with session.post(self.URL, headers=self.HEADERS, data=self.BODY, auth=self.AUTH) as resp:
+                    resp.raise_for_status()
+                    async with aiofiles.open(path, 'wb') as f:
+                        async for chunk in resp.content.iter_chunked(CHUNK_SIZE):
+                            await f.write(chunk)
+                return True
+            except Exception as e:
+                print(e)
+                return False
+
+    @staticmethod
+    def _write_json(path, data):
+        # Readers only ever see a complete file: the new one replaces the old in one rename
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
     async def _format_raw_json_with_prev(self, raw_json):
-        list_data = json.loads(raw_json)
-        prev_data = await self._get_prev_data_or_None()
+        return await self._format_applications_with_prev(json.loads(raw_json))
+
+    async def _format_applications_with_prev(self, applications):
         date_utc = self.fetching_date
         date_str = date_utc.strftime('%Y-%m-%d %H:%M:%S')
-        data = {list_data[i]["Code"]: {} for i in range(len(list_data))}
-        for application in list_data:
-            key = application["Code"]
-            trainingDirection = application["TrainingDirection"]
-            data[key][trainingDirection] = application
-            if key in prev_data['data']:
-                if trainingDirection in prev_data['data'][key]:
-                    data[key][trainingDirection]['firstDownloadDate'] = prev_data['data'][key][trainingDirection]['firstDownloadDate']
-                else:
-                    data[key][trainingDirection]['firstDownloadDate'] = date_str
-            else:
-                data[key][trainingDirection]['firstDownloadDate'] = date_str
+        data = dict()
+        for application in applications:
+            data.setdefault(application['Code'], {})[application['TrainingDirection']] = application
+
+        # Only the new payload is held: first download dates come from the index, not from the previous dump
+        await self._seed_first_seen_index()
+        keys = [(code, direction) for code, directions in data.items() for direction in directions]
+        first_seen = await asyncio.to_thread(self.first_seen.update, keys, date_str)
+        for key in keys:
+            application = data[key[0]][key[1]]
+            application['firstDownloadDate'] = first_seen[key]
+            # Parsed once here, so calculations compare integers instead of parsing dates per record
+            application['firstDownloadEpoch'], application['firstDownloadDay'] = \
+                get_download_timestamps(application['firstDownloadDate'])
 
         return {
             'meta': {
@@ -88,38 +178,34 @@ class StudentsDataFetcher:
             'data': data
         }
 
-    async def _get_prev_data_or_None(self):
-        if os.path.exists(self.LATEST_DUMP_PATH):
-            async with aiofiles.open(self.LATEST_DUMP_PATH, 'r', encoding='utf-8') as f:
-                string = await f.read()
-            return json.loads(string)
-        return None
+    async def _seed_first_seen_index(self):
+        # One-off migration: dates published before the index existed are taken from latest.json
+        if not os.path.exists(self.LATEST_DUMP_PATH) or not await asyncio.to_thread(self.first_seen.is_empty):
+            return
+        print('Seeding first download dates from the latest dump...')
+        async with aiofiles.open(self.LATEST_DUMP_PATH, 'r', encoding='utf-8') as f:
+            string = await f.read()
+        await asyncio.to_thread(self.first_seen.seed, json.loads(string)['data'])
 
     async def _get_next_dump_number(self):
-        dumps = sorted([int(i.replace('.json', '')) for i in os.listdir(self.DUMPS_DIR)])
-        if len(dumps) == 0:
-            return "1"
-        else:
-            return str(dumps[-1] + 1)
+        return await asyncio.to_thread(DumpHistory(self.DUMPS_DIR).get_next_number)
 
 
 async def get_latest_dump_date():
     print("Getting latest dump date")
     if not StudentsDataFetcher.LATEST_DUMP_PATH.is_file():
         return None
-    async with aiofiles.open(StudentsDataFetcher.LATEST_DUMP_PATH, 'r', encoding='utf-8') as f:
-        string = await f.read()
-    metadata = json.loads(string)['meta']
+    metadata = await asyncio.to_thread(read_json_dump_meta, StudentsDataFetcher.LATEST_DUMP_PATH)
     date = datetime.strptime(metadata['date'], '%Y-%m-%d %H:%M:%S').replace(tzinfo=utc)
     return date
 
 
 async def get_local_datetime():
-    return datetime.now(tz=timezone('Asia/Vladivostok'))
+    return datetime.now(tz=LOCAL_TIMEZONE)
 
 
 async def convert_utc_to_local(utc_datetime):
-    return utc_datetime.astimezone(timezone('Asia/Vladivostok'))
+    return utc_datetime.astimezone(LOCAL_TIMEZONE)
 
 
 async def get_utc_date():
@@ -0,0 +1,245 @@
+from datetime import date
+from operator import attrgetter
+
+from app.utils import get_download_timestamps
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+BACHELOR = 'Прием на обучение на бакалавриат/специалитет'
+BUDGET = 'Бюджетная основа'
+SCORES = ('Test1Score', 'Test2Score', 'Test3Score', 'Test4Score')
+FIELDS = ('Category', 'DocumentDelivery', 'FinancingSource', 'AdmissionCampaignType', 'TrainingDirection',
+          'AtestOrig', 'NoExams', 'SelectedPriority', 'SumScore')
+
+
+def is_available():
+    return np is not None
+
+
+def _factorize(values):
+    '''
+        Integer codes numbered in order of first appearance, and the values by code.
+    '''
+    index = dict()
+    codes = [index.setdefault(value, len(index)) for value in values]
+    return np.array(codes, dtype=np.int64), list(index)
+
+
+def _map(values, mapping):
+    index = {key: code for code, key in enumerate(mapping)}
+    return np.array([index[value] for value in values], dtype=np.int64)
+
+
+def _to_dates(days, counts):
+    return {date.fromordinal(day): count for day, count in zip(days.tolist(), counts.tolist())}
+
+
+def _count_by_day(days):
+    return _to_dates(*np.unique(days, return_counts=True))
+
+
+def _count_distinct_by(groups, humans, applicants, minlength):
+    '''
+        Number of distinct applicants per group.
+    '''
+    pairs = np.unique(groups * applicants + humans)
+    return np.bincount(pairs // applicants, minlength=minlength)
+
+
+class ApplicationTable:
+    '''
+        Applications of a dump as NumPy columns, one row per application in dump order.
+        Quota, delivery, financing and campaign type are codes into the MainPageCalculations mappings,
+        programs and regions are numbered in order of first appearance, so results keep the key order
+        of the dict-based accumulators.
+    '''
+
+    def __init__(self, data, calculations):
+        records = [app_item for human_item in data.values() for app_item in human_item.values()]
+        sizes = np.array([len(human_item) for human_item in data.values()], dtype=np.int64)
+        self.rows = len(records)
+        self.applicants = len(sizes)
+        self.human = np.repeat(np.arange(self.applicants, dtype=np.int64), sizes)
+        # Row of the first application of every applicant
+        self.first = np.cumsum(sizes) - sizes
+
+        # One pass over the records, then every column is converted on its own
+        count_fields = tuple(quota + 'Count' for quota in calculations.QUOTAS.values())
+        fields = FIELDS + SCORES + count_fields
+        columns = dict(zip(fields, zip(*map(attrgetter(*fields), records)))) if records \
+            else {field: () for field in fields}
+
+        self.quota = _map(columns['Category'], calculations.QUOTAS)
+        self.delivery = _map(columns['DocumentDelivery'], calculations.DOCUMENTDELIVERY)
+        self.financing = _map(columns['FinancingSource'], calculations.FINANCING)
+        self.campaign = _map(columns['AdmissionCampaignType'], calculations.CAMPAIGN_TYPES)
+        self.program, self.programs = _factorize(columns['TrainingDirection'])
+        self.region, self.regions = _factorize([records[row].Region for row in self.first.tolist()])
+
+        self.day = np.array([self._get_download_day(r) for r in records], dtype=np.int64)
+        self.orig = np.array(columns['AtestOrig'], dtype=bool)
+        self.no_exams = np.array(columns['NoExams'], dtype=bool)
+        self.first_priority = np.array(columns['SelectedPriority']) == 1
+        self.sum_score = np.array(columns['SumScore'])
+        self.scores = np.array([columns[name] for name in SCORES]).T.reshape(self.rows, len(SCORES))
+        self.quota_counts = np.array([columns[name] for name in count_fields], dtype=np.int64).T \
+            .reshape(self.rows, len(count_fields))
+
+    @staticmethod
+    def _get_download_day(app_item):
+        day = app_item.firstDownloadDay
+        if day is None:
+            # Dumps written before firstDownloadDay was stored
+            day = get_download_timestamps(app_item.firstDownloadDate)[1]
+        return day
+
+
+def aggregate(data, today_local, region_matcher, calculations, names=None):
+    '''
+        Same results as a full AggregationEngine run over MainPageCalculations accumulators,
+        or over the ones in names, computed with group-by operations over an ApplicationTable.
+    '''
+    table = ApplicationTable(data, calculations)
+    metrics = {
+        'applications_total': lambda: _get_applications_total(table, today_local.toordinal(), calculations),
+        'average_ege': lambda: _get_average_ege(table, calculations),
+        'applications_by_programs': lambda: _get_applications_by_programs(table, calculations),
+        'ratings_by_programs': lambda: _get_ratings_by_programs(table, calculations),
+        'passing_score': lambda: _get_passing_score(table, calculations),
+        'applications_by_region': lambda: _get_applications_by_region(table, region_matcher, calculations),
+    }
+    return {name: compute() for name, compute in metrics.items() if names is None or name in names}
+
+
+def _get_applications_total(table, today, calculations):
+    quotas = list(calculations.QUOTAS.values())
+    deliveries = list(calculations.DOCUMENTDELIVERY.values())
+    financing = list(calculations.FINANCING.values())
+    size = len(financing) * len(deliveries) * len(quotas)
+    cells = (table.financing * len(deliveries) + table.delivery) * len(quotas) + table.quota
+    is_today = table.day == today
+
+    def to_nested(counts):
+        counts = counts.reshape(len(financing), len(deliveries), len(quotas)).tolist()
+        return {fs: {dd: dict(zip(quotas, counts[i][j])) for j, dd in enumerate(deliveries)}
+                for i, fs in enumerate(financing)}
+
+    applicants = max(table.applicants, 1)
+    by_delivery = _count_distinct_by(table.delivery, table.human, applicants, len(deliveries)).tolist()
+    agreements = table.orig
+    agreement_days = np.unique(table.day[agreements] * applicants + table.human[agreements]) // applicants
+
+    # Compared with the mapped delivery names exactly as ApplicationsTotalAccumulator does
+    web = np.array([name == calculations.WEB for name in deliveries], dtype=bool)
+    superservice = np.array([name == calculations.SUPERSERVICE for name in deliveries], dtype=bool)
+    first_delivery = table.delivery[table.first]
+    first_day = table.day[table.first]
+    applicants_web_days = first_day[web[first_delivery]]
+    applicants_superservice_days = first_day[superservice[first_delivery] & ~web[first_delivery]]
+
+    return {
+        'applications_today': to_nested(np.bincount(cells[is_today], minlength=size)),
+        'applications_total': to_nested(np.bincount(cells, minlength=size)),
+        'agreements_today': len(np.unique(table.human[agreements & is_today])),
+        'agreements_total': len(np.unique(table.human[agreements])),
+        'agreements_by_day': _count_by_day(agreement_days),
+        'applications_by_day': _count_by_day(table.day),
+        'applications_offline_by_day': _count_by_day(table.day[web[table.delivery]]),
+        'applicants_total': sum(by_delivery),
+        'applicants_total_superservice': by_delivery[deliveries.index('SuperService')],
+        'applicants_total_web': by_delivery[deliveries.index('Web')],
+        'applicants_online_by_day': _count_by_day(applicants_superservice_days),
+        'applicants_offline_by_day': _count_by_day(applicants_web_days),
+        'applicants_by_day': _count_by_day(np.concatenate([applicants_web_days, applicants_superservice_days])),
+    }
+
+
+def _get_average_ege(table, calculations):
+    scores = table.scores[table.financing == list(calculations.FINANCING).index(BUDGET)]
+    # Row-major order, the same additions as the per-record loop for float scores
+    positive = scores[scores > 0]
+    total = int(positive.sum()) if positive.dtype.kind in 'iu' else sum(positive.tolist(), 0)
+    return {
+        'average_ege_total': total / len(positive) if len(positive) > 0 else 0,
+        'average_ege_schools': dict(),
+    }
+
+
+def _get_program_rows(table):
+    '''
+        First and last row of every program.
+    '''
+    _, first = np.unique(table.program, return_index=True)
+    _, last = np.unique(table.program[::-1], return_index=True)
+    return first, table.rows - 1 - last
+
+
+def _get_applications_by_programs(table, calculations):
+    campaign_types = list(calculations.CAMPAIGN_TYPES.values())
+    count_names = [quota + 'Count' for quota in calculations.QUOTAS.values()]
+    first, last = _get_program_rows(table)
+    counts = np.bincount(table.program, minlength=len(table.programs)).tolist()
+    campaigns = table.campaign[first].tolist()
+    quota_counts = table.quota_counts[last].tolist()
+    return {
+        'applications_by_programs': {program: [counts[i], campaign_types[campaigns[i]]]
+                                     for i, program in enumerate(table.programs)},
+        'count_by_programs': {program: dict(zip(count_names, quota_counts[i]))
+                              for i, program in enumerate(table.programs)},
+    }
+
+
+def _get_ratings_by_programs(table, calculations):
+    quotas = list(calculations.QUOTAS.values())
+    rows = table.first_priority
+    cells = (table.program[rows] * len(quotas) + table.quota[rows]) * 2 + table.orig[rows]
+    counts = np.bincount(cells, minlength=len(table.programs) * len(quotas) * 2)
+    counts = counts.reshape(len(table.programs), len(quotas), 2).tolist()
+    return {program: dict(zip(quotas, counts[i])) for i, program in enumerate(table.programs)}
+
+
+def _get_passing_score(table, calculations):
+    '''
+        Score at the last seat left after the no-exam originals in every program and quota,
+        the lowest score when no seats are left. Seats are the quota counts of the program's last application.
+    '''
+    quotas = list(calculations.QUOTAS.values())
+    size = len(table.programs) * len(quotas)
+    groups = table.program * len(quotas) + table.quota
+    _, last = _get_program_rows(table)
+    capacity = table.quota_counts[last].reshape(size)
+    no_exams = np.bincount(groups[table.orig & table.no_exams], minlength=size)
+
+    ranked = table.first_priority & table.orig & ~table.no_exams
+    ranked_groups = groups[ranked]
+    ranked_scores = table.sum_score[ranked]
+    order = np.lexsort((-ranked_scores, ranked_groups))
+    scores = ranked_scores[order]
+    counts = np.bincount(ranked_groups, minlength=size)
+    starts = np.cumsum(counts) - counts
+
+    seats = capacity - no_exams
+    k = np.where((seats <= 0) | (capacity <= 0), counts, np.minimum(seats, counts))
+    positions = (starts + k - 1)[counts > 0].tolist()
+    values = iter(scores[positions].tolist())
+    passing = [next(values) if count > 0 else 0 for count in counts.tolist()]
+    return {program: dict(zip(quotas, passing[i * len(quotas):(i + 1) * len(quotas)]))
+            for i, program in enumerate(table.programs)}
+
+
+def _get_applications_by_region(table, region_matcher, calculations):
+    bachelor = table.campaign[table.first] == list(calculations.CAMPAIGN_TYPES).index(BACHELOR)
+    codes, first, counts = np.unique(table.region[bachelor], return_index=True, return_counts=True)
+    order = np.argsort(first, kind='stable')
+    regions = [table.regions[code] for code in codes[order].tolist()]
+    iso_codes = region_matcher.resolve_many(regions)
+    applications_by_region = dict()
+    for region, value in zip(regions, counts[order].tolist()):
+        iso_code = iso_codes[region]
+        applications_by_region[iso_code] = applications_by_region.get(iso_code, 0) + value
+    return {
+        'applications_by_region': applications_by_region
+    }
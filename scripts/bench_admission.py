@@ -0,0 +1,34 @@
+import argparse
+import time
+from datetime import datetime
+
+from app.admission import simulate_admission
+from app.calculations import MainPageCalculations
+from app.records import project_dump
+from scripts.synthetic import generate_dump
+
+
+def bench(sizes, repeat):
+    print(f'{"applications":>12} {"programs":>9} {"placed":>8} {"simulation":>12} {"per 1k":>8}   best of {repeat}')
+    for size in sizes:
+        programs = max(30, size // 300)
+        dump = project_dump(generate_dump(size, programs=programs, now=datetime.utcnow().replace(microsecond=0)))
+        best = float('inf')
+        for _ in range(repeat):
+            started = time.perf_counter()
+            result = simulate_admission(dump['data'], MainPageCalculations.QUOTAS, MainPageCalculations.CAMPAIGN_TYPES)
+            best = min(best, time.perf_counter() - started)
+        placed = sum(map(len, result['placements'].values()))
+        print(f'{size:>12} {programs:>9} {placed:>8} {best * 1000:>9.0f} ms {best * 1e6 / size:>5.0f} ms')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Admission simulation time by dump size')
+    parser.add_argument('sizes', nargs='*', type=int, default=[10000, 50000, 100000, 200000, 400000])
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+    bench(args.sizes, args.repeat)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+import argparse
+import asyncio
+import json
+import time
+
+from app.calculations import MainPageCalculations, ApplicationsByProgramsAccumulator
+from app.records import project_dump
+from scripts.synthetic import generate_dump
+
+
+def get_stages(calc):
+    return {
+        'applications_total': calc._get_applications_agreements_total_data,
+        'average_ege': calc._get_average_ege_data,
+        'applications_by_programs': lambda: calc._run_stage(ApplicationsByProgramsAccumulator()),
+        'ratings_by_programs': calc._get_ratings_by_programs,
+        'passing_score': calc._get_passing_score_by_programs,
+        'applications_by_region': calc._get_applications_by_region_data,
+    }
+
+
+async def bench(dump, repeat):
+    '''
+        The accumulators of the fused pass run one at a time, each over the whole dump, against all of them
+        in a single pass. Both sides run the same accumulators, so the ratio is what fusing the passes saves,
+        not a speedup over the per-stage loops the accumulators replaced.
+    '''
+    calc = MainPageCalculations()
+    calc.dump = project_dump(dump)
+    applications = sum(map(len, dump['data'].values()))
+    print(f'{len(dump["data"])} applicants, {applications} applications, best of {repeat}')
+
+    separate = 0
+    for stage, run in get_stages(calc).items():
+        elapsed = await _best_of(run, repeat)
+        separate += elapsed
+        print(f'{stage:<30} {elapsed * 1000:10.1f} ms')
+    print(f'{"accumulators one at a time":<30} {separate * 1000:10.1f} ms')
+
+    fused = await _best_of(calc._aggregate, repeat)
+    print(f'{"accumulators fused":<30} {fused * 1000:10.1f} ms')
+    print(f'{"fused vs one at a time":<30} {separate / fused:10.2f} x')
+
+
+async def _best_of(run, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        await run()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Main page accumulators run one at a time vs fused in one pass')
+    parser.add_argument('dump', nargs='?', default=str(MainPageCalculations.LATEST_DUMP_PATH))
+    parser.add_argument('--synthetic', type=int, help='generate a dump with this many applications instead')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    if args.synthetic:
+        dump = generate_dump(args.synthetic)
+    else:
+        with open(args.dump, encoding='utf-8') as f:
+            dump = json.load(f)
+    asyncio.run(bench(dump, args.repeat))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+from pathlib import Path
+
+from scripts.synthetic import REGIONS_PATH, generate_dump
+
+ROOT = (Path(os.path.abspath(__file__))).parent.parent
+
+
+def wait_for(url, server, started, timeout):
+    '''
+        Seconds from `started` until `url` answers 200.
+    '''
+    while time.perf_counter() - started < timeout:
+        if server.poll() is not None:
+            raise RuntimeError(f'Server exited with code {server.returncode}')
+        try:
+            with urllib.request.urlopen(url, timeout=timeout) as response:
+                if response.status == 200:
+                    return time.perf_counter() - started
+        except (urllib.error.URLError, ConnectionError):
+            time.sleep(0.01)
+    raise TimeoutError(f'{url} did not answer within {timeout} s')
+
+
+def start_server(app_dir, port):
+    env = {**os.environ, 'LOGIN': os.environ.get('LOGIN', 'bench'), 'PASSWORD': os.environ.get('PASSWORD', 'bench'),
+           'URL': os.environ.get('URL', 'http://127.0.0.1:9/')}
+    return subprocess.Popen([sys.executable, '-m', 'uvicorn', 'app.main:app', '--port', str(port)],
+                            cwd=app_dir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def measure(app_dir, port, timeout):
+    started = time.perf_counter()
+    server = start_server(app_dir, port)
+    try:
+        up = wait_for(f'http://127.0.0.1:{port}/metrics', server, started, timeout)
+        first_page = wait_for(f'http://127.0.0.1:{port}/main_page', server, started, timeout)
+    finally:
+        server.terminate()
+        server.wait()
+    return up, first_page
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time from process start to the first /main_page response, '
+                                                 'without and with a persisted snapshot')
+    parser.add_argument('--synthetic', type=int, default=100000, help='applications in the generated dump')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--timeout', type=float, default=600)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app_dir = Path(tmp)
+        shutil.copytree(ROOT / 'app', app_dir / 'app', ignore=shutil.ignore_patterns('__pycache__'))
+        (app_dir / 'data/dumps').mkdir(parents=True)
+        shutil.copy(REGIONS_PATH, app_dir / 'data/regions_map.json')
+        with open(app_dir / 'data/latest.json', 'w', encoding='utf-8') as f:
+            json.dump(generate_dump(args.synthetic), f, ensure_ascii=False)
+
+        for name in ('cold', 'warm'):
+            if name == 'cold':
+                (app_dir / 'data/snapshot.bin').unlink(missing_ok=True)
+            up, first_page = measure(app_dir, args.port, args.timeout)
+            print(f'{name}: server up in {up:.2f} s, first /main_page in {first_page:.2f} s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+import argparse
+import gc
+import json
+import os
+import pickle
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from app.records import loads_dump, project_dump
+from scripts.synthetic import generate_dump
+
+
+def get_rss():
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1]) * 1024
+    return 0
+
+
+def measure(path, projected):
+    '''
+        Resident memory taken by the dump in path, parsed to raw dicts or straight to Application records.
+        Runs in a fresh process, so memory freed by earlier measurements does not blur the numbers.
+    '''
+    gc.collect()
+    before = get_rss()
+    with open(path, encoding='utf-8') as f:
+        string = f.read()
+    started = time.perf_counter()
+    dump = loads_dump(string) if projected else json.loads(string)
+    elapsed = time.perf_counter() - started
+    del string
+    gc.collect()
+    # The dump is still referenced here, so the resident memory measured is the memory it takes
+    rss = get_rss() - before
+    print(json.dumps({'rss': rss, 'seconds': elapsed, 'applicants': len(dump['data'])}))
+
+
+def measure_handoff(dump):
+    '''
+        Pickled size and round trip time of a dump as the calculation pool sends it to a worker.
+    '''
+    started = time.perf_counter()
+    payload = pickle.dumps(dump, pickle.HIGHEST_PROTOCOL)
+    pickle.loads(payload)
+    return len(payload), time.perf_counter() - started
+
+
+def pad(dump, extra_fields):
+    # The upstream service sends dozens of fields per application the calculations never read
+    for human_item in dump['data'].values():
+        for app_item in human_item.values():
+            for i in range(extra_fields):
+                app_item[f'Extra{i}'] = f'{app_item["Code"]}-{i}'
+    return dump
+
+
+def run(path, projected):
+    output = subprocess.run([sys.executable, '-m', 'scripts.bench_records', '--measure', str(path)]
+                            + (['--projected'] if projected else []),
+                            check=True, capture_output=True, text=True, env={**os.environ}).stdout
+    return json.loads(output.splitlines()[-1])
+
+
+def bench(sizes, extra_fields):
+    print(f'{"applications":>12} {"extra fields":>13} {"":>8} {"RSS":>9} {"parse":>8} {"pickled":>9} {"handoff":>8}')
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in sizes:
+            dump = pad(generate_dump(size), extra_fields)
+            path = Path(tmp) / f'{size}.json'
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(dump, f, ensure_ascii=False)
+            for name, projected, handed_over in (('dicts', False, dump), ('records', True, project_dump(dump))):
+                result = run(path, projected)
+                pickled, handoff = measure_handoff(handed_over)
+                print(f'{size:>12} {extra_fields:>13} {name:>8} {result["rss"] / 2 ** 20:>6.1f} MB '
+                      f'{result["seconds"] * 1000:>5.0f} ms {pickled / 2 ** 20:>6.1f} MB {handoff * 1000:>5.0f} ms')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Memory and worker handoff of a dump as raw dicts vs Application records')
+    parser.add_argument('sizes', nargs='*', type=int, default=[100000, 300000])
+    parser.add_argument('--extra-fields', type=int, default=0,
+                        help='pad every application with this many unused fields, like the upstream payload')
+    parser.add_argument('--measure', help=argparse.SUPPRESS)
+    parser.add_argument('--projected', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        measure(args.measure, args.projected)
+    else:
+        bench(args.sizes, args.extra_fields)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+import argparse
+import asyncio
+import json
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+
+from app import main as server
+from app.calculations import MainPageCalculations
+from app.offload import CalculationPool
+from app.snapshot import Snapshot, SharedSnapshot
+from scripts.synthetic import generate_dump
+
+
+async def recompute_inline(latest_dump_path):
+    calc = MainPageCalculations()
+    calc.LATEST_DUMP_PATH = latest_dump_path
+    return Snapshot(await calc.get_main_page_data())
+
+
+async def measure(client, recompute, interval):
+    '''
+        Requests /main_page every `interval` seconds while `recompute` runs. Latency is counted
+        from the moment a request was due, so time spent waiting for a blocked event loop is included.
+    '''
+    task = asyncio.create_task(recompute())
+    latencies = []
+    while not task.done():
+        due = time.perf_counter() + interval
+        await asyncio.sleep(interval)
+        response = await client.get('/main_page')
+        response.raise_for_status()
+        latencies.append(time.perf_counter() - due)
+    await task
+    return latencies
+
+
+def report(name, latencies, elapsed):
+    latencies = sorted(latencies)
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+    print(f'{name:<10} recompute {elapsed:6.2f} s, {len(latencies):5} requests, '
+          f'p50 {statistics.median(latencies) * 1000:8.1f} ms, p99 {p99 * 1000:8.1f} ms, '
+          f'max {latencies[-1] * 1000:8.1f} ms')
+
+
+async def bench(applications, interval):
+    with tempfile.TemporaryDirectory() as tmp:
+        latest_dump_path = Path(tmp) / 'latest.json'
+        with open(latest_dump_path, 'w', encoding='utf-8') as f:
+            json.dump(generate_dump(applications), f, ensure_ascii=False)
+        server.shared_snapshot = SharedSnapshot(Path(tmp) / 'snapshot.bin')
+        server.shared_snapshot.publish(await recompute_inline(latest_dump_path))
+
+        pools = {'thread': CalculationPool(0), 'process': CalculationPool(1)}
+        # Start the worker process up front, its spawn time is not part of a recompute
+        await asyncio.get_running_loop().run_in_executor(pools['process']._get_executor(), int)
+        modes = {
+            'inline': lambda: recompute_inline(latest_dump_path),
+            'thread': lambda: pools['thread'].get_main_page(latest_dump_path),
+            'process': lambda: pools['process'].get_main_page(latest_dump_path),
+        }
+
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://test') as client:
+            idle = await measure(client, lambda: asyncio.sleep(2), interval)
+            report('idle', idle, 2)
+            for name, recompute in modes.items():
+                started = time.perf_counter()
+                latencies = await measure(client, recompute, interval)
+                report(name, latencies, time.perf_counter() - started)
+        for pool in pools.values():
+            pool.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='/main_page latency while the main page is being recalculated')
+    parser.add_argument('--synthetic', type=int, default=100000, help='applications in the generated dump')
+    parser.add_argument('--interval', type=float, default=0.01, help='pause between requests, seconds')
+    args = parser.parse_args()
+    asyncio.run(bench(args.synthetic, args.interval))
+
+
+if __name__ == '__main__':
+    main()
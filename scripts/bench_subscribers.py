@@ -0,0 +1,181 @@
+import argparse
+import asyncio
+import json
+import os
+import resource
+import shutil
+import tempfile
+import time
+import urllib.request
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from app.push import apply_patch
+from scripts.bench_cold_start import ROOT, start_server, wait_for
+from scripts.synthetic import REGIONS_PATH, generate_dump
+
+
+def get_rss(pid):
+    with open(f'/proc/{pid}/status') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1]) * 1024
+    return 0
+
+
+def count_open_files(pid):
+    return len(os.listdir(f'/proc/{pid}/fd'))
+
+
+class Subscriber:
+    '''
+        Raw HTTP/1.1 client of /main_page/events: a few kilobytes per connection, so thousands fit in this process.
+    '''
+
+    def __init__(self, port):
+        self.port = port
+        self.events = []
+        self.buffer = b''
+        self.received = 0
+        self.reader = self.writer = None
+
+    async def connect(self, last_event_id=None):
+        self.reader, self.writer = await asyncio.open_connection('127.0.0.1', self.port, limit=2 ** 26)
+        resume = '' if last_event_id is None else f'Last-Event-ID: {last_event_id}\r\n'
+        self.writer.write(f'GET /main_page/events HTTP/1.1\r\nHost: 127.0.0.1:{self.port}\r\n'
+                          f'Accept: text/event-stream\r\n{resume}\r\n'.encode())
+        headers = await self.reader.readuntil(b'\r\n\r\n')
+        if not headers.startswith(b'HTTP/1.1 200'):
+            raise RuntimeError(headers.decode(errors='replace'))
+
+    async def next_event(self):
+        while b'\n\n' not in self.buffer:
+            # Streaming responses are sent with chunked transfer encoding
+            size = int((await self.reader.readuntil(b'\r\n')).strip(), 16)
+            chunk = await self.reader.readexactly(size + 2)
+            self.received += size
+            self.buffer += chunk[:-2]
+        raw, self.buffer = self.buffer.split(b'\n\n', 1)
+        fields = dict(line.split(b': ', 1) for line in raw.split(b'\n') if not line.startswith(b':'))
+        if not fields:
+            return await self.next_event()
+        event = (fields[b'event'].decode(), fields[b'id'].decode(), fields[b'data'])
+        self.events.append(event)
+        return event
+
+    def close(self):
+        self.writer.close()
+
+
+def write_dump(app_dir, dump):
+    with open(app_dir / 'data/latest.json', 'w', encoding='utf-8') as f:
+        json.dump(dump, f, ensure_ascii=False)
+
+
+def grow_dump(dump, applications, now):
+    '''
+        The dump of the next cycle: every application of dump and the ones submitted since.
+    '''
+    new = generate_dump(applications, seed=1, days=0, now=now)
+    data = dict(dump['data'])
+    for code, human_item in new['data'].items():
+        # Codes of new applicants must not collide with the ones already in dump
+        code = f'9{code[1:]}'
+        data[code] = {direction: {**app_item, 'Code': code} for direction, app_item in human_item.items()}
+    return {'meta': new['meta'], 'data': data}
+
+
+def fetch_main_page(port):
+    with urllib.request.urlopen(f'http://127.0.0.1:{port}/main_page') as response:
+        return json.loads(response.read())
+
+
+async def bench(app_dir, port, subscribers, applications, timeout):
+    dump = generate_dump(applications, seed=0, now=datetime.utcnow().replace(microsecond=0))
+    write_dump(app_dir, dump)
+    server = start_server(app_dir, port)
+    try:
+        wait_for(f'http://127.0.0.1:{port}/main_page', server, time.perf_counter(), timeout)
+        snapshot_size = len(json.dumps(fetch_main_page(port), ensure_ascii=False, separators=(',', ':')).encode())
+        rss_before = get_rss(server.pid)
+        files_before = count_open_files(server.pid)
+
+        started = time.perf_counter()
+        clients = []
+        for i in range(0, subscribers, 500):
+            batch = [Subscriber(port) for _ in range(min(500, subscribers - i))]
+            await asyncio.gather(*(client.connect() for client in batch))
+            await asyncio.gather(*(client.next_event() for client in batch))
+            clients.extend(batch)
+        connected = time.perf_counter() - started
+        rss_idle = get_rss(server.pid)
+        print(f'{subscribers} subscribers connected and got the snapshot ({snapshot_size / 1024:.0f} KB) '
+              f'in {connected:.2f} s')
+        print(f'server RSS {rss_before / 2 ** 20:.0f} MB -> {rss_idle / 2 ** 20:.0f} MB, '
+              f'{(rss_idle - rss_before) / subscribers / 1024:.1f} KB per idle subscriber')
+
+        # The next cycle, recalculated by the server on the next request
+        now = datetime.strptime(dump['meta']['date'], '%Y-%m-%d %H:%M:%S') + timedelta(minutes=90)
+        write_dump(app_dir, grow_dump(dump, applications // 50, now))
+        await asyncio.to_thread(fetch_main_page, port)
+        received = [client.received for client in clients]
+        started = time.perf_counter()
+        patches = await asyncio.wait_for(asyncio.gather(*(client.next_event() for client in clients)), timeout)
+        fanned_out = time.perf_counter() - started
+        patch_size = sum(client.received - before for client, before in zip(clients, received)) / subscribers
+        print(f'patch pushed to all subscribers {fanned_out:.2f} s after the recalculation was requested, '
+              f'{patch_size / 1024:.1f} KB per subscriber instead of {snapshot_size / 1024:.0f} KB')
+
+        kinds = {event for event, _, _ in patches}
+        if kinds != {'patch'}:
+            raise SystemExit(f'expected only patch events, got {", ".join(sorted(kinds))}')
+        _, _, snapshot = clients[0].events[0]
+        patched = apply_patch(json.loads(snapshot), json.loads(patches[0][2]))
+        if patched != await asyncio.to_thread(fetch_main_page, port):
+            raise SystemExit('snapshot with the patch applied differs from /main_page')
+        print('snapshot with the patch applied equals /main_page')
+
+        for client in clients:
+            client.close()
+        started = time.perf_counter()
+        while count_open_files(server.pid) > files_before:
+            if time.perf_counter() - started > timeout:
+                raise SystemExit(f'{count_open_files(server.pid) - files_before} event streams still open')
+            await asyncio.sleep(0.1)
+        print(f'all event streams closed {time.perf_counter() - started:.2f} s after the subscribers disconnected')
+    finally:
+        server.terminate()
+        try:
+            server.wait(10)
+        except Exception:
+            # Open event streams can hold up a graceful shutdown
+            server.kill()
+            server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Thousands of idle /main_page/events subscribers on one worker: '
+                                                 'memory per connection and the time to push a recompute to all')
+    parser.add_argument('--subscribers', type=int, default=5000)
+    parser.add_argument('--synthetic', type=int, default=20000, help='applications in the generated dump')
+    parser.add_argument('--port', type=int, default=8766)
+    parser.add_argument('--timeout', type=float, default=600)
+    args = parser.parse_args()
+
+    # Both ends of every connection are file descriptors, the server inherits the raised limit
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    if hard < args.subscribers + 100:
+        raise SystemExit(f'open files limit {hard} is too low for {args.subscribers} subscribers')
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app_dir = Path(tmp)
+        shutil.copytree(ROOT / 'app', app_dir / 'app', ignore=shutil.ignore_patterns('__pycache__'))
+        (app_dir / 'data/dumps').mkdir(parents=True)
+        shutil.copy(REGIONS_PATH, app_dir / 'data/regions_map.json')
+        os.environ.setdefault('PUSH_POLL_SECONDS', '0.2')
+        asyncio.run(bench(app_dir, args.port, args.subscribers, args.synthetic, args.timeout))
+
+
+if __name__ == '__main__':
+    main()
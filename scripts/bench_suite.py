@@ -0,0 +1,161 @@
+import argparse
+import asyncio
+import gc
+import json
+import platform
+import subprocess
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+
+from pytz import utc
+
+from app import vectorized
+from app.admission import simulate_admission
+from app.calculations import MainPageCalculations
+from app.firstseen import FirstSeenIndex
+from app.records import project_dump
+from app.regions import RegionMatcher
+from app.utils import StudentsDataFetcher
+from scripts.bench_aggregation import get_stages
+from scripts.synthetic import REGIONS_PATH, generate_dump, to_raw_applications
+
+SIZES = [10000, 100000, 500000]
+REGION_NOISE = 0.02
+
+
+async def measure(run, repeat):
+    '''
+        Best wall time of `repeat` runs, then one more run under tracemalloc for the peak of Python allocations.
+    '''
+    best = float('inf')
+    for _ in range(repeat):
+        gc.collect()
+        started = time.perf_counter()
+        await run()
+        best = min(best, time.perf_counter() - started)
+    gc.collect()
+    tracemalloc.start()
+    await run()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {'seconds': best, 'peak_mb': peak / 2 ** 20}
+
+
+def get_suite(dump, prev_dump, aliases_path):
+    records = project_dump(dump)
+    calc = MainPageCalculations()
+    calc.dump = records
+    calc.REGION_ALIASES_PATH = aliases_path
+    stages = {name: stage for name, stage in get_stages(calc).items()}
+
+    fetcher = StudentsDataFetcher()
+    fetcher.fetching_date = datetime.now(tz=utc)
+    raw_json = json.dumps(to_raw_applications(dump), ensure_ascii=False)
+
+    index_path = aliases_path.with_name('first_seen.sqlite3')
+    index_path.unlink(missing_ok=True)
+    fetcher.first_seen = FirstSeenIndex(index_path)
+    fetcher.first_seen.seed(prev_dump['data'])
+
+    with open(REGIONS_PATH, encoding='utf-8') as f:
+        regions_map = json.load(f)
+    raw_regions = {app_item['Region'] for human_item in dump['data'].values() for app_item in human_item.values()}
+
+    async def match_regions():
+        RegionMatcher(regions_map).resolve_many(raw_regions)
+
+    async def project():
+        project_dump(dump)
+
+    async def fused():
+        calc.engine = None
+        await calc._aggregate()
+
+    async def vectorized_aggregation():
+        vectorized.aggregate(records['data'], datetime.now(tz=utc), await calc._get_region_matcher(), MainPageCalculations)
+
+    async def admission():
+        simulate_admission(records['data'], MainPageCalculations.QUOTAS, MainPageCalculations.CAMPAIGN_TYPES)
+
+    return {
+        'format_raw_json_with_prev': lambda: fetcher._format_raw_json_with_prev(raw_json),
+        'project_records': project,
+        **stages,
+        'fused_aggregation': fused,
+        **({'vectorized_aggregation': vectorized_aggregation} if vectorized.is_available() else {}),
+        'admission_simulation': admission,
+        'region_matching': match_regions,
+    }
+
+
+async def bench(sizes, repeat):
+    results = dict()
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in sizes:
+            dump = generate_dump(size, seed=0, region_noise=REGION_NOISE)
+            prev_dump = generate_dump(size, seed=1, region_noise=REGION_NOISE)
+            print(f'{size} applications, best of {repeat}')
+            results[str(size)] = dict()
+            for name, run in get_suite(dump, prev_dump, Path(tmp) / 'aliases.json').items():
+                result = results[str(size)][name] = await measure(run, repeat)
+                print(f'  {name:<30} {result["seconds"] * 1000:10.1f} ms {result["peak_mb"]:10.1f} MB peak')
+            del dump, prev_dump
+    return results
+
+
+def get_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return None
+
+
+def compare(results, baseline, threshold):
+    print(f'Compared to {baseline["commit"]} from {baseline["date"]}:')
+    regressions = 0
+    for size, stages in results.items():
+        for name, result in stages.items():
+            before = baseline['sizes'].get(size, {}).get(name)
+            if before is None:
+                continue
+            time_ratio = result['seconds'] / before['seconds']
+            memory_ratio = result['peak_mb'] / before['peak_mb'] if before['peak_mb'] else 1
+            flag = ''
+            if time_ratio > 1 + threshold or memory_ratio > 1 + threshold:
+                flag = 'REGRESSION'
+                regressions += 1
+            print(f'  {size:>7} {name:<30} time {time_ratio:6.2f}x  memory {memory_ratio:6.2f}x  {flag}')
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Times every calculation stage on synthetic dumps')
+    parser.add_argument('sizes', nargs='*', type=int, default=SIZES)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', help='save results as JSON, e.g. to compare a later run against')
+    parser.add_argument('--compare', help='results JSON of an earlier run')
+    parser.add_argument('--threshold', type=float, default=0.2, help='slowdown or growth reported as a regression')
+    args = parser.parse_args()
+
+    results = asyncio.run(bench(args.sizes, args.repeat))
+    report = {
+        'commit': get_commit(),
+        'date': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'python': platform.python_version(),
+        'sizes': results,
+    }
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        if regressions:
+            raise SystemExit(f'{regressions} regressions over {args.threshold:.0%}')
+
+
+if __name__ == '__main__':
+    main()
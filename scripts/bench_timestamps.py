@@ -0,0 +1,70 @@
+import argparse
+import asyncio
+import time
+from datetime import datetime
+
+from pytz import utc
+
+from app.calculations import ApplicationsTotalAccumulator, MainPageCalculations
+from app.records import project_dump
+from app.utils import LOCAL_TIMEZONE, get_download_timestamps
+from scripts.synthetic import generate_dump
+
+
+def legacy_download_day(app_item):
+    # What every application used to cost: strptime, a pytz conversion and a local midnight per record
+    return datetime.strptime(
+        app_item.firstDownloadDate, '%Y-%m-%d %H:%M:%S'
+    ).replace(tzinfo=utc).astimezone(LOCAL_TIMEZONE).toordinal()
+
+
+def strip_timestamps(dump):
+    for human_item in dump['data'].values():
+        for app_item in human_item.values():
+            app_item.firstDownloadDay = None
+
+
+async def time_stage(calc, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = await calc._run_stage(ApplicationsTotalAccumulator(LOCAL_TIMEZONE.localize(datetime.now())))
+        best = min(best, time.perf_counter() - started)
+    return best, result
+
+
+async def bench(applications, repeat):
+    calc = MainPageCalculations()
+    calc.dump = project_dump(generate_dump(applications))
+    print(f'{applications} applications, applications_total stage, best of {repeat}')
+
+    precomputed, expected = await time_stage(calc, repeat)
+    print(f'{"precomputed day ordinals":<30} {precomputed * 1000:10.1f} ms')
+
+    strip_timestamps(calc.dump)
+    get_download_timestamps.cache_clear()
+    fallback, result = await time_stage(calc, repeat)
+    assert result == expected
+    print(f'{"old dump, cached parse":<30} {fallback * 1000:10.1f} ms')
+
+    original = ApplicationsTotalAccumulator._get_download_day
+    ApplicationsTotalAccumulator._get_download_day = staticmethod(legacy_download_day)
+    try:
+        legacy, result = await time_stage(calc, repeat)
+    finally:
+        ApplicationsTotalAccumulator._get_download_day = original
+    assert result == expected
+    print(f'{"strptime per record":<30} {legacy * 1000:10.1f} ms')
+    print(f'{"speedup":<30} {legacy / precomputed:10.2f} x')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Precomputed firstDownloadDay vs per-record date parsing')
+    parser.add_argument('--synthetic', type=int, default=100000, help='applications in the generated dump')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+    asyncio.run(bench(args.synthetic, args.repeat))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+import argparse
+import asyncio
+import json
+import tempfile
+import time
+from pathlib import Path
+
+from app import vectorized
+from app.calculations import MainPageCalculations
+from app.records import project_dump
+from app.utils import get_local_datetime
+from scripts.synthetic import generate_dump
+
+
+class DictCalculations(MainPageCalculations):
+    VECTORIZED = False
+
+
+class VectorizedCalculations(MainPageCalculations):
+    VECTORIZED = True
+
+
+async def get_page(calc, results):
+    calc._set_results(results)
+    calc.last_update_date = await get_local_datetime()
+    return json.dumps(await calc._get_page(), ensure_ascii=False)
+
+
+async def best_of(run, repeat):
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = await run()
+        best = min(best, time.perf_counter() - started)
+    return best, result
+
+
+async def bench(sizes, repeat, aliases_path):
+    today_local = await get_local_datetime()
+    for size in sizes:
+        dump = project_dump(generate_dump(size, seed=0))
+        calcs = {'dict': DictCalculations(), 'numpy': VectorizedCalculations()}
+        for calc in calcs.values():
+            calc.dump = dump
+            calc.REGION_ALIASES_PATH = aliases_path
+        print(f'{size} applications, full rebuild, best of {repeat}')
+
+        timings, results = dict(), dict()
+        for name, calc in calcs.items():
+            timings[name], results[name] = await best_of(lambda: calc._rebuild(today_local), repeat)
+        table_build, _ = await best_of(
+            lambda: asyncio.to_thread(vectorized.ApplicationTable, dump['data'], MainPageCalculations), repeat)
+
+        pages = {name: await get_page(calc, results[name]) for name, calc in calcs.items()}
+        mismatched = [name for name in results['dict'] if results['dict'][name] != results['numpy'][name]]
+        print(f'{"dict accumulators":<30} {timings["dict"] * 1000:10.1f} ms')
+        print(f'{"numpy table + group-by":<30} {timings["numpy"] * 1000:10.1f} ms'
+              f'  (table {table_build * 1000:.1f} ms, group-by {(timings["numpy"] - table_build) * 1000:.1f} ms)')
+        print(f'{"speedup":<30} {timings["dict"] / timings["numpy"]:10.2f} x')
+        if mismatched or pages['dict'] != pages['numpy']:
+            raise SystemExit(f'numpy results differ from dict results: {", ".join(mismatched) or "page order"}')
+        print('results and page JSON identical')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Dict accumulators vs the NumPy columnar backend')
+    parser.add_argument('sizes', nargs='*', type=int, default=[100000, 300000])
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+    if not vectorized.is_available():
+        raise SystemExit('numpy is not installed')
+
+    with tempfile.TemporaryDirectory() as tmp:
+        asyncio.run(bench(args.sizes, args.repeat, Path(tmp) / 'aliases.json'))
+
+
+if __name__ == '__main__':
+    main()
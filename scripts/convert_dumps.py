@@ -0,0 +1,91 @@
+import argparse
+import json
+import os
+import time
+from pathlib import Path
+
+from app.columnar import ColumnarDump, write_columnar_dump
+from app.history import DumpDigests, DumpHistory
+from app.utils import StudentsDataFetcher
+
+
+def convert(path):
+    with open(path, encoding='utf-8') as f:
+        dump = json.load(f)
+    target = path.with_suffix('.dump')
+    write_columnar_dump(target, dump)
+    with ColumnarDump.open(target) as columnar:
+        if columnar.to_dump() != dump:
+            raise ValueError(f'{target} does not round-trip to {path}')
+    return target
+
+
+def compare(json_path, columnar_path):
+    started = time.perf_counter()
+    with open(json_path, encoding='utf-8') as f:
+        json.load(f)
+    json_load = time.perf_counter() - started
+
+    started = time.perf_counter()
+    with ColumnarDump.open(columnar_path) as columnar:
+        columnar.to_dump()
+    full_load = time.perf_counter() - started
+
+    started = time.perf_counter()
+    with ColumnarDump.open(columnar_path) as columnar:
+        scores = columnar.column('SumScore')
+        sum(scores)
+        del scores
+    column_load = time.perf_counter() - started
+
+    json_size = os.path.getsize(json_path)
+    columnar_size = os.path.getsize(columnar_path)
+    print(f'{json_path.name}: {json_size / 2 ** 20:.1f} MB json, {columnar_size / 2 ** 20:.1f} MB columnar '
+          f'({json_size / columnar_size:.1f}x); load {json_load * 1000:.0f} ms json, '
+          f'{full_load * 1000:.0f} ms columnar full, {column_load * 1000:.1f} ms single column')
+
+
+def convert_to_history(dumps_dir, remove=False):
+    history = DumpHistory(dumps_dir)
+    singles = [entry for entry in history.get_index() if entry['kind'] == 'single']
+
+    prev_digests = None
+    for entry in singles:
+        path = Path(dumps_dir) / entry['file']
+        dump = history._load_single(path)
+        digests = DumpDigests(dump)
+        history.append(entry['number'], dump, prev_digests, digests)
+        started = time.perf_counter()
+        if history.load(entry['number']) != dump:
+            raise ValueError(f'Dump {entry["number"]} does not round-trip through the history')
+        print(f'{path.name}: stored, reconstructed in {(time.perf_counter() - started) * 1000:.0f} ms')
+        prev_digests = digests
+
+    singles_size = sum(entry['size'] for entry in singles)
+    history_size = sum(path.stat().st_size for path in Path(dumps_dir).glob(f'*{DumpHistory.SEGMENT_SUFFIX}'))
+    print(f'{singles_size / 2 ** 20:.1f} MB of single dumps, {history_size / 2 ** 20:.1f} MB of history segments')
+    if remove:
+        for entry in singles:
+            os.remove(Path(dumps_dir) / entry['file'])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Convert single history dumps to columnar files or history segments')
+    parser.add_argument('dumps_dir', nargs='?', default=str(StudentsDataFetcher.DUMPS_DIR))
+    parser.add_argument('--columnar', action='store_true',
+                        help='convert <n>.json to standalone <n>.dump files instead of history segments')
+    parser.add_argument('--remove', action='store_true', help='delete the source dumps after a verified conversion')
+    args = parser.parse_args()
+
+    if not args.columnar:
+        convert_to_history(args.dumps_dir, args.remove)
+        return
+    for path in sorted(Path(args.dumps_dir).glob('*.json'), key=lambda p: int(p.stem)):
+        target = convert(path)
+        compare(path, target)
+        if args.remove:
+            os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
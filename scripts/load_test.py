@@ -0,0 +1,195 @@
+import argparse
+import asyncio
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import aiohttp
+
+from scripts.bench_cold_start import ROOT, wait_for
+from scripts.synthetic import REGIONS_PATH
+
+OK_STATUSES = (200, 304)
+
+
+class LoadGenerator:
+    '''
+        Open loop load: requests are started at a fixed rate whether or not earlier ones have finished,
+        at most `connections` at a time. Latency is counted from the moment a request was due,
+        so time spent waiting for a connection or for a stalled server is included.
+    '''
+
+    def __init__(self, base_url, paths, rate, connections, timeout, revalidate=False):
+        self.base_url = base_url.rstrip('/')
+        self.paths = paths
+        self.rate = rate
+        self.connections = asyncio.Semaphore(connections)
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.revalidate = revalidate
+        self.etags = dict()
+        # (finished at, path, latency, outcome): outcome is the status code or the error name
+        self.results = []
+
+    async def _request(self, session, path, due):
+        async with self.connections:
+            headers = {'If-None-Match': self.etags[path]} if path in self.etags else dict()
+            try:
+                async with session.get(self.base_url + path, headers=headers) as response:
+                    await response.read()
+                    outcome = response.status
+                    if self.revalidate and 'ETag' in response.headers:
+                        self.etags[path] = response.headers['ETag']
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                outcome = type(e).__name__
+        finished = time.perf_counter()
+        self.results.append((finished, path, finished - due, outcome))
+
+    async def run(self, duration, report_every):
+        connector = aiohttp.TCPConnector(limit=0)
+        async with aiohttp.ClientSession(connector=connector, timeout=self.timeout) as session:
+            started = time.perf_counter()
+            tasks = set()
+            reporter = asyncio.create_task(self._report(started, report_every))
+            i = 0
+            while True:
+                due = started + i / self.rate
+                if due - started >= duration:
+                    break
+                await asyncio.sleep(max(0.0, due - time.perf_counter()))
+                task = asyncio.create_task(self._request(session, self.paths[i % len(self.paths)], due))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+                i += 1
+            await asyncio.gather(*tasks)
+            reporter.cancel()
+            return time.perf_counter() - started
+
+    async def _report(self, started, every):
+        seen = 0
+        while True:
+            await asyncio.sleep(every)
+            window = self.results[seen:]
+            seen += len(window)
+            print(f'{time.perf_counter() - started:7.1f} s  {format_stats(window, every)}')
+
+
+def get_percentile(latencies, q):
+    return latencies[min(len(latencies) - 1, int(len(latencies) * q))]
+
+
+def format_stats(results, elapsed):
+    if not results:
+        return 'no responses'
+    latencies = sorted(latency for _, _, latency, _ in results)
+    errors = sum(1 for *_, outcome in results if outcome not in OK_STATUSES)
+    return (f'{len(results) / elapsed:8.1f} req/s  p50 {statistics.median(latencies) * 1000:8.1f} ms  '
+            f'p95 {get_percentile(latencies, 0.95) * 1000:8.1f} ms  p99 {get_percentile(latencies, 0.99) * 1000:8.1f} ms  '
+            f'max {latencies[-1] * 1000:8.1f} ms  errors {errors / len(results):6.2%}')
+
+
+def report(results, elapsed):
+    print(f'\n{len(results)} requests in {elapsed:.1f} s')
+    for path in sorted({path for _, path, _, _ in results}):
+        print(f'{path:<30} {format_stats([r for r in results if r[1] == path], elapsed)}')
+    print(f'{"total":<30} {format_stats(results, elapsed)}')
+    outcomes = dict()
+    for *_, outcome in results:
+        outcomes[outcome] = outcomes.get(outcome, 0) + 1
+    print('outcomes: ' + ', '.join(f'{outcome}: {count}' for outcome, count in sorted(outcomes.items(), key=str)))
+
+
+def start_stack(tmp, args):
+    '''
+        The SOAP stub and the app on top of it, fetching from the stub every `cycle` seconds.
+    '''
+    app_dir = Path(tmp)
+    shutil.copytree(ROOT / 'app', app_dir / 'app', ignore=shutil.ignore_patterns('__pycache__'))
+    (app_dir / 'data/dumps').mkdir(parents=True)
+    shutil.copy(REGIONS_PATH, app_dir / 'data/regions_map.json')
+
+    env = {**os.environ, 'LOGIN': 'load-test', 'PASSWORD': 'load-test', 'PYTHONPATH': str(ROOT)}
+    stub = subprocess.Popen([sys.executable, '-m', 'scripts.soap_stub', '--port', str(args.stub_port),
+                             '--applications', str(args.synthetic), '--growth', str(args.growth),
+                             '--latency', str(args.stub_latency), '--failure-rate', str(args.failure_rate),
+                             '--truncate-rate', str(args.truncate_rate)],
+                            cwd=ROOT, env=env, stdout=subprocess.DEVNULL)
+    try:
+        # The stub listens once the first response is generated, the app fetches as soon as it starts
+        wait_for(f'http://127.0.0.1:{args.stub_port}/stats', stub, time.perf_counter(), 600)
+    except Exception:
+        stub.terminate()
+        raise
+    server_env = {**env, 'URL': f'http://127.0.0.1:{args.stub_port}/ws', 'UPDATE_INTERVAL': str(args.cycle),
+                  'DUMP_MAX_AGE': '0'}
+    server = subprocess.Popen([sys.executable, '-m', 'uvicorn', 'app.main:app', '--port', str(args.port),
+                               '--workers', str(args.workers)],
+                              cwd=app_dir, env=server_env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return stub, server
+
+
+async def get_text(url):
+    async with aiohttp.ClientSession() as session:
+        async with session.get(url) as response:
+            return await response.text()
+
+
+async def print_cycles(args):
+    stats = await get_text(f'http://127.0.0.1:{args.stub_port}/stats')
+    print(f'stub: {stats}')
+    metrics = await get_text(f'http://127.0.0.1:{args.port}/metrics')
+    for line in metrics.splitlines():
+        if line.startswith(('admission_cycles_total', 'admission_stage_duration_seconds')):
+            print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Drive /main_page at a fixed rate while fetch and recompute cycles '
+                                                 'run against the local SOAP stub, report latency and errors')
+    parser.add_argument('paths', nargs='*', default=['/main_page'])
+    parser.add_argument('--url', help='load an already running server instead of starting the stub and the app')
+    parser.add_argument('--rate', type=float, default=100, help='requests per second')
+    parser.add_argument('--duration', type=float, default=60, help='seconds')
+    parser.add_argument('--connections', type=int, default=100, help='requests in flight at most')
+    parser.add_argument('--timeout', type=float, default=30, help='seconds per request')
+    parser.add_argument('--revalidate', action='store_true', help='send If-None-Match like a polling dashboard')
+    parser.add_argument('--report-every', type=float, default=5, help='seconds between progress lines')
+    parser.add_argument('--port', type=int, default=8780)
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--cycle', type=int, default=20, help='seconds between fetches from the stub')
+    parser.add_argument('--stub-port', type=int, default=8790)
+    parser.add_argument('--synthetic', type=int, default=100000, help='applications in the first stub response')
+    parser.add_argument('--growth', type=int, default=1000, help='more applications in every next stub response')
+    parser.add_argument('--stub-latency', type=float, default=0.0)
+    parser.add_argument('--failure-rate', type=float, default=0.0)
+    parser.add_argument('--truncate-rate', type=float, default=0.0)
+    args = parser.parse_args()
+
+    if args.url:
+        generator = LoadGenerator(args.url, args.paths, args.rate, args.connections, args.timeout, args.revalidate)
+        report(generator.results, asyncio.run(generator.run(args.duration, args.report_every)))
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        stub, server = start_stack(tmp, args)
+        try:
+            print('Waiting for the first fetch and calculation...')
+            ready = wait_for(f'http://127.0.0.1:{args.port}/main_page', server, time.perf_counter(), 600)
+            print(f'First /main_page after {ready:.1f} s, loading for {args.duration:.0f} s '
+                  f'with a fetch every {args.cycle} s')
+            generator = LoadGenerator(f'http://127.0.0.1:{args.port}', args.paths, args.rate, args.connections,
+                                      args.timeout, args.revalidate)
+            report(generator.results, asyncio.run(generator.run(args.duration, args.report_every)))
+            asyncio.run(print_cycles(args))
+        finally:
+            for process in (server, stub):
+                process.terminate()
+                process.wait()
+
+
+if __name__ == '__main__':
+    main()
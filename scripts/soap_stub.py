@@ -0,0 +1,150 @@
+import argparse
+import asyncio
+import base64
+import json
+import os
+import random
+from xml.sax.saxutils import escape
+
+from aiohttp import web
+
+from scripts.synthetic import generate_dump, to_raw_applications
+
+ENVELOPE = '<?xml version="1.0" encoding="utf-8"?>' \
+           '<soap:Envelope xmlns:soap="http://www.w3.org/2003/05/soap-envelope"><soap:Body>' \
+           '<m:GetStudentsListResponse xmlns:m="http://www.DVFU_Univer.org"><m:return>{}</m:return>' \
+           '</m:GetStudentsListResponse></soap:Body></soap:Envelope>'
+FAULT = '<?xml version="1.0" encoding="utf-8"?>' \
+        '<soap:Envelope xmlns:soap="http://www.w3.org/2003/05/soap-envelope"><soap:Body><soap:Fault>' \
+        '<soap:Code><soap:Value>soap:Receiver</soap:Value></soap:Code>' \
+        '<soap:Reason><soap:Text xml:lang="ru">{}</soap:Text></soap:Reason>' \
+        '</soap:Fault></soap:Body></soap:Envelope>'
+CHUNK_SIZE = 1 << 16
+
+
+class SoapStub:
+    '''
+        Local stand-in for the 1C service: answers GetStudentsList with synthetic applications, so the fetcher
+        can be run and load-tested without touching production. Every request is the next cycle,
+        with `growth` more applications than the previous one. Latency, bandwidth, SOAP faults
+        and responses cut off midway are injected on request.
+    '''
+
+    def __init__(self, applications, growth=0, extra_fields=0, latency=0.0, jitter=0.0, bandwidth=None,
+                 failure_rate=0.0, truncate_rate=0.0, login=None, password=None, seed=0):
+        self.applications = applications
+        self.growth = growth
+        self.extra_fields = extra_fields
+        self.latency = latency
+        self.jitter = jitter
+        self.bandwidth = bandwidth
+        self.failure_rate = failure_rate
+        self.truncate_rate = truncate_rate
+        self.authorization = None if login is None else \
+            'Basic ' + base64.b64encode(f'{login}:{password or ""}'.encode('utf-8')).decode('ascii')
+        self.rnd = random.Random(seed)
+        self.seed = seed
+        self.cycle = 0
+        self.envelope = (None, None)
+        self.stats = {'requests': 0, 'served': 0, 'faults': 0, 'truncated': 0, 'unauthorized': 0, 'aborted': 0}
+
+    def get_envelope(self, cycle):
+        '''
+            Envelope of a cycle, the last one cached. Applicants depend only on the seed,
+            so a grown list starts with the same applications as the previous one.
+        '''
+        if self.envelope[0] != cycle:
+            applications = to_raw_applications(generate_dump(self.applications + cycle * self.growth, seed=self.seed))
+            for app_item in applications:
+                for i in range(self.extra_fields):
+                    app_item[f'Extra{i}'] = f'{app_item["Code"]}-{i}'
+            payload = escape(json.dumps(applications, ensure_ascii=False))
+            self.envelope = (cycle, ENVELOPE.format(payload).encode('utf-8'))
+        return self.envelope[1]
+
+    @staticmethod
+    def _fault(reason, status=500):
+        return web.Response(status=status, body=FAULT.format(escape(reason)).encode('utf-8'),
+                            content_type='application/soap+xml', charset='utf-8')
+
+    async def handle(self, request):
+        self.stats['requests'] += 1
+        if self.authorization is not None and request.headers.get('Authorization') != self.authorization:
+            self.stats['unauthorized'] += 1
+            return web.Response(status=401, headers={'WWW-Authenticate': 'Basic realm="1C"'})
+        if 'GetStudentsList' not in await request.text():
+            self.stats['faults'] += 1
+            return self._fault('Unknown operation')
+        cycle = self.cycle
+        self.cycle += 1
+        await asyncio.sleep(self.latency + self.rnd.uniform(0, self.jitter))
+        if self.rnd.random() < self.failure_rate:
+            self.stats['faults'] += 1
+            return self._fault('Injected failure')
+
+        envelope = await asyncio.to_thread(self.get_envelope, cycle)
+        truncated = self.rnd.random() < self.truncate_rate
+        response = web.StreamResponse(headers={'Content-Type': 'application/soap+xml; charset=utf-8'})
+        response.content_length = len(envelope)
+        end = len(envelope) // 2 if truncated else len(envelope)
+        try:
+            await response.prepare(request)
+            for start in range(0, end, CHUNK_SIZE):
+                chunk = envelope[start:min(start + CHUNK_SIZE, end)]
+                await response.write(chunk)
+                if self.bandwidth:
+                    await asyncio.sleep(len(chunk) / self.bandwidth)
+            if not truncated:
+                await response.write_eof()
+        except ConnectionResetError:
+            # The client gave up, e.g. the app was stopped in the middle of a fetch
+            self.stats['aborted'] += 1
+            return response
+        if truncated:
+            # The connection drops with half of the promised body sent
+            self.stats['truncated'] += 1
+            request.transport.close()
+            return response
+        self.stats['served'] += 1
+        print(f'Served cycle {cycle}: {len(envelope) / 2 ** 20:.1f} MB')
+        return response
+
+    async def get_stats(self, request):
+        return web.json_response({**self.stats, 'cycle': self.cycle})
+
+    def get_app(self):
+        app = web.Application(client_max_size=2 ** 20)
+        app.router.add_get('/stats', self.get_stats)
+        app.router.add_post('/{path:.*}', self.handle)
+        return app
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(description='Local stand-in for the GetStudentsList SOAP service')
+    parser.add_argument('--port', type=int, default=8090)
+    parser.add_argument('--applications', type=int, default=100000, help='applications in the first response')
+    parser.add_argument('--growth', type=int, default=1000, help='more applications in every next response')
+    parser.add_argument('--extra-fields', type=int, default=0,
+                        help='pad every application with this many unused fields, like the production payload')
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds before the response starts')
+    parser.add_argument('--jitter', type=float, default=0.0, help='up to this many seconds more latency')
+    parser.add_argument('--bandwidth', type=float, default=None, help='bytes per second of the response body')
+    parser.add_argument('--failure-rate', type=float, default=0.0, help='share of requests answered with a SOAP fault')
+    parser.add_argument('--truncate-rate', type=float, default=0.0,
+                        help='share of responses cut off in the middle of the body')
+    parser.add_argument('--seed', type=int, default=0)
+    return parser
+
+
+def main():
+    args = get_parser().parse_args()
+    login = os.environ.get('LOGIN')
+    stub = SoapStub(args.applications, args.growth, args.extra_fields, args.latency, args.jitter, args.bandwidth,
+                    args.failure_rate, args.truncate_rate, login, os.environ.get('PASSWORD'), args.seed)
+    print(f'Preparing the first response ({args.applications} applications)...')
+    stub.get_envelope(0)
+    web.run_app(stub.get_app(), host='127.0.0.1', port=args.port, print=print)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,140 @@
+import argparse
+import json
+import os
+import random
+from pathlib import Path
+from datetime import datetime, timedelta
+
+from app.calculations import MainPageCalculations
+from app.utils import get_download_timestamps
+
+REGIONS_PATH = (Path(os.path.abspath(__file__))).parent.parent / 'data/regions_map.json'
+
+
+def _region_spellings(regions_map):
+    spellings = []
+    for region in regions_map:
+        name = region[:1].upper() + region[1:]
+        if region.endswith('ская') or region.endswith('цкая'):
+            spellings += [f'{name} обл', f'{name} область', f'{name} обл.']
+        elif region.endswith('ский'):
+            spellings += [f'{name} край', f'{name} Край']
+        else:
+            spellings += [f'Респ {name}', f'{name} Республика', name, f'г {name}']
+    return spellings
+
+
+def _add_typo(rnd, text):
+    if len(text) < 2:
+        return text
+    position = rnd.randrange(len(text) - 1)
+    return text[:position] + text[position + 1] + text[position] + text[position + 2:]
+
+
+def generate_dump(applications, seed=0, programs=300, days=30, now=None, region_noise=0.0):
+    '''
+        Dump in the format written by StudentsDataFetcher with the given number of applications.
+        The program catalog depends only on `programs`, applicants on `seed`;
+        `region_noise` is the share of applicants whose Region has a typo.
+    '''
+    rnd = random.Random(seed)
+    now = now or datetime.utcnow().replace(microsecond=0)
+    with open(REGIONS_PATH, encoding='utf-8') as f:
+        regions = _region_spellings(json.load(f)) + ['', 'Казахстан', 'Приморский']
+
+    campaign_types = list(MainPageCalculations.CAMPAIGN_TYPES)
+    categories = list(MainPageCalculations.QUOTAS)
+    deliveries = list(MainPageCalculations.DOCUMENTDELIVERY)
+    financing = list(MainPageCalculations.FINANCING)
+    # The program catalog does not depend on seed, so dumps generated with different seeds stay compatible
+    catalog = random.Random(programs)
+    program_info = []
+    for i in range(programs):
+        campaign_type = catalog.choices(campaign_types, weights=[70, 20, 7, 3])[0]
+        program_info.append({
+            'TrainingDirection': f'{i // 10:02d}.{i % 10:02d}.0{catalog.randint(1, 5)} Программа {i}',
+            'AdmissionCampaignType': campaign_type,
+            'BudgetQuotaCount': catalog.randint(5, 120),
+            'TargetQuotaCount': catalog.randint(0, 15),
+            'SpecialQuotaCount': catalog.randint(0, 10),
+            'SeparateQuotaCount': catalog.randint(0, 10),
+        })
+
+    data = dict()
+    code = 100000
+    total = 0
+    while total < applications:
+        code += 1
+        human = f'{code:09d}'
+        region = rnd.choice(regions)
+        if region_noise and rnd.random() < region_noise:
+            region = _add_typo(rnd, region)
+        delivery = rnd.choices(deliveries, weights=[50, 35, 14, 1])[0]
+        original = rnd.random() < 0.3
+        no_exams = rnd.random() < 0.01
+        scores = [rnd.choice([0, rnd.randint(35, 100)]) for _ in range(4)]
+        first_seen = now - timedelta(seconds=rnd.randint(0, days * 24 * 3600))
+        count = min(rnd.randint(1, 5), applications - total)
+        human_item = dict()
+        for priority, program in enumerate(rnd.sample(program_info, count), start=1):
+            first_seen += timedelta(seconds=rnd.randint(0, 3600))
+            first_download = min(first_seen, now).strftime('%Y-%m-%d %H:%M:%S')
+            first_download_epoch, first_download_day = get_download_timestamps(first_download)
+            human_item[program['TrainingDirection']] = {
+                'Code': human,
+                **program,
+                'Category': rnd.choices(categories, weights=[85, 5, 5, 5])[0],
+                'DocumentDelivery': delivery,
+                'FinancingSource': rnd.choices(financing, weights=[30, 70])[0],
+                'Test1Score': scores[0],
+                'Test2Score': scores[1],
+                'Test3Score': scores[2],
+                'Test4Score': scores[3],
+                'ExamsCount': 4,
+                'SumScore': sum(scores),
+                'SelectedPriority': priority,
+                'AtestOrig': original and priority == 1,
+                'NoExams': no_exams,
+                'Region': region,
+                'firstDownloadDate': first_download,
+                'firstDownloadEpoch': first_download_epoch,
+                'firstDownloadDay': first_download_day,
+            }
+        data[human] = human_item
+        total += count
+
+    return {
+        'meta': {
+            'date': now.strftime('%Y-%m-%d %H:%M:%S'),
+        },
+        'data': data
+    }
+
+
+def to_raw_applications(dump):
+    '''
+        Applications as the SOAP service returns them, before StudentsDataFetcher adds the first download fields.
+    '''
+    return [{k: v for k, v in app_item.items() if not k.startswith('firstDownload')}
+            for human_item in dump['data'].values() for app_item in human_item.values()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate a synthetic dump of applications')
+    parser.add_argument('applications', type=int)
+    parser.add_argument('--output', default=str(MainPageCalculations.LATEST_DUMP_PATH))
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--programs', type=int, default=300)
+    parser.add_argument('--days', type=int, default=30, help='first downloads are spread over this many days')
+    parser.add_argument('--region-noise', type=float, default=0.0, help='share of applicants with a misspelled region')
+    parser.add_argument('--raw', action='store_true', help='write the raw application list the SOAP service returns')
+    args = parser.parse_args()
+
+    dump = generate_dump(args.applications, args.seed, args.programs, args.days, region_noise=args.region_noise)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(to_raw_applications(dump) if args.raw else dump, f, ensure_ascii=False)
+    print(f'{args.output}: {len(dump["data"])} applicants, {args.applications} applications')
+
+
+if __name__ == '__main__':
+    main()
@@ -1 +1 @@
-poetry run gunicorn -w 1 -b 0.0.0.0:8005 -k uvicorn.workers.UvicornWorker -t 1200 --threads 4 app.main:app
+poetry run gunicorn -w ${WORKERS:-1} -b 0.0.0.0:8005 -k uvicorn.workers.UvicornWorker -t 1200 --threads 4 app.main:app
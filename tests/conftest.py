@@ -0,0 +1,26 @@
+import os
+
+# app.utils builds the SOAP credentials at import time
+os.environ.setdefault('LOGIN', 'test')
+os.environ.setdefault('PASSWORD', 'test')
+os.environ.setdefault('URL', 'http://127.0.0.1:9/')
+
+import pytest  # noqa: E402
+
+from app.calculations import MainPageCalculations  # noqa: E402
+from app.metrics import registry  # noqa: E402
+
+
+@pytest.fixture
+def region_aliases(tmp_path, monkeypatch):
+    # Learned region aliases go to a temporary file instead of data/
+    monkeypatch.setattr(MainPageCalculations, 'REGION_ALIASES_PATH', tmp_path / 'regions_aliases.json')
+    return tmp_path / 'regions_aliases.json'
+
+
+@pytest.fixture(autouse=True)
+def metrics_dir(tmp_path, monkeypatch):
+    # Metrics of this process and of the calculation workers it spawns go to a temporary directory instead of data/
+    monkeypatch.setenv('METRICS_DIR', str(tmp_path / 'metrics'))
+    monkeypatch.setattr(registry, 'metrics_dir', tmp_path / 'metrics')
+    return tmp_path / 'metrics'
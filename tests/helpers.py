@@ -0,0 +1,20 @@
+async def request(app, path, query_string='', headers=()):
+    '''
+        GET request made to an ASGI app directly: status, headers and body of the response.
+    '''
+    scope = {'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET', 'scheme': 'http',
+             'path': path, 'raw_path': path.encode(), 'root_path': '', 'query_string': query_string.encode(),
+             'headers': [(name.encode(), value.encode()) for name, value in headers],
+             'client': ('127.0.0.1', 1), 'server': ('test', 80)}
+    messages = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        messages.append(message)
+
+    await app(scope, receive, send)
+    body = b''.join(message.get('body', b'') for message in messages[1:])
+    return messages[0]['status'], dict(messages[0]['headers']), body
+
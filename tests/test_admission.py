@@ -0,0 +1,63 @@
+from types import SimpleNamespace
+
+from app.admission import BUDGET, simulate_admission
+
+QUOTAS = {'Общий конкурс': 'General'}
+CAMPAIGN_TYPES = {'Бакалавриат': 'bachelor'}
+
+
+def application(code, program, priority, score, no_exams=False, seats=1):
+    return SimpleNamespace(Code=code, TrainingDirection=program, SelectedPriority=priority, SumScore=score,
+                           NoExams=no_exams, Category='Общий конкурс', FinancingSource=BUDGET,
+                           AdmissionCampaignType='Бакалавриат', GeneralCount=seats)
+
+
+def simulate(*app_items):
+    data = dict()
+    for app_item in app_items:
+        data.setdefault(app_item.Code, dict())[app_item.TrainingDirection] = app_item
+    return simulate_admission(data, QUOTAS, CAMPAIGN_TYPES)
+
+
+def get_passing_scores(*app_items):
+    return simulate(*app_items)['passing_scores']
+
+
+def test_applicants_cascade_down_their_priorities():
+    scores = get_passing_scores(
+        application('1', 'A', 1, 250),
+        application('2', 'A', 1, 240),
+        application('2', 'B', 2, 240),
+        application('3', 'B', 1, 200),
+    )
+    assert scores == {'A': {'General': 250}, 'B': {'General': 240}}
+
+
+def test_fractional_scores():
+    scores = get_passing_scores(
+        application('1', 'A', 1, 241.5, seats=2),
+        application('2', 'A', 1, 241.25, seats=2),
+        application('3', 'A', 1, 241, seats=2),
+    )
+    assert scores == {'A': {'General': 241.25}}
+
+
+def test_no_exams_go_first_and_leave_no_passing_score():
+    scores = get_passing_scores(
+        application('1', 'A', 1, 0, no_exams=True),
+        application('2', 'A', 1, 300),
+    )
+    assert scores == {'A': {'General': 0}}
+
+
+def test_placements_fall_through_to_the_next_priority_when_a_seat_is_taken():
+    placements = simulate(
+        application('1', 'A', 1, 250),
+        application('2', 'A', 1, 240),
+        application('2', 'B', 2, 240),
+        application('3', 'B', 1, 200),
+        application('3', 'C', 2, 200),
+        application('4', 'C', 1, 100),
+    )['placements']
+    # 2 loses A to 1 and takes B from 3, who takes C from 4
+    assert placements == {'bachelor': {'1': ('A', 'General'), '2': ('B', 'General'), '3': ('C', 'General')}}
@@ -0,0 +1,59 @@
+import random
+
+import pytest
+
+from app.aggregation import TopK
+
+
+def expected_kth(values, k):
+    ranked = sorted(values, reverse=True)
+    return ranked[k - 1] if 0 < k <= len(ranked) else min(values, default=None)
+
+
+@pytest.mark.parametrize('capacity', [1, 3, 10])
+def test_top_k_under_add_and_discard(capacity):
+    rnd = random.Random(capacity)
+    top, values = TopK(capacity), []
+    for _ in range(2000):
+        if values and rnd.random() < 0.4:
+            value = values.pop(rnd.randrange(len(values)))
+            top.discard(value)
+        else:
+            # Few distinct values, so ties are common
+            value = rnd.randint(0, 8)
+            values.append(value)
+            top.add(value)
+        assert top.count == len(values)
+        if top.stale:
+            # The owner rebuilds a stale group from the data
+            top = TopK(capacity)
+            for value in values:
+                top.add(value)
+        # k up to the capacity, larger than the group while it is small
+        for k in range(0, capacity + 1):
+            assert top.get_kth_highest(k) == expected_kth(values, k)
+
+
+def test_ties_at_the_boundary():
+    top = TopK(2)
+    for value in (5, 5, 5, 3):
+        top.add(value)
+    assert top.get_kth_highest(2) == 5
+    top.discard(5)
+    # One of the tied values in the heap may be the one discarded
+    assert top.stale
+
+
+def test_capacity_larger_than_the_group():
+    top = TopK(10)
+    for value in (7, 2, 9):
+        top.add(value)
+    assert top.get_kth_highest(10) == 2
+    assert top.get_kth_highest(2) == 7
+    top.discard(2)
+    # The whole group is in the heap, so removal stays exact
+    assert not top.stale
+    assert top.get_kth_highest(10) == 7
+    top.discard(7)
+    top.discard(9)
+    assert top.get_kth_highest(1) is None
@@ -0,0 +1,96 @@
+import asyncio
+import copy
+import json
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.calculations import MainPageCalculations
+from scripts.synthetic import generate_dump
+
+
+def get_page(calc, dump):
+    return asyncio.run(calc.get_main_page_data(dump=copy.deepcopy(dump)))
+
+
+def with_unknown_category(dump):
+    dump = copy.deepcopy(dump)
+    human_item = next(iter(dump['data'].values()))
+    next(iter(human_item.values()))['Category'] = 'Новая категория'
+    return dump
+
+
+@pytest.mark.parametrize('first_cycle_fails', [False, True])
+def test_failed_cycle_does_not_leave_half_built_engine(region_aliases, first_cycle_fails):
+    dump = generate_dump(2000, seed=1)
+    next_dump = generate_dump(2100, seed=1)
+    calc = MainPageCalculations()
+    if not first_cycle_fails:
+        get_page(calc, dump)
+
+    with pytest.raises(KeyError):
+        get_page(calc, with_unknown_category(next_dump))
+    assert calc.engine is None
+
+    assert get_page(calc, next_dump) == get_page(MainPageCalculations(), next_dump)
+
+
+def evolve(dump, cycle, now):
+    '''
+        The dump of the next cycle: some applicants withdraw, some applications change, new applicants come.
+    '''
+    grown = generate_dump(len(dump['data']) + 50, seed=2, now=now)
+    data = dict()
+    for i, (human, human_item) in enumerate(grown['data'].items()):
+        if i % 37 == cycle:
+            continue
+        human_item = copy.deepcopy(dump['data'].get(human, human_item))
+        if i % 23 == cycle:
+            for app_item in human_item.values():
+                app_item['AtestOrig'] = not app_item['AtestOrig']
+                app_item['SumScore'] += 1
+                app_item['Test1Score'] += 1
+        data[human] = human_item
+    return {'meta': grown['meta'], 'data': data}
+
+
+def test_incremental_page_equals_rebuild(region_aliases):
+    now = datetime(2023, 7, 1, 10)
+    dumps = [generate_dump(2000, seed=2, now=now)]
+    for cycle in range(1, 6):
+        dumps.append(evolve(dumps[-1], cycle, now + timedelta(hours=cycle)))
+    calc = MainPageCalculations()
+    for dump in dumps:
+        page = get_page(calc, dump)
+    assert calc.incremental_runs == len(dumps) - 1
+    assert page == get_page(MainPageCalculations(), dumps[-1])
+
+
+def test_region_that_comes_back_keeps_its_place(region_aliases):
+    now = datetime(2023, 7, 1, 10)
+    dump = generate_dump(2000, seed=5, now=now)
+    region = next(iter(next(iter(dump['data'].values())).values()))['Region']
+    # Applicants of the first region leave and come back, their count is removed and added again
+    without_region = copy.deepcopy(dump)
+    without_region['data'] = {human: human_item for human, human_item in dump['data'].items()
+                              if all(app_item['Region'] != region for app_item in human_item.values())}
+    dumps = [dump, without_region, copy.deepcopy(dump)]
+    for i, next_dump in enumerate(dumps):
+        next_dump['meta']['date'] = (now + timedelta(hours=i)).strftime('%Y-%m-%d %H:%M:%S')
+
+    calc = MainPageCalculations()
+    for next_dump in dumps:
+        page = get_page(calc, next_dump)
+    assert calc.incremental_runs == 2
+    assert page['applications_by_region'] == get_page(MainPageCalculations(), dumps[-1])['applications_by_region']
+
+
+def test_learned_region_aliases_replace_the_file_whole(region_aliases):
+    dump = generate_dump(500, seed=7, region_noise=0.2)
+    calc, other = MainPageCalculations(), MainPageCalculations()
+    get_page(calc, dump)
+    get_page(other, dump)
+    assert calc.region_matcher is not other.region_matcher
+    with open(region_aliases, encoding='utf-8') as f:
+        assert json.load(f)
+    assert [path.name for path in region_aliases.parent.iterdir()] == [region_aliases.name]
@@ -0,0 +1,87 @@
+import asyncio
+import json
+
+import pytest
+
+from app import main as server
+from app.drilldown import DrilldownIndexes, DumpIndex
+from scripts.synthetic import generate_dump
+from tests.helpers import request
+
+PROGRAM = '01.03.02 Прикладная математика'
+
+
+def application(code, score, no_exams=False, priority=1, program=PROGRAM):
+    return {'Code': code, 'TrainingDirection': program, 'SelectedPriority': priority, 'SumScore': score,
+            'NoExams': no_exams, 'AdmissionCampaignType': 'Прием на обучение на бакалавриат/специалитет',
+            'Category': 'На общих основаниях', 'FinancingSource': 'Бюджетная основа', 'AtestOrig': False,
+            'DocumentDelivery': 'Лично', 'firstDownloadDate': '2023-07-01 10:00:00'}
+
+
+def get_index(*app_items):
+    data = dict()
+    for app_item in app_items:
+        data.setdefault(app_item['Code'], dict())[app_item['TrainingDirection']] = app_item
+    return DumpIndex({'meta': {'date': '2023-07-01 10:00:00'}, 'data': data})
+
+
+def test_lists_are_ranked_no_exams_first_then_by_score_then_by_code():
+    index = get_index(application('3', 250), application('1', 240), application('2', 250),
+                      application('4', 0, no_exams=True))
+    items = index.get_program(PROGRAM, 'BudgetQuota', 0, 10)['items']
+    assert [(item['rank'], item['Code']) for item in items] == [(1, '4'), (2, '2'), (3, '3'), (4, '1')]
+
+
+def test_generated_lists_are_ranked_and_applicants_point_into_them():
+    index = DumpIndex(generate_dump(2000, seed=9))
+    for program, lists in index.programs.items():
+        for items in lists.values():
+            keys = [(not item['NoExams'], -item['SumScore'], item['Code']) for item in items]
+            assert keys == sorted(keys)
+            assert [item['rank'] for item in items] == list(range(1, len(items) + 1))
+    for code, applications in index.applicants.items():
+        assert [item['SelectedPriority'] for item in applications] == \
+               sorted(item['SelectedPriority'] for item in applications)
+        for item in applications:
+            ranked = index.programs[item['TrainingDirection']][item['list']][item['rank'] - 1]
+            assert ranked['Code'] == code
+
+
+@pytest.mark.parametrize('offset, limit, codes', [
+    (0, 2, ['1', '2']),
+    (1, 2, ['2', '3']),
+    (2, 50, ['3']),
+    (3, 50, []),
+    (100, 50, []),
+])
+def test_pagination(offset, limit, codes):
+    index = get_index(application('1', 300), application('2', 200), application('3', 100))
+    page = index.get_program(PROGRAM, 'BudgetQuota', offset, limit)
+    assert (page['total'], page['offset'], page['limit']) == (3, offset, limit)
+    assert [item['Code'] for item in page['items']] == codes
+
+
+@pytest.fixture
+def drilldown(tmp_path, monkeypatch):
+    path = tmp_path / 'latest.json'
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({'meta': {'date': '2023-07-01 10:00:00'},
+                   'data': {'1': {PROGRAM: application('1', 300)}, '2': {PROGRAM: application('2', 200)}}}, f)
+    monkeypatch.setattr(server, 'drilldown_indexes', DrilldownIndexes(path))
+
+
+@pytest.mark.parametrize('path, query_string, status', [
+    (f'/programs/{PROGRAM}', 'limit=1&offset=1', 200),
+    ('/programs/99.99.99 Нет такой', '', 404),
+    (f'/programs/{PROGRAM}', 'list=Unknown', 422),
+    (f'/programs/{PROGRAM}', 'limit=0', 422),
+    ('/applicants/2', '', 200),
+    ('/applicants/404', '', 404),
+])
+def test_endpoints(drilldown, path, query_string, status):
+    response_status, _, body = asyncio.run(request(server.app, path, query_string))
+    assert response_status == status
+    if path.startswith('/programs/') and status == 200:
+        assert [item['Code'] for item in json.loads(body)['items']] == ['2']
+    if path.startswith('/applicants/') and status == 200:
+        assert json.loads(body)['items'][0]['rank'] == 2
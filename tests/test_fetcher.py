@@ -0,0 +1,40 @@
+import asyncio
+from xml.parsers import expat
+
+import pytest
+
+from app.utils import StudentsDataFetcher
+
+ENVELOPE = '<?xml version="1.0" encoding="utf-8"?>' \
+           '<soap:Envelope xmlns:soap="http://www.w3.org/2003/05/soap-envelope"><soap:Body>' \
+           '<m:GetStudentsListResponse xmlns:m="http://www.DVFU_Univer.org"><m:return>[]</m:return>' \
+           '</m:GetStudentsListResponse></soap:Body></soap:Envelope>'
+
+
+@pytest.fixture
+def fetcher(tmp_path, monkeypatch):
+    monkeypatch.setattr(StudentsDataFetcher, 'RESPONSE_PATH', tmp_path / 'response.xml')
+    monkeypatch.setattr(StudentsDataFetcher, 'RAW_JSON_PATH', tmp_path / 'raw.json')
+    return StudentsDataFetcher()
+
+
+def respond_with(fetcher, body):
+    async def fetch_to_file(path):
+        path.write_bytes(body.encode('utf-8'))
+        return True
+
+    fetcher._fetch_students_data_to_file = fetch_to_file
+
+
+def test_truncated_response_is_removed(fetcher):
+    respond_with(fetcher, ENVELOPE[:len(ENVELOPE) // 2])
+    with pytest.raises(expat.ExpatError):
+        asyncio.run(fetcher._fetch_and_format_streaming())
+    assert not fetcher.RESPONSE_PATH.exists()
+
+
+def test_response_without_students_list_is_removed(fetcher):
+    respond_with(fetcher, '<?xml version="1.0" encoding="utf-8"?><soap:Envelope '
+                          'xmlns:soap="http://www.w3.org/2003/05/soap-envelope"/>')
+    assert asyncio.run(fetcher._fetch_and_format_streaming()) is None
+    assert not fetcher.RESPONSE_PATH.exists()
@@ -0,0 +1,32 @@
+import asyncio
+from datetime import datetime
+
+from app.historical import HistoricalPages
+from app.history import DumpHistory
+from scripts.synthetic import generate_dump
+
+
+class CountingPool:
+
+    def __init__(self):
+        self.calls = []
+
+    async def get_historical_page(self, dumps_dir, number):
+        self.calls.append(number)
+        await asyncio.sleep(0.05)
+        return object()
+
+
+def test_concurrent_requests_share_one_calculation(tmp_path):
+    DumpHistory(tmp_path).append(1, generate_dump(100, now=datetime(2023, 7, 1, 10)))
+    pool = CountingPool()
+    pages = HistoricalPages(tmp_path, pool=pool)
+
+    async def run():
+        first = await asyncio.gather(*(pages.get(at) for at in ('1', '1', '2023-07-01')))
+        return first, await pages.get('1')
+
+    snapshots, cached = asyncio.run(run())
+    assert pool.calls == [1]
+    assert all(snapshot is cached for snapshot in snapshots)
+    assert pages.calculations == dict()
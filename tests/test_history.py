@@ -0,0 +1,43 @@
+from datetime import datetime, timedelta
+
+from app.history import DumpDigests, DumpHistory
+from scripts.synthetic import generate_dump
+
+
+def get_dumps(count):
+    now = datetime(2023, 7, 1, 10)
+    return [generate_dump(1000 + 50 * i, seed=6, now=now + timedelta(hours=i)) for i in range(count)]
+
+
+def test_delta_is_taken_against_the_digests_in_memory(tmp_path, monkeypatch):
+    dumps = get_dumps(3)
+    history = DumpHistory(tmp_path)
+    history.append(1, dumps[0])
+
+    def load(number):
+        raise AssertionError(f'dump {number} loaded back from the history')
+
+    with monkeypatch.context() as patch:
+        patch.setattr(history, 'load', load)
+        for number, (prev_dump, dump) in enumerate(zip(dumps, dumps[1:]), start=2):
+            history.append(number, dump, DumpDigests(prev_dump))
+
+    assert [entry['kind'] for entry in history.get_index()] == ['checkpoint', 'delta', 'delta']
+    for number, dump in enumerate(dumps, start=1):
+        assert history.load(number) == dump
+
+
+def test_index_is_written_without_leftover_files(tmp_path):
+    history = DumpHistory(tmp_path)
+    for number, dump in enumerate(get_dumps(2), start=1):
+        history.append(number, dump)
+    assert sorted(path.name for path in tmp_path.iterdir()) == ['1.hist', 'index.json']
+
+
+def test_digests_of_a_loaded_dump_match_the_original(tmp_path):
+    dumps = get_dumps(2)
+    history = DumpHistory(tmp_path)
+    history.append(1, dumps[0])
+    history.append(2, dumps[1])
+    for number, dump in enumerate(dumps, start=1):
+        assert DumpDigests(history.load(number)).data == DumpDigests(dump).data
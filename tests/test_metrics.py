@@ -0,0 +1,18 @@
+import os
+import json
+
+from app.metrics import Registry
+
+
+def test_render_drops_files_of_earlier_processes_with_a_live_pid(tmp_path):
+    registry = Registry(tmp_path)
+    counter = registry.counter('test_cycles_total', 'Cycles')
+    counter.inc()
+    # Left by processes of a previous container whose pid is taken by a live process now
+    stale = {counter.name: {**counter.state(), 'samples': [[[], 41]]}}
+    for name in (f'{os.getppid()}.json', f'{os.getppid()}-1.json'):
+        with open(tmp_path / name, 'w', encoding='utf-8') as f:
+            json.dump(stale, f)
+
+    assert f'{counter.name} 1\n' in registry.render()
+    assert [path.name for path in tmp_path.glob('*.json')] == [registry._get_path().name]
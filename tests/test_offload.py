@@ -0,0 +1,77 @@
+import json
+import asyncio
+import time
+
+from app import main as server
+from app.calculations import MainPageCalculations
+from app.offload import CalculationPool
+from app.snapshot import SharedSnapshot, Snapshot
+from app.utils import StudentsDataFetcher
+from scripts.synthetic import generate_dump
+
+# A request waiting out a blocked event loop would take about as long as the whole recompute
+MAX_LATENCY = 0.25
+
+
+async def get_status(path):
+    '''
+        Status of a GET request made to the app directly over ASGI.
+    '''
+    scope = {'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET', 'scheme': 'http',
+             'path': path, 'raw_path': path.encode(), 'root_path': '', 'query_string': b'', 'headers': [],
+             'client': ('127.0.0.1', 1), 'server': ('test', 80)}
+    messages = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        messages.append(message)
+
+    await server.app(scope, receive, send)
+    return messages[0]['status']
+
+
+async def measure(recompute):
+    '''
+        Latencies of /main_page requests made every 10 ms while recompute runs, counted from the moment
+        a request was due, so time spent waiting for a blocked event loop is included.
+    '''
+    task = asyncio.create_task(recompute)
+    latencies = []
+    while not task.done():
+        due = time.perf_counter() + 0.01
+        await asyncio.sleep(0.01)
+        assert await get_status('/main_page') == 200
+        latencies.append(time.perf_counter() - due)
+    await task
+    return latencies
+
+
+def test_main_page_is_served_during_a_recompute(tmp_path, monkeypatch, region_aliases, metrics_dir):
+    latest_dump_path = tmp_path / 'latest.json'
+    with open(latest_dump_path, 'w', encoding='utf-8') as f:
+        json.dump(generate_dump(50000), f, ensure_ascii=False)
+    monkeypatch.setattr(StudentsDataFetcher, 'LATEST_DUMP_PATH', latest_dump_path)
+    monkeypatch.setattr(server, 'shared_snapshot', SharedSnapshot(tmp_path / 'snapshot.bin'))
+    calc = MainPageCalculations()
+    calc.LATEST_DUMP_PATH = latest_dump_path
+    server.shared_snapshot.publish(Snapshot(asyncio.run(calc.get_main_page_data()), calc.dump['meta']['date']))
+
+    pool = CalculationPool(1)
+    try:
+        async def run():
+            # The worker process is started up front, its spawn time is not part of a recompute
+            await asyncio.get_running_loop().run_in_executor(pool._get_executor(), int)
+            started = time.perf_counter()
+            latencies = await measure(pool.get_main_page(latest_dump_path))
+            return latencies, time.perf_counter() - started
+
+        latencies, elapsed = asyncio.run(run())
+    finally:
+        pool.shutdown()
+    assert elapsed > 2 * MAX_LATENCY
+    assert len(latencies) > 10
+    assert max(latencies) < MAX_LATENCY
+    # The worker flushed its metrics to the directory it inherited rather than to data/
+    assert list(metrics_dir.glob('*.json'))
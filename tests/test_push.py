@@ -0,0 +1,111 @@
+import asyncio
+import copy
+import json
+import tracemalloc
+
+from app.calculations import MainPageCalculations
+from app.push import MainPageUpdates, apply_patch
+from app.snapshot import Snapshot
+from scripts.synthetic import generate_dump
+
+IDLE_SUBSCRIBERS = 5000
+# An item put in an idle subscriber's queue, the event bytes themselves are shared
+MAX_QUEUED_BYTES = 256
+
+
+def parse(event):
+    fields = dict(line.split(b': ', 1) for line in event.rstrip(b'\n').split(b'\n'))
+    return fields[b'event'].decode(), fields[b'id'].decode(), json.loads(fields[b'data'])
+
+
+def get_snapshot(i):
+    return Snapshot({'last_update': f'2023-07-01 10:{i:02}:00', 'applicants_total': 1000 + i})
+
+
+def test_new_subscriber_gets_the_snapshot():
+    async def run():
+        updates = MainPageUpdates(None)
+        snapshot = get_snapshot(0)
+        await updates.update(snapshot)
+        events = updates.subscribe()
+        try:
+            return parse(await anext(events)), snapshot
+        finally:
+            await events.aclose()
+
+    (event, event_id, data), snapshot = asyncio.run(run())
+    assert (event, event_id, data) == ('snapshot', snapshot.digest, snapshot.data)
+
+
+def test_patch_turns_the_previous_page_into_the_recomputed_one(region_aliases):
+    calc = MainPageCalculations()
+    pages = [asyncio.run(calc.get_main_page_data(dump=generate_dump(2000 + 200 * i, seed=3))) for i in range(2)]
+
+    async def run():
+        updates = MainPageUpdates(None)
+        await updates.update(Snapshot(copy.deepcopy(pages[0])))
+        events = updates.subscribe()
+        try:
+            snapshot = parse(await anext(events))
+            await updates.update(Snapshot(copy.deepcopy(pages[1])))
+            return snapshot, parse(await anext(events))
+        finally:
+            await events.aclose()
+
+    (_, _, old), (event, event_id, patch) = asyncio.run(run())
+    assert event == 'patch'
+    assert event_id == Snapshot(pages[1]).digest
+    # Changed values are patched in place rather than the whole page replaced
+    assert patch and all(op['path'] for op in patch)
+    assert apply_patch(old, patch) == json.loads(json.dumps(pages[1]))
+
+
+def test_subscriber_falling_behind_is_resynced_with_a_snapshot():
+    async def run():
+        updates = MainPageUpdates(None)
+        await updates.update(get_snapshot(0))
+        events = updates.subscribe()
+        try:
+            await anext(events)
+            for i in range(1, MainPageUpdates.QUEUE_SIZE + 2):
+                await updates.update(get_snapshot(i))
+            return parse(await anext(events)), updates.snapshot
+        finally:
+            await events.aclose()
+
+    (event, event_id, data), latest = asyncio.run(run())
+    assert (event, event_id, data) == ('snapshot', latest.digest, latest.data)
+
+
+def test_idle_subscribers_share_one_encoded_event():
+    def get_large_snapshot(i):
+        # A patch far larger than what queueing it may take per subscriber
+        return Snapshot({**get_snapshot(i).data, 'regions': [f'{i}-{j}' for j in range(1000)]})
+
+    async def run():
+        updates = MainPageUpdates(None)
+        await updates.update(get_large_snapshot(0))
+        subscribers = [updates.subscribe() for _ in range(IDLE_SUBSCRIBERS)]
+        try:
+            snapshots = [await anext(events) for events in subscribers]
+            tracemalloc.start()
+            try:
+                await updates.update(get_large_snapshot(1))
+                fanned_out = tracemalloc.get_traced_memory()[0]
+            finally:
+                tracemalloc.stop()
+            queued = [queue.qsize() for queue in updates.subscribers]
+            patches = [await anext(events) for events in subscribers]
+            return snapshots, patches, queued, fanned_out
+        finally:
+            for events in subscribers:
+                await events.aclose()
+
+    snapshots, patches, queued, fanned_out = asyncio.run(run())
+    assert all(event is snapshots[0] for event in snapshots)
+    assert all(event is patches[0] for event in patches)
+    assert parse(patches[0])[0] == 'patch'
+    assert len(patches[0]) > 10 * MAX_QUEUED_BYTES
+    # A recompute queues one shared item per subscriber, not a copy of the event
+    assert queued == [1] * IDLE_SUBSCRIBERS
+    assert fanned_out < len(patches[0]) + IDLE_SUBSCRIBERS * MAX_QUEUED_BYTES
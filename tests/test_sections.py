@@ -0,0 +1,67 @@
+import asyncio
+import json
+
+import pytest
+
+from app import main as server
+from app.calculations import MainPageCalculations
+from app.leader import LeaderLock
+from app.offload import CalculationPool
+from app.sections import MainPageSections
+from app.snapshot import SharedSnapshot
+from app.utils import StudentsDataFetcher
+from scripts.synthetic import generate_dump
+from tests.helpers import request
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch, region_aliases):
+    latest_dump_path = tmp_path / 'latest.json'
+    with open(latest_dump_path, 'w', encoding='utf-8') as f:
+        json.dump(generate_dump(2000, seed=10), f, ensure_ascii=False)
+    monkeypatch.setattr(StudentsDataFetcher, 'LATEST_DUMP_PATH', latest_dump_path)
+    monkeypatch.setattr(MainPageCalculations, 'LATEST_DUMP_PATH', latest_dump_path)
+    shared_snapshot = SharedSnapshot(tmp_path / 'snapshot.bin')
+    # Calculated in threads, so the paths set here apply to the calculations too
+    pool = CalculationPool(0)
+    monkeypatch.setattr(server, 'leader', LeaderLock(tmp_path / 'leader.lock'))
+    monkeypatch.setattr(server, 'shared_snapshot', shared_snapshot)
+    monkeypatch.setattr(server, 'calculation_pool', pool)
+    monkeypatch.setattr(server, 'main_page_sections', MainPageSections(shared_snapshot, pool=pool))
+    return server.app
+
+
+def get(app, path, query_string=''):
+    status, _, body = asyncio.run(request(app, path, query_string))
+    return status, json.loads(body)
+
+
+def test_sections_equal_the_slices_of_the_main_page(app):
+    # Calculated on their own before the main page is, then sliced from it
+    sections = {name: get(app, f'/main_page/{name}') for name in MainPageSections.NAMES}
+    status, page = get(app, '/main_page')
+    assert status == 200
+    assert list(page) == list(MainPageSections.NAMES)
+    assert sections == {name: (200, page[name]) for name in MainPageSections.NAMES}
+
+    status, selection = get(app, '/main_page', 'fields=applications_by_region, small_charts,small_charts')
+    assert status == 200
+    # In page order, whatever the order asked for
+    assert list(selection.items()) == [(name, page[name]) for name in ('small_charts', 'applications_by_region')]
+
+
+def test_sections_computed_before_the_main_page_equal_it(app):
+    status, selection = get(app, '/main_page', 'fields=applications_by_programs,applicants')
+    assert status == 200
+    _, page = get(app, '/main_page')
+    assert selection == {name: page[name] for name in ('applications_by_programs', 'applicants')}
+
+
+@pytest.mark.parametrize('path, query_string, status', [
+    ('/main_page/unknown', '', 404),
+    ('/main_page', 'fields=unknown', 422),
+    ('/main_page', 'fields=small_charts,unknown', 422),
+    ('/main_page', 'fields=,', 422),
+])
+def test_unknown_names(app, path, query_string, status):
+    assert get(app, path, query_string)[0] == status
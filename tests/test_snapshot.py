@@ -0,0 +1,67 @@
+import gzip
+
+import pytest
+from starlette.requests import Request
+
+from app.snapshot import SharedSnapshot, Snapshot, brotli
+
+PAGE = {'last_update': '2023-07-01 10:00:00', 'applicants': {'total': 1000, 'region': 'Приморский край'}}
+
+
+def get_response(snapshot, **headers):
+    scope = {'type': 'http', 'method': 'GET', 'path': '/main_page', 'query_string': b'',
+             'headers': [(name.replace('_', '-').encode(), value.encode()) for name, value in headers.items()]}
+    return snapshot.to_response(Request(scope))
+
+
+def test_every_encoding_has_its_own_etag():
+    snapshot = Snapshot(PAGE)
+    etags = {get_response(snapshot, accept_encoding=encoding).headers['etag'] for encoding in ('identity', 'gzip')}
+    assert etags == {f'"{snapshot.digest}"', f'"{snapshot.digest}-gzip"'}
+    assert Snapshot(dict(PAGE, last_update='2023-07-01 11:00:00')).digest != snapshot.digest
+
+
+@pytest.mark.parametrize('accept_encoding, expected', [
+    ('', 'identity'),
+    ('identity', 'identity'),
+    ('gzip', 'gzip'),
+    ('gzip;q=0.5, deflate', 'gzip'),
+    ('br;q=0, gzip', 'gzip'),
+    ('*;q=0', 'identity'),
+    ('br, gzip', 'br' if brotli is not None else 'gzip'),
+    ('*', 'br' if brotli is not None else 'gzip'),
+])
+def test_content_encoding_negotiation(accept_encoding, expected):
+    snapshot = Snapshot(PAGE)
+    response = get_response(snapshot, accept_encoding=accept_encoding)
+    assert response.status_code == 200
+    assert response.headers.get('content-encoding', 'identity') == expected
+    assert response.headers['vary'] == 'Accept-Encoding'
+    decompress = {'identity': bytes, 'gzip': gzip.decompress, 'br': brotli and brotli.decompress}[expected]
+    assert decompress(response.body) == snapshot.encodings['identity']
+
+
+@pytest.mark.parametrize('if_none_match, status', [
+    ('"{digest}"', 304),
+    ('"{digest}-gzip"', 304),
+    ('W/"{digest}"', 304),
+    ('"other", "{digest}"', 304),
+    ('*', 304),
+    ('"other"', 200),
+])
+def test_if_none_match(if_none_match, status):
+    snapshot = Snapshot(PAGE)
+    if_none_match = if_none_match.format(digest=snapshot.digest)
+    response = get_response(snapshot, accept_encoding='gzip', if_none_match=if_none_match)
+    assert response.status_code == status
+    assert response.headers['etag'] == f'"{snapshot.digest}-gzip"'
+    if status == 304:
+        assert response.body == b''
+
+
+def test_shared_snapshot_is_read_back_by_another_worker(tmp_path):
+    snapshot = Snapshot(PAGE, version='2023-07-01 10:00:00')
+    SharedSnapshot(tmp_path / 'snapshot.bin').publish(snapshot)
+    shared = SharedSnapshot(tmp_path / 'snapshot.bin').get()
+    assert (shared.digest, shared.version, shared.data) == (snapshot.digest, snapshot.version, PAGE)
+    assert {encoding: bytes(body) for encoding, body in shared.encodings.items()} == snapshot.encodings
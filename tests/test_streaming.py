@@ -0,0 +1,30 @@
+import json
+
+import pytest
+
+from app.streaming import iter_json_array
+
+ARRAYS = [
+    '[0,12345]',
+    '[12345, 6789, -1.5e10, 0.25]',
+    '[true,false,null,"12345",12345]',
+    '[{"Code": 12345}, [1, 2], 3]',
+    ' [ 1 , 2 ] ',
+    '[]',
+]
+
+
+@pytest.mark.parametrize('text', ARRAYS)
+@pytest.mark.parametrize('chunk_size', [1, 2, 3, 5, 7, 64])
+def test_items_split_across_chunks(tmp_path, text, chunk_size):
+    path = tmp_path / 'array.json'
+    path.write_text(text, encoding='utf-8')
+    assert list(iter_json_array(path, chunk_size=chunk_size)) == json.loads(text)
+
+
+@pytest.mark.parametrize('text', ['[1, 2', '[12345', '{"Code": 1}'])
+def test_not_an_array_or_truncated(tmp_path, text):
+    path = tmp_path / 'array.json'
+    path.write_text(text, encoding='utf-8')
+    with pytest.raises(ValueError):
+        list(iter_json_array(path, chunk_size=3))
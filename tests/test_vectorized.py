@@ -0,0 +1,24 @@
+import asyncio
+import copy
+
+import pytest
+
+from app.calculations import MainPageCalculations
+from scripts.synthetic import generate_dump
+
+pytest.importorskip('numpy')
+
+
+def get_page(vectorized, dump):
+    calc = MainPageCalculations()
+    calc.VECTORIZED = vectorized
+    page = asyncio.run(calc.get_main_page_data(dump=copy.deepcopy(dump)))
+    # The NumPy backend keeps no incremental engine
+    assert (calc.engine is None) == vectorized
+    return page
+
+
+@pytest.mark.parametrize('seed', [0, 8])
+def test_numpy_backend_gives_the_same_page(region_aliases, seed):
+    dump = generate_dump(3000, seed=seed, region_noise=0.1)
+    assert get_page(True, dump) == get_page(False, dump)